@@ -0,0 +1,263 @@
+# Análisis de ventas para reabastecer: productos más vendidos, ingresos por día y
+# por semana, ventas por vendedor y rotación del stock.
+# Las ventas se cargan columna a columna en arrays de NumPy (una instantánea en
+# memoria y otra en disco, en .analitica/) y cada reporte es una pasada
+# vectorizada sobre ellas. La instantánea se pone al día leyendo solo las ventas
+# con id mayor que la última cargada; si faltan ventas ya cargadas (se borraron o
+# se perdieron) o cambió la versión del esquema, se vuelve a leer entera. Las
+# ventas archivadas se leen de sus archivos: archivar no obliga a recargar.
+# Sin NumPy el módulo no está disponible (DISPONIBLE = False).
+import hashlib
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from archivado import segmentos_ventas
+from inventario import MONEDAS, get_tipo_cambio
+from migraciones import version_esquema
+
+DISPONIBLE = np is not None
+CARPETA = os.environ.get("INVENTARIO_ANALITICA", ".analitica")
+LOTE = 100_000
+# La copia en disco se reescribe cuando hay al menos estas ventas nuevas
+GUARDAR_CADA = 5000
+DIA = 86400
+# Ids ya cargados que se comprueban en la base en cada puesta al día
+MUESTRA = 64
+
+# Columna -> tipo. moneda: índice en MONEDAS (-1 desconocida); segundo: fecha en
+# segundos desde 1970 (-1 si la fecha no se entiende)
+COLUMNAS = {
+    "id": "int64",
+    "producto_id": "int32",
+    "usuario_id": "int32",
+    "cantidad": "int32",
+    "total_centavos": "int64",
+    "moneda": "int8",
+    "segundo": "int64",
+}
+
+_bloqueo = threading.Lock()
+_instantaneas = {}
+
+# --- Instantánea columnar ---
+def _ruta_base(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+def _archivo(ruta):
+    nombre = hashlib.sha1(os.path.abspath(ruta).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CARPETA, f"ventas-{nombre}.npz")
+
+def _vacias():
+    return {c: np.zeros(0, dtype=t) for c, t in COLUMNAS.items()}
+
+def _leer_disco(ruta, version):
+    try:
+        with np.load(_archivo(ruta)) as datos:
+            if int(datos["version"]) != version:
+                return None
+            return {c: datos[c] for c in COLUMNAS}
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _guardar_disco(ruta, version, columnas):
+    try:
+        os.makedirs(CARPETA, exist_ok=True)
+        archivo = _archivo(ruta)
+        temporal = f"{archivo}.{threading.get_ident()}.tmp.npz"
+        np.savez(temporal, version=version, **columnas)
+        os.replace(temporal, archivo)
+    except OSError:
+        pass
+
+def _leer_ventas(conn, despues_de):
+    esquemas = segmentos_ventas(conn)
+    cursor = conn.execute(" UNION ALL ".join(f"""
+        SELECT id, COALESCE(producto_id, 0), COALESCE(usuario_id, 0), COALESCE(cantidad, 0),
+               COALESCE(total_centavos, 0),
+               CASE moneda {" ".join(f"WHEN '{m}' THEN {i}" for i, m in enumerate(MONEDAS))} ELSE -1 END,
+               COALESCE(CAST(strftime('%s', fecha) AS INTEGER), -1)
+        FROM {esquema}.ventas WHERE id > ?""" for esquema in esquemas) + " ORDER BY 1", (despues_de,) * len(esquemas))
+    partes = []
+    while True:
+        filas = cursor.fetchmany(LOTE)
+        if not filas:
+            break
+        bloque = np.array(filas, dtype=np.int64)
+        partes.append({c: bloque[:, i].astype(t) for i, (c, t) in enumerate(COLUMNAS.items())})
+    return partes
+
+def _sigue_igual(conn, ids):
+    # Comprueba una muestra de ids ya cargados (el primero, el último y MUESTRA
+    # repartidos): contar todas las filas costaría más que el propio reporte.
+    # Las ventas solo se agregan; las archivadas se siguen contando en su archivo.
+    if not len(ids):
+        return True
+    muestra = sorted({int(i) for i in ids[np.linspace(0, len(ids) - 1, MUESTRA).astype(np.int64)]})
+    marcas = ",".join("?" * len(muestra))
+    encontradas = anteriores = 0
+    for esquema in segmentos_ventas(conn):
+        encontradas += conn.execute(f"SELECT COUNT(*) FROM {esquema}.ventas WHERE id IN ({marcas})", muestra).fetchone()[0]
+        anteriores += conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {esquema}.ventas WHERE id < ? LIMIT 1)",
+                                   (muestra[0],)).fetchone()[0]
+    return encontradas == len(muestra) and not anteriores
+
+def instantanea(conn):
+    # Columnas de ventas al día con la base. Los arrays no se deben modificar.
+    if not DISPONIBLE:
+        raise RuntimeError("El análisis de ventas necesita NumPy")
+    ruta = _ruta_base(conn)
+    version = version_esquema(conn)
+    with _bloqueo:
+        inst = _instantaneas.get(ruta)
+        if inst is None or inst["version"] != version:
+            columnas = (_leer_disco(ruta, version) if ruta else None) or _vacias()
+            inst = _instantaneas[ruta] = {"version": version, "columnas": columnas, "guardadas": len(columnas["id"])}
+        columnas = inst["columnas"]
+        ultimo = int(columnas["id"][-1]) if len(columnas["id"]) else 0
+        if not _sigue_igual(conn, columnas["id"]):
+            columnas, ultimo = _vacias(), 0
+        nuevas = _leer_ventas(conn, ultimo)
+        if nuevas:
+            columnas = {c: np.concatenate([columnas[c]] + [p[c] for p in nuevas]) for c in COLUMNAS}
+        inst["columnas"] = columnas
+        total = len(columnas["id"])
+        if ruta and (total - inst["guardadas"] >= GUARDAR_CADA or total < inst["guardadas"]):
+            _guardar_disco(ruta, version, columnas)
+            inst["guardadas"] = total
+        return columnas
+
+def olvidar(conn=None):
+    # Descarta la instantánea en memoria (de una base o de todas)
+    with _bloqueo:
+        if conn is None:
+            _instantaneas.clear()
+        else:
+            _instantaneas.pop(_ruta_base(conn), None)
+
+# --- Ayudantes ---
+def _segundos(dia):
+    return (date.fromisoformat(dia) - date(1970, 1, 1)).days * DIA
+
+def _dia_texto(numero):
+    return (date(1970, 1, 1) + timedelta(days=int(numero))).isoformat()
+
+def _periodo(columnas, desde, hasta):
+    seg = columnas["segundo"]
+    mascara = seg >= 0
+    if desde:
+        mascara &= seg >= _segundos(desde)
+    if hasta:
+        mascara &= seg < _segundos(hasta) + DIA
+    return {c: v[mascara] for c, v in columnas.items()}
+
+def _tasas(conn):
+    filas = conn.execute("""
+        SELECT COALESCE(CAST(strftime('%s', desde) AS INTEGER), 0), tasa FROM tipos_cambio ORDER BY desde
+    """).fetchall() or [(0, get_tipo_cambio(conn))]
+    return np.array([f[0] for f in filas], dtype=np.int64), np.array([f[1] for f in filas], dtype=np.float64)
+
+def _importes(conn, columnas, moneda):
+    # Centavos de cada venta en la moneda pedida, con la tasa que regía en su fecha
+    # (la primera tasa cubre también lo anterior a ella)
+    if moneda not in MONEDAS:
+        raise ValueError(f"Moneda desconocida: {moneda}")
+    desde, tasa = _tasas(conn)
+    vigente = tasa[np.maximum(np.searchsorted(desde, columnas["segundo"], side="right") - 1, 0)]
+    centavos = columnas["total_centavos"].astype(np.float64)
+    if moneda == "USD":
+        return np.where(columnas["moneda"] == MONEDAS.index("CUP"), centavos / vigente, centavos)
+    return np.where(columnas["moneda"] == MONEDAS.index("USD"), centavos * vigente, centavos)
+
+def _nombres(conn, tabla, campo, ids):
+    ids = [int(i) for i in ids]
+    nombres = {}
+    for i in range(0, len(ids), 500):
+        trozo = ids[i:i + 500]
+        marcas = ",".join("?" * len(trozo))
+        nombres.update(conn.execute(f"SELECT id, {campo} FROM {tabla} WHERE id IN ({marcas})", trozo).fetchall())
+    return nombres
+
+def _mayores(valores, n):
+    # Índices de los n valores positivos más altos, de mayor a menor
+    candidatos = np.flatnonzero(valores > 0)
+    if n and len(candidatos) > n:
+        candidatos = candidatos[np.argpartition(-valores[candidatos], n - 1)[:n]]
+    return candidatos[np.argsort(-valores[candidatos], kind="stable")]
+
+# --- Reportes ---
+# desde / hasta: días 'YYYY-MM-DD' incluidos ("" = sin límite). Importes en la
+# moneda pedida, ya convertidos y en unidades (no centavos).
+def top_productos(conn, n=10, desde="", hasta="", moneda="USD", por="unidades"):
+    # [(producto_id, nombre, unidades, importe)] de los n más vendidos por unidades o por importe
+    col = _periodo(instantanea(conn), desde, hasta)
+    largo = int(col["producto_id"].max()) + 1 if len(col["producto_id"]) else 0
+    unidades = np.bincount(col["producto_id"], weights=col["cantidad"], minlength=largo)
+    importe = np.bincount(col["producto_id"], weights=_importes(conn, col, moneda), minlength=largo)
+    orden = _mayores(unidades if por == "unidades" else importe, n)
+    nombres = _nombres(conn, "productos", "nombre", orden)
+    return [(int(i), nombres.get(int(i), f"#{i} (borrado)"), int(unidades[i]), round(importe[i]) / 100)
+            for i in orden]
+
+def _serie(conn, desde, hasta, moneda, tramo, desplazamiento=0):
+    col = _periodo(instantanea(conn), desde, hasta)
+    if not len(col["segundo"]) and not (desde and hasta):
+        return []
+    numero = (col["segundo"] // DIA + desplazamiento) // tramo
+    primero = (_segundos(desde) // DIA + desplazamiento) // tramo if desde else int(numero.min())
+    ultimo = (_segundos(hasta) // DIA + desplazamiento) // tramo if hasta else int(numero.max())
+    sumas = np.bincount(numero - primero, weights=_importes(conn, col, moneda), minlength=ultimo - primero + 1)
+    return [(_dia_texto((primero + i) * tramo - desplazamiento), round(total) / 100)
+            for i, total in enumerate(sumas[:ultimo - primero + 1])]
+
+def serie_diaria(conn, desde="", hasta="", moneda="USD"):
+    # [(dia, importe)] con todos los días del período, también los que no tuvieron ventas
+    return _serie(conn, desde, hasta, moneda, 1)
+
+def serie_semanal(conn, desde="", hasta="", moneda="USD"):
+    # [(lunes, importe)] por semana de lunes a domingo (el 1/1/1970 fue jueves)
+    return _serie(conn, desde, hasta, moneda, 7, desplazamiento=3)
+
+def por_vendedor(conn, desde="", hasta="", moneda="USD"):
+    # [(usuario_id, usuario, ventas, unidades, importe)] de mayor a menor importe
+    col = _periodo(instantanea(conn), desde, hasta)
+    largo = int(col["usuario_id"].max()) + 1 if len(col["usuario_id"]) else 0
+    lineas = np.bincount(col["usuario_id"], minlength=largo)
+    unidades = np.bincount(col["usuario_id"], weights=col["cantidad"], minlength=largo)
+    importe = np.bincount(col["usuario_id"], weights=_importes(conn, col, moneda), minlength=largo)
+    orden = np.flatnonzero(lineas)
+    orden = orden[np.argsort(-importe[orden], kind="stable")]
+    usuarios = _nombres(conn, "usuarios", "usuario", orden)
+    return [(int(i), usuarios.get(int(i), f"#{i}"), int(lineas[i]), int(unidades[i]), round(importe[i]) / 100)
+            for i in orden]
+
+def rotacion_stock(conn, dias=30, limite=50):
+    # Productos vendidos en los últimos `dias`, los que antes se quedan sin stock primero:
+    # [(producto_id, nombre, stock, vendidas, por_dia, dias_de_stock, rotacion)]
+    # rotacion = vendidas / stock; dias_de_stock = stock / ventas diarias
+    hasta = datetime.now().date()
+    col = _periodo(instantanea(conn), (hasta - timedelta(days=dias - 1)).isoformat(), hasta.isoformat())
+    stock_filas = np.array(conn.execute("SELECT id, COALESCE(cantidad, 0) FROM productos").fetchall(),
+                           dtype=np.int64).reshape(-1, 2)
+    largo = max(int(col["producto_id"].max()) + 1 if len(col["producto_id"]) else 0,
+                int(stock_filas[:, 0].max()) + 1 if len(stock_filas) else 0)
+    vendidas = np.bincount(col["producto_id"], weights=col["cantidad"], minlength=largo)
+    stock = np.zeros(largo)
+    stock[stock_filas[:, 0]] = np.maximum(stock_filas[:, 1], 0)
+    existe = np.zeros(largo, dtype=bool)
+    existe[stock_filas[:, 0]] = True
+
+    candidatos = np.flatnonzero((vendidas > 0) & existe)
+    por_dia = vendidas[candidatos] / dias
+    dias_de_stock = stock[candidatos] / por_dia
+    orden = np.argsort(dias_de_stock, kind="stable")[:limite or None]
+    elegidos = candidatos[orden]
+    nombres = _nombres(conn, "productos", "nombre", elegidos)
+    return [(int(i), nombres.get(int(i), ""), int(stock[i]), int(vendidas[i]), round(float(por_dia[o]), 2),
+             round(float(dias_de_stock[o]), 1), round(float(vendidas[i] / stock[i]), 2) if stock[i] else None)
+            for i, o in zip(elegidos, orden)]
@@ -0,0 +1,285 @@
+# Archivo de ventas viejas: cada año cerrado pasa de la base principal a su propia
+# base SQLite (<base>-ventas-<año>.db, en la misma carpeta) y queda registrado en
+# archivos_ventas. Las consultas de historial y reportes adjuntan (ATTACH) solo los
+# años que toca su rango de fechas. Los resúmenes por día y mes se quedan en la
+# base principal, así los totales no necesitan abrir los archivos.
+#   python archivado.py [--hasta AÑO] [--compactar] [ruta.db]   archiva hasta ese año (por defecto el anterior)
+#   python archivado.py --deshacer AÑO [ruta.db]               devuelve un año a la base principal
+#   python archivado.py --lista [ruta.db]
+# Cada año se copia, se comprueba fila a fila (y con integrity_check del archivo) y
+# solo entonces se borra de la base principal, en la misma transacción que lo
+# registra: si algo falla a mitad, la base principal queda como estaba.
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from migraciones import FORMATO_FECHA, GLOB_FECHA
+
+PREFIJO = "archivo_"
+TABLAS = ("ventas", "recibos")
+# Índices de ventas, iguales en la base principal y en cada archivo: fecha y producto
+# para el historial, los demás para ordenar y filtrar por columna (ver ORDEN_VENTAS)
+INDICES_VENTAS = (
+    ("idx_ventas_fecha", "fecha"),
+    ("idx_ventas_producto", "producto_id, fecha"),
+    ("idx_ventas_vendedor", "usuario_id, fecha"),
+    ("idx_ventas_cantidad", "cantidad"),
+    ("idx_ventas_total", "total_centavos"),
+    ("idx_ventas_ci", "COALESCE(cliente_ci, '')"),
+)
+
+class ErrorArchivo(Exception):
+    pass
+
+# --- Archivos adjuntos ---
+def ruta_principal(conn):
+    for _, nombre, ruta in conn.execute("PRAGMA database_list"):
+        if nombre == "main":
+            return ruta
+
+def nombre_archivo(conn, anio):
+    base = os.path.splitext(os.path.basename(ruta_principal(conn)))[0]
+    return f"{base}-ventas-{anio}.db"
+
+def _ruta_archivo(conn, archivo):
+    return os.path.join(os.path.dirname(os.path.abspath(ruta_principal(conn))), archivo)
+
+def anios_archivados(conn):
+    # {año: archivo}, del más reciente al más antiguo
+    try:
+        return dict(conn.execute("SELECT anio, archivo FROM main.archivos_ventas ORDER BY anio DESC"))
+    except sqlite3.OperationalError:
+        return {}
+
+def _adjuntados(conn):
+    return {fila[1] for fila in conn.execute("PRAGMA database_list")}
+
+def adjuntar(conn, anio, archivo=None, crear=False, conservar=()):
+    # Adjunta el archivo de un año (si no lo estaba) y devuelve su esquema
+    esquema = f"{PREFIJO}{anio}"
+    if esquema in _adjuntados(conn):
+        return esquema
+    archivo = archivo or anios_archivados(conn).get(anio) or nombre_archivo(conn, anio)
+    ruta = _ruta_archivo(conn, archivo)
+    # ATTACH crea un archivo vacío si no existe: sin esta comprobación el año se vería sin ventas
+    if not crear and not os.path.exists(ruta):
+        raise FileNotFoundError(f"Falta el archivo de ventas de {anio}: {ruta}")
+    try:
+        conn.execute(f"ATTACH DATABASE ? AS {esquema}", (ruta,))
+    except sqlite3.OperationalError as e:
+        if "too many attached" not in str(e):
+            raise
+        # SQLite admite pocas bases adjuntas (10): se sueltan las que esta consulta no usa
+        for otro in _adjuntados(conn):
+            if otro.startswith(PREFIJO) and otro not in conservar:
+                conn.execute(f"DETACH DATABASE {otro}")
+        conn.execute(f"ATTACH DATABASE ? AS {esquema}", (ruta,))
+    return esquema
+
+def _anio(texto):
+    try:
+        return int(str(texto)[:4])
+    except ValueError:
+        return None
+
+def segmentos_ventas(conn, desde="", hasta=""):
+    # Esquemas cuyas tablas de ventas cubren el rango de días: "main" y los años
+    # archivados que lo tocan (adjuntados), del más reciente al más antiguo
+    desde_anio, hasta_anio = _anio(desde) if desde else None, _anio(hasta) if hasta else None
+    anios = [a for a in anios_archivados(conn)
+             if (desde_anio is None or a >= desde_anio) and (hasta_anio is None or a <= hasta_anio)]
+    esquemas = [f"{PREFIJO}{a}" for a in anios]
+    for anio in anios:
+        adjuntar(conn, anio, conservar=esquemas)
+    return ["main"] + esquemas
+
+def adjuntar_para(conn, query):
+    # Adjunta los archivos que nombra una consulta armada con otra conexión
+    anios = sorted({int(a) for a in re.findall(PREFIJO + r"(\d{4})\.", query)})
+    for anio in anios:
+        adjuntar(conn, anio, conservar=[f"{PREFIJO}{a}" for a in anios])
+
+# --- Archivar ---
+def _columnas(conn, esquema, tabla):
+    return [(c[1], c[2], c[5]) for c in conn.execute(f"PRAGMA {esquema}.table_info({tabla})")]
+
+def _columnas_comunes(conn, esquema, tabla):
+    en_archivo = {c[0] for c in _columnas(conn, esquema, tabla)}
+    return [c[0] for c in _columnas(conn, "main", tabla) if c[0] in en_archivo]
+
+def _preparar_archivo(conn, esquema):
+    for tabla in TABLAS:
+        columnas = _columnas(conn, "main", tabla)
+        definicion = ", ".join(f"{nombre} {tipo}{' PRIMARY KEY' if pk else ''}" for nombre, tipo, pk in columnas)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {esquema}.{tabla} ({definicion})")
+        # Un archivo hecho con un esquema anterior recibe las columnas nuevas
+        existentes = {c[0] for c in _columnas(conn, esquema, tabla)}
+        for nombre, tipo, _ in columnas:
+            if nombre not in existentes:
+                conn.execute(f"ALTER TABLE {esquema}.{tabla} ADD COLUMN {nombre} {tipo}")
+    for nombre, columnas in INDICES_VENTAS:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.{nombre} ON ventas({columnas})")
+    conn.commit()
+
+def _rango(anio, mes=None):
+    if mes is None:
+        return f"{anio}-01-01 00:00:00", f"{anio}-12-31 23:59:59"
+    return f"{anio}-{mes:02d}-01 00:00:00", f"{anio}-{mes:02d}-31 23:59:59"
+
+def anios_para_archivar(conn, hasta_anio):
+    # Años con ventas en la base principal hasta hasta_anio, saltando por idx_ventas_fecha
+    anios = []
+    desde = ""
+    while True:
+        fecha = conn.execute("SELECT MIN(fecha) FROM main.ventas WHERE fecha >= ? AND fecha GLOB ?",
+                             (desde, GLOB_FECHA)).fetchone()[0]
+        if fecha is None or int(fecha[:4]) > hasta_anio:
+            return anios
+        anios.append(int(fecha[:4]))
+        desde = str(anios[-1] + 1)
+
+def archivar_anio(conn, anio, progreso=None):
+    # Mueve las ventas (y sus recibos) de un año a su archivo; devuelve cuántas ventas movió
+    archivo = anios_archivados(conn).get(anio) or nombre_archivo(conn, anio)
+    esquema = adjuntar(conn, anio, archivo, crear=True)
+    _preparar_archivo(conn, esquema)
+    columnas = {tabla: ", ".join(c[0] for c in _columnas(conn, "main", tabla)) for tabla in TABLAS}
+
+    # 1. Copiar mes a mes (repetible: si se cortó, la copia se rehace)
+    for mes in range(1, 13):
+        desde, hasta = _rango(anio, mes)
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {esquema}.recibos ({columnas["recibos"]})
+            SELECT {columnas["recibos"]} FROM main.recibos
+            WHERE id IN (SELECT recibo_id FROM main.ventas WHERE fecha BETWEEN ? AND ?)
+        """, (desde, hasta))
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {esquema}.ventas ({columnas["ventas"]})
+            SELECT {columnas["ventas"]} FROM main.ventas WHERE fecha BETWEEN ? AND ?
+        """, (desde, hasta))
+        conn.commit()
+        if progreso:
+            progreso(f"copiando {anio}", mes, 12)
+
+    # 2. Comprobar: cada venta del año está en el archivo con los mismos valores
+    desde, hasta = _rango(anio)
+    distintas = " OR ".join(f"a.{c[0]} IS NOT v.{c[0]}" for c in _columnas(conn, "main", "ventas"))
+    faltan = conn.execute(f"""
+        SELECT COUNT(*) FROM main.ventas v LEFT JOIN {esquema}.ventas a ON a.id = v.id
+        WHERE v.fecha BETWEEN ? AND ? AND (a.id IS NULL OR {distintas})
+    """, (desde, hasta)).fetchone()[0]
+    revision = conn.execute(f"PRAGMA {esquema}.integrity_check").fetchone()[0]
+    if faltan or revision != "ok":
+        raise ErrorArchivo(f"El archivo de {anio} no coincide con la base ({faltan} ventas distintas, "
+                           f"integrity_check: {revision}); no se borró nada")
+    if progreso:
+        progreso(f"comprobado {anio}", 1, 1)
+
+    # 3. Borrar de la base principal y registrar el año, todo en una transacción.
+    # Solo se borra lo que está en el archivo.
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(f"""
+            DELETE FROM main.recibos
+            WHERE id IN (SELECT recibo_id FROM main.ventas WHERE fecha BETWEEN ? AND ?)
+              AND id IN (SELECT id FROM {esquema}.recibos)
+        """, (desde, hasta))
+        cursor.execute(f"DELETE FROM main.ventas WHERE fecha BETWEEN ? AND ? AND id IN (SELECT id FROM {esquema}.ventas)",
+                       (desde, hasta))
+        movidas = cursor.rowcount
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO main.archivos_ventas (anio, archivo, ventas, unidades, total_centavos, desde, hasta, archivado)
+            SELECT ?, ?, COUNT(*), SUM(cantidad), SUM(total_centavos), MIN(fecha), MAX(fecha), ? FROM {esquema}.ventas
+        """, (anio, archivo, datetime.now().strftime(FORMATO_FECHA)))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return movidas
+
+def archivar(conn, hasta_anio=None, progreso=None, compactar=False):
+    # Archiva todos los años cerrados hasta hasta_anio (por defecto el año pasado).
+    # compactar: VACUUM al final para que el archivo de la base principal encoja.
+    actual = datetime.now().year
+    hasta_anio = hasta_anio or actual - 1
+    if hasta_anio >= actual:
+        raise ValueError("Solo se pueden archivar años cerrados")
+    hechos = [(anio, archivar_anio(conn, anio, progreso)) for anio in anios_para_archivar(conn, hasta_anio)]
+    if hechos:
+        conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+        if compactar:
+            conn.execute("VACUUM main")
+    return hechos
+
+def desarchivar_anio(conn, anio):
+    # Vuelta atrás: devuelve las ventas de un año a la base principal y lo quita del
+    # registro. El archivo se conserva; archivar de nuevo lo reutiliza.
+    archivo = anios_archivados(conn).get(anio)
+    if archivo is None:
+        raise ValueError(f"El año {anio} no está archivado")
+    esquema = adjuntar(conn, anio, archivo)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # Los resúmenes ya cuentan estas ventas: el trigger no las debe sumar otra vez
+        trigger = cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'trigger' AND name = 'ventas_resumen_ai'"
+                                 ).fetchone()
+        cursor.execute("DROP TRIGGER IF EXISTS main.ventas_resumen_ai")
+        # Ni al diario de cambios: las demás tiendas ya las recibieron
+        cursor.execute("UPDATE main.sync_estado SET aplicando = 1 WHERE id = 1")
+        for tabla in TABLAS:
+            columnas = ", ".join(_columnas_comunes(conn, esquema, tabla))
+            cursor.execute(f"INSERT OR IGNORE INTO main.{tabla} ({columnas}) SELECT {columnas} FROM {esquema}.{tabla}")
+        cursor.execute("UPDATE main.sync_estado SET aplicando = 0 WHERE id = 1")
+        if trigger:
+            cursor.execute(trigger[0])
+        faltan = cursor.execute(f"""
+            SELECT COUNT(*) FROM {esquema}.ventas a WHERE NOT EXISTS (SELECT 1 FROM main.ventas v WHERE v.id = a.id)
+        """).fetchone()[0]
+        if faltan:
+            raise ErrorArchivo(f"{faltan} ventas de {anio} no se pudieron devolver; no se cambió nada")
+        cursor.execute("DELETE FROM main.archivos_ventas WHERE anio = ?", (anio,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.execute(f"DETACH DATABASE {esquema}")
+
+if __name__ == "__main__":
+    import sys
+
+    from conexion import abrir_conexion
+    from inventario import DB_PATH, inicializar_base
+
+    args = sys.argv[1:]
+
+    def opcion(nombre):
+        if nombre not in args:
+            return None
+        i = args.index(nombre)
+        valor = int(args[i + 1])
+        del args[i:i + 2]
+        return valor
+
+    hasta_anio = opcion("--hasta")
+    deshacer = opcion("--deshacer")
+    compactar = "--compactar" in args
+    lista = "--lista" in args
+    args = [a for a in args if not a.startswith("--")]
+    conn = abrir_conexion(args[0] if args else DB_PATH)
+    inicializar_base(conn)
+
+    if deshacer:
+        desarchivar_anio(conn, deshacer)
+        print(f"Ventas de {deshacer} devueltas a la base principal")
+    elif not lista:
+        def mostrar(paso, hechas, total):
+            print(f"  {paso}: {hechas}/{total}")
+
+        for anio, movidas in archivar(conn, hasta_anio, mostrar, compactar):
+            print(f"{anio}: {movidas} ventas archivadas")
+    for anio, archivo, ventas, desde, hasta in conn.execute(
+            "SELECT anio, archivo, ventas, desde, hasta FROM archivos_ventas ORDER BY anio"):
+        print(f"{anio}  {archivo}  {ventas} ventas ({desde} a {hasta})")
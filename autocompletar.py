@@ -0,0 +1,70 @@
+# Índice en memoria para el selector de productos de la pantalla Vender.
+# Se guarda una lista ordenada con el nombre normalizado a partir de cada palabra
+# ("arroz blanco" -> "arroz blanco", "blanco"), así una búsqueda por prefijo es
+# un bisect más recorrer las N primeras coincidencias.
+import unicodedata
+from bisect import bisect_left
+
+from inventario import productos_para_venta, version_catalogo
+
+def normalizar(texto):
+    # Minúsculas y sin tildes, para que "cafe" encuentre "Café"
+    texto = texto.lower()
+    if texto.isascii():
+        return texto
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+class IndiceProductos:
+    def __init__(self, conn):
+        self.conn = conn
+        self.claves = []
+        self.productos = {}
+        self.data_version = None
+        self.version = None
+
+    def invalidar(self):
+        self.version = None
+
+    def _vigente(self):
+        # data_version cambia cuando otra conexión escribe (ventas incluidas); solo
+        # entonces se mira el contador que mantienen los triggers del catálogo.
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if self.version is not None and data_version == self.data_version:
+            return True
+        self.data_version = data_version
+        return self.version is not None and version_catalogo(self.conn) == self.version
+
+    def _construir(self):
+        self.version = version_catalogo(self.conn)
+        self.productos = {}
+        claves = []
+        for p in productos_para_venta(self.conn):
+            self.productos[p[0]] = p
+            nombre = normalizar(p[1] or "")
+            inicio = 0
+            for palabra in nombre.split():
+                pos = nombre.index(palabra, inicio)
+                claves.append((nombre[pos:], p[0]))
+                inicio = pos + len(palabra)
+        claves.sort()
+        self.claves = claves
+
+    def buscar(self, texto, limite=20):
+        if not self._vigente():
+            self._construir()
+        prefijo = normalizar(texto.strip())
+        if not prefijo:
+            return []
+        resultado = []
+        vistos = set()
+        i = bisect_left(self.claves, (prefijo,))
+        while i < len(self.claves) and len(resultado) < limite:
+            clave, producto_id = self.claves[i]
+            if not clave.startswith(prefijo):
+                break
+            if producto_id not in vistos:
+                vistos.add(producto_id)
+                resultado.append(self.productos[producto_id])
+            i += 1
+        return resultado
@@ -0,0 +1,314 @@
+# Benchmark sin interfaz de las consultas de la aplicación sobre datos sintéticos.
+#   python benchmark.py --productos 10000 --ventas 5000000 --salida bench.json
+#   python benchmark.py --salida nuevo.json --comparar bench.json
+# La base generada se guarda (por defecto bench_inventario.db) y se reutiliza
+# mientras los tamaños coincidan; --regenerar la crea de nuevo.
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import analitica
+import inventario
+from autocompletar import IndiceProductos
+from cola_ventas import ColaVentas
+from conexion import abrir_conexion
+from inventario import (
+    consulta_ventas, consultar_productos_pagina, contar_stock_bajo, crear_resumenes_ventas,
+    inicializar_base, listar_ventas, productos_stock_bajo, reconstruir_resumenes_ventas, registrar_venta,
+    set_tipo_cambio, total_mes_en, totales_dia, totales_mes,
+)
+from movimientos_stock import stock_en, valor_stock_en
+from sincronizacion import cambios_pendientes, vector_versiones
+
+PALABRAS = ("arroz", "frijol", "aceite", "azúcar", "café", "leche", "pollo", "cerdo", "jabón", "detergente",
+            "pasta", "galletas", "refresco", "cerveza", "ron", "harina", "sal", "huevos", "queso", "jamón")
+MARCAS = ("Serrano", "Cubita", "Bucanero", "Cristal", "Havana", "Tropical", "Palmares", "Nauta")
+LOTE = 50000
+
+# --- Generación de datos ---
+def _borrar_base(ruta):
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+
+def generar_datos(ruta, usuarios, productos, ventas, dias, semilla=1):
+    rnd = random.Random(semilla)
+    _borrar_base(ruta)
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    # Los datos sintéticos no pasan por el diario de cambios (no se sincronizan)
+    conn.execute("UPDATE sync_estado SET aplicando = 1 WHERE id = 1")
+
+    conn.executemany("INSERT INTO usuarios (usuario, password, rol) VALUES (?, ?, 'vendedor')",
+                     [(f"vendedor{i}", "clave") for i in range(1, usuarios + 1)])
+    conn.executemany("""
+        INSERT INTO productos (codigo, nombre, cantidad, precio_centavos, moneda, stock_minimo, imagen)
+        VALUES (?, ?, ?, ?, ?, ?, '')
+    """, [(f"SKU{i:07d}", f"{rnd.choice(PALABRAS).capitalize()} {rnd.choice(MARCAS)} {rnd.randint(1, 999)}g",
+           rnd.randint(0, 500), rnd.randint(50, 30000), rnd.choice(("USD", "CUP")), rnd.randint(1, 20))
+          for i in range(productos)])
+    conn.commit()
+
+    # Los resúmenes se rehacen al final: mucho más rápido que el trigger fila a fila
+    conn.execute("DROP TRIGGER IF EXISTS ventas_resumen_ai")
+    precios = {fila[0]: fila[1:] for fila in conn.execute("SELECT id, precio_centavos, moneda FROM productos")}
+    ids_usuarios = [r[0] for r in conn.execute("SELECT id FROM usuarios")]
+    fin = datetime.now()
+    inicio = fin - timedelta(days=dias)
+    paso = (fin - inicio).total_seconds() / max(ventas, 1)
+
+    # Una tasa nueva cada semana, a media mañana, para que los reportes convertidos
+    # tengan días con cambio de tasa
+    for semana in range(1, dias // 7 + 1):
+        desde = (inicio + timedelta(days=semana * 7, hours=10, minutes=rnd.randint(0, 59))).strftime("%Y-%m-%d %H:%M:%S")
+        set_tipo_cambio(conn, round(rnd.uniform(120, 400), 2), desde)
+
+    def filas():
+        for i in range(ventas):
+            producto_id = rnd.randint(1, productos)
+            cant = rnd.randint(1, 5)
+            fecha = (inicio + timedelta(seconds=i * paso)).strftime("%Y-%m-%d %H:%M:%S")
+            precio, moneda = precios[producto_id]
+            yield (producto_id, cant, cant * precio, moneda, fecha,
+                   f"Cliente {rnd.randint(1, 50000)}", f"{rnd.randint(10**10, 10**11 - 1)}", "La Habana",
+                   rnd.choice(ids_usuarios))
+
+    sql = """
+        INSERT INTO ventas (producto_id, cantidad, total_centavos, moneda, fecha, cliente_nombre, cliente_ci, cliente_dir,
+                            usuario_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    lote = []
+    for fila in filas():
+        lote.append(fila)
+        if len(lote) >= LOTE:
+            conn.executemany(sql, lote)
+            conn.commit()
+            lote = []
+    if lote:
+        conn.executemany(sql, lote)
+    conn.commit()
+    reconstruir_resumenes_ventas(conn)
+    crear_resumenes_ventas(conn)
+    conn.execute("UPDATE sync_estado SET aplicando = 0 WHERE id = 1")
+    conn.execute("CREATE TABLE IF NOT EXISTS bench_meta (clave TEXT PRIMARY KEY, valor TEXT)")
+    conn.execute("INSERT OR REPLACE INTO bench_meta VALUES ('tamanos', ?)",
+                 (json.dumps([usuarios, productos, ventas, dias]),))
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def base_vigente(ruta, usuarios, productos, ventas, dias):
+    if not os.path.exists(ruta):
+        return False
+    conn = sqlite3.connect(ruta)
+    try:
+        r = conn.execute("SELECT valor FROM bench_meta WHERE clave = 'tamanos'").fetchone()
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+    return r is not None and json.loads(r[0]) == [usuarios, productos, ventas, dias]
+
+# --- Medición ---
+def medir(funcion, repeticiones):
+    tiempos = []
+    filas = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "repeticiones": repeticiones,
+        "ms_min": round(tiempos[0], 3),
+        "ms_mediana": round(statistics.median(tiempos), 3),
+        "ms_p95": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 3),
+        "filas": filas if isinstance(filas, int) else None,
+    }
+
+def _todas(conn, query, params):
+    return len(conn.execute(query, params).fetchall())
+
+def _primeras(conn, query, params, n=100):
+    return len(conn.execute(query, params).fetchmany(n))
+
+def casos(conn, ruta, args):
+    # Cada caso: nombre -> (función sin argumentos que devuelve nº de filas, repeticiones)
+    hoy = datetime.now()
+    mes = hoy.strftime("%Y-%m")
+    desde_mes = (hoy - timedelta(days=30)).strftime("%Y-%m-%d")
+    desde_semana = (hoy - timedelta(days=7)).strftime("%Y-%m-%d")
+    hasta = hoy.strftime("%Y-%m-%d")
+    indice = IndiceProductos(conn)
+    r = args.repeticiones
+
+    q_todo, p_todo = consulta_ventas(conn)
+    q_mes, p_mes = consulta_ventas(conn, desde=desde_mes, hasta=hasta)
+    q_prod, p_prod = consulta_ventas(conn, producto="arroz")
+    # Clave (fecha, id) de una venta a mitad del historial, para medir una página lejana
+    clave_profunda = conn.execute("SELECT fecha, id FROM ventas ORDER BY fecha, id LIMIT 1 OFFSET "
+                                  "(SELECT COUNT(*) / 2 FROM ventas)").fetchone()
+
+    lista = {
+        "productos_pagina_inicial": (lambda: len(consultar_productos_pagina(conn)), r),
+        "productos_buscar_fts": (lambda: len(consultar_productos_pagina(conn, "cubita")), r),
+        "productos_buscar_corto_like": (lambda: len(consultar_productos_pagina(conn, "ar")), r),
+        "productos_buscar_sin_resultados": (lambda: len(consultar_productos_pagina(conn, "zzzzz")), r),
+        "selector_indice_construir": (lambda: (indice.invalidar(), len(indice.buscar("a")))[1], max(1, r // 5)),
+        "selector_indice_buscar": (lambda: len(indice.buscar("caf", 20)), r * 10),
+        "historial_primera_pagina": (lambda: _primeras(conn, q_todo, p_todo), r),
+        "historial_pagina_listar": (lambda: len(listar_ventas(conn)), r),
+        "historial_pagina_profunda": (lambda: len(listar_ventas(conn, despues_de=clave_profunda)), r),
+        "historial_pagina_producto": (lambda: len(listar_ventas(conn, producto="arroz")), r),
+        # Orden por encabezado: primera página por el índice de la columna, sin ordenar todo
+        "historial_ordenar_total": (lambda: len(listar_ventas(conn, orden="total")), r),
+        "historial_ordenar_ci_desc": (lambda: len(listar_ventas(conn, orden="ci", descendente=True)), r),
+        "historial_filtro_vendedor_cantidad": (lambda: len(listar_ventas(conn, vendedor="vendedor1", orden="cantidad")), r),
+        "productos_ordenar_nombre": (lambda: len(consultar_productos_pagina(conn, orden="nombre")), r),
+        "productos_filtro_cantidad_moneda": (lambda: len(consultar_productos_pagina(
+            conn, orden="cantidad", descendente=True, cantidad_min=10, cantidad_max=50, moneda="CUP")), r),
+        "historial_ultimo_mes": (lambda: _todas(conn, q_mes, p_mes), max(1, r // 5)),
+        "historial_filtro_producto": (lambda: _todas(conn, q_prod, p_prod), max(1, r // 5)),
+        "reportes_totales_dia_mes": (lambda: len(totales_dia(conn, hasta)) + len(totales_mes(conn, mes)), r),
+        "reportes_mes_convertido": (lambda: int(total_mes_en(conn, mes, "CUP") > 0), r),
+        "reportes_scan_ventas_mes": (lambda: _todas(conn, "SELECT SUM(total_centavos) FROM ventas WHERE fecha LIKE ?",
+                                                    (mes + "%",)), max(1, r // 5)),
+        "alertas_stock_contar": (lambda: contar_stock_bajo(conn), r),
+        "alertas_stock_pagina": (lambda: len(productos_stock_bajo(conn, limite=8)), r),
+        # Sincronizar con una base al día: solo compara los vectores de versiones
+        "sincronizar_sin_cambios": (lambda: sum(1 for _ in cambios_pendientes(conn, vector_versiones(conn))), r),
+        # Stock en una fecha: última instantánea más los movimientos desde ella
+        "stock_en_fecha": (lambda: len(stock_en(conn, hasta)), r),
+        "stock_en_fecha_producto": (lambda: stock_en(conn, hasta, 1), r),
+        "stock_valor_en_fecha": (lambda: len(valor_stock_en(conn, hasta)), r),
+    }
+
+    escritor = abrir_conexion(ruta)
+    productos = conn.execute("SELECT id, precio_centavos / 100.0 FROM productos WHERE cantidad > 100 LIMIT 200").fetchall()
+
+    def vender():
+        for _ in range(args.ventas_insertar):
+            p = random.choice(productos)
+            try:
+                registrar_venta(escritor, [(p[0], 1, p[1])], "Bench", "0", "", 1)
+            except inventario.StockInsuficiente:
+                pass
+        return args.ventas_insertar
+    lista["ventas_insertar_lote"] = (vender, 1)
+
+    # Las mismas ventas por la cola con escritura en grupo, hasta que quedan escritas
+    def vender_en_cola():
+        cola = ColaVentas(ruta, diario=os.path.join(tempfile.mkdtemp(), "bench.cola"))
+        for _ in range(args.ventas_insertar):
+            p = random.choice(productos)
+            try:
+                cola.encolar([(p[0], 1, p[1])], "Bench", "0", "", 1)
+            except inventario.StockInsuficiente:
+                pass
+        cola.cerrar()
+        return args.ventas_insertar
+    lista["ventas_cola_lote"] = (vender_en_cola, 1)
+
+    # El análisis solo se mide si NumPy está instalado. La carga de la instantánea
+    # lee .analitica/ si ya existe y toda la tabla ventas si no.
+    if analitica.DISPONIBLE:
+        lista["analisis_instantanea_cargar"] = (lambda: (analitica.olvidar(), len(analitica.instantanea(conn)["id"]))[1], 1)
+        lista["analisis_top_productos_mes"] = (lambda: len(analitica.top_productos(conn, 20, desde_mes, hasta)), r)
+        lista["analisis_series_dia_semana"] = (lambda: len(analitica.serie_diaria(conn, desde_mes, hasta))
+                                               + len(analitica.serie_semanal(conn)), r)
+        lista["analisis_por_vendedor"] = (lambda: len(analitica.por_vendedor(conn)), r)
+        lista["analisis_rotacion_stock"] = (lambda: len(analitica.rotacion_stock(conn, 30)), r)
+
+    # La exportación solo se mide si reportlab está instalado
+    if importlib.util.find_spec("reportlab") is not None:
+        q_pdf, p_pdf = consulta_ventas(conn, desde=desde_semana, hasta=hasta)
+        salida = os.path.join(tempfile.mkdtemp(), "bench.pdf")
+
+        def pdf():
+            inventario.escribir_pdf_ventas(salida, q_pdf, p_pdf, ruta=ruta)
+            return conn.execute(f"SELECT COUNT(*) FROM ({q_pdf})", p_pdf).fetchone()[0]
+        lista["pdf_exportar_semana"] = (pdf, 1)
+    return lista
+
+def version_codigo():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def comparar(actual, archivo_anterior):
+    with open(archivo_anterior, encoding="utf-8") as fh:
+        anterior = json.load(fh)["resultados"]
+    print(f"\n{'caso':34} {'antes ms':>10} {'ahora ms':>10} {'ratio':>7}")
+    for nombre, r in actual.items():
+        if nombre not in anterior:
+            continue
+        antes = anterior[nombre]["ms_mediana"]
+        ratio = r["ms_mediana"] / antes if antes else float("inf")
+        marca = "  <-- más lento" if ratio > 1.2 else ""
+        print(f"{nombre:34} {antes:10.2f} {r['ms_mediana']:10.2f} {ratio:7.2f}{marca}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las consultas de inventario")
+    parser.add_argument("--db", default="bench_inventario.db")
+    parser.add_argument("--usuarios", type=int, default=20)
+    parser.add_argument("--productos", type=int, default=10000)
+    parser.add_argument("--ventas", type=int, default=200000)
+    parser.add_argument("--dias", type=int, default=730, help="días que abarca el historial generado")
+    parser.add_argument("--ventas-insertar", type=int, default=500, help="ventas a registrar en el caso de escritura")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--salida", default="bench.json")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--regenerar", action="store_true")
+    parser.add_argument("--solo", help="ejecutar solo los casos cuyo nombre contenga este texto")
+    args = parser.parse_args()
+
+    if args.regenerar or not base_vigente(args.db, args.usuarios, args.productos, args.ventas, args.dias):
+        print(f"Generando {args.productos} productos y {args.ventas} ventas en {args.db}...")
+        inicio = time.perf_counter()
+        generar_datos(args.db, args.usuarios, args.productos, args.ventas, args.dias)
+        print(f"  listo en {time.perf_counter() - inicio:.1f}s")
+
+    conn = abrir_conexion(args.db)
+    inicializar_base(conn)
+    lector = abrir_conexion(args.db, solo_lectura=True)
+    resultados = {}
+    for nombre, (funcion, repeticiones) in casos(lector, args.db, args).items():
+        if args.solo and args.solo not in nombre:
+            continue
+        resultados[nombre] = r = medir(funcion, repeticiones)
+        print(f"{nombre:34} mediana {r['ms_mediana']:10.3f} ms  p95 {r['ms_p95']:10.3f} ms  filas {r['filas']}")
+
+    informe = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "version": version_codigo(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "tamanos": {"usuarios": args.usuarios, "productos": args.productos,
+                        "ventas": args.ventas, "dias": args.dias},
+        },
+        "resultados": resultados,
+    }
+    with open(args.salida, "w", encoding="utf-8") as fh:
+        json.dump(informe, fh, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {args.salida}")
+    if args.comparar:
+        comparar(resultados, args.comparar)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
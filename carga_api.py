@@ -0,0 +1,132 @@
+# Prueba de carga del servicio HTTP/JSON (servidor_api.py) con muchos clientes a la vez.
+#   python carga_api.py --clientes 32 --segundos 20
+#   python carga_api.py --url http://127.0.0.1:8765 --usuario admin --clave admin123
+# Sin --url genera una base sintética (benchmark.generar_datos) y levanta el servidor
+# en otro proceso. Cada cliente es un proceso con una conexión keep-alive que hace
+# una mezcla de búsquedas, páginas de ventas, reportes y ventas. Al final muestra
+# peticiones por segundo y latencias p50/p99 por tipo de petición.
+import argparse
+import base64
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from urllib.parse import quote, urlsplit
+
+from benchmark import PALABRAS, generar_datos
+
+# (nombre, peso)
+MEZCLA = (("buscar", 50), ("producto", 15), ("ventas", 20), ("reportes", 10), ("vender", 5))
+
+def _peticion(rnd, productos):
+    tipo = rnd.choices([m[0] for m in MEZCLA], [m[1] for m in MEZCLA])[0]
+    if tipo == "buscar":
+        return tipo, "GET", f"/productos?q={quote(rnd.choice(PALABRAS))}&limite=20", None
+    if tipo == "producto":
+        return tipo, "GET", f"/productos/{rnd.randint(1, productos)}", None
+    if tipo == "ventas":
+        return tipo, "GET", "/ventas?limite=50", None
+    if tipo == "reportes":
+        return tipo, "GET", f"/reportes?moneda={rnd.choice(('USD', 'CUP'))}", None
+    cuerpo = {"lineas": [{"producto_id": rnd.randint(1, productos), "cantidad": 1}], "cliente_nombre": "Carga"}
+    return tipo, "POST", "/ventas", json.dumps(cuerpo)
+
+def cliente(url, autorizacion, productos, segundos, semilla, resultados):
+    rnd = random.Random(semilla)
+    partes = urlsplit(url)
+    conexion = http.client.HTTPConnection(partes.hostname, partes.port, timeout=30)
+    cabeceras = {"Authorization": autorizacion, "Content-Type": "application/json"}
+    tiempos = {}
+    estados = {}
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        tipo, metodo, ruta, cuerpo = _peticion(rnd, productos)
+        inicio = time.perf_counter()
+        try:
+            conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            estado = respuesta.status
+        except (OSError, http.client.HTTPException):
+            conexion.close()
+            estado = "error"
+        tiempos.setdefault(tipo, []).append((time.perf_counter() - inicio) * 1000)
+        estados[estado] = estados.get(estado, 0) + 1
+    conexion.close()
+    resultados.put((tiempos, estados))
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+def _servidor(ruta, puerto, lectores, listo):
+    from servidor_api import crear_servidor, servir
+    servidor = crear_servidor(ruta, puerto=puerto, lectores=lectores)
+    listo.set()
+    servir(servidor)
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio HTTP/JSON")
+    parser.add_argument("--url", help="servidor ya en marcha (si no, se levanta uno con una base sintética)")
+    parser.add_argument("--usuario", default="admin")
+    parser.add_argument("--clave", default="admin123")
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--segundos", type=float, default=15)
+    parser.add_argument("--productos", type=int, default=5000)
+    parser.add_argument("--ventas", type=int, default=200000, help="ventas de la base sintética")
+    parser.add_argument("--lectores", type=int, default=4, help="tamaño del pool de lectura del servidor")
+    args = parser.parse_args()
+
+    proceso_servidor = None
+    url = args.url
+    if url is None:
+        ruta = os.path.join(tempfile.mkdtemp(), "carga.db")
+        print(f"Generando {args.productos} productos y {args.ventas} ventas...")
+        generar_datos(ruta, 10, args.productos, args.ventas, 365)
+        puerto = random.randint(20000, 40000)
+        listo = multiprocessing.Event()
+        proceso_servidor = multiprocessing.Process(target=_servidor, args=(ruta, puerto, args.lectores, listo),
+                                                   daemon=True)
+        proceso_servidor.start()
+        listo.wait(60)
+        url = f"http://127.0.0.1:{puerto}"
+
+    autorizacion = "Basic " + base64.b64encode(f"{args.usuario}:{args.clave}".encode()).decode()
+    resultados = multiprocessing.Queue()
+    procesos = [multiprocessing.Process(target=cliente, args=(url, autorizacion, args.productos, args.segundos,
+                                                              i, resultados))
+                for i in range(args.clientes)]
+    print(f"{args.clientes} clientes durante {args.segundos:.0f} s contra {url}")
+    for p in procesos:
+        p.start()
+    recibidos = [resultados.get() for _ in procesos]
+    for p in procesos:
+        p.join()
+    if proceso_servidor:
+        proceso_servidor.terminate()
+
+    por_tipo = {}
+    estados = {}
+    for tiempos, est in recibidos:
+        for tipo, valores in tiempos.items():
+            por_tipo.setdefault(tipo, []).extend(valores)
+        for estado, n in est.items():
+            estados[estado] = estados.get(estado, 0) + n
+    todos = sorted(t for valores in por_tipo.values() for t in valores)
+    print(f"\n{'petición':10} {'n':>8} {'p50 ms':>9} {'p99 ms':>9} {'máx ms':>9}")
+    for tipo, _ in MEZCLA:
+        valores = sorted(por_tipo.get(tipo, []))
+        if valores:
+            print(f"{tipo:10} {len(valores):8} {statistics.median(valores):9.2f} {_percentil(valores, 0.99):9.2f} "
+                  f"{valores[-1]:9.2f}")
+    if todos:
+        print(f"{'total':10} {len(todos):8} {statistics.median(todos):9.2f} {_percentil(todos, 0.99):9.2f} "
+              f"{todos[-1]:9.2f}")
+    print(f"\n{len(todos) / args.segundos:.0f} peticiones/s; respuestas: "
+          + ", ".join(f"{estado}: {n}" for estado, n in sorted(estados.items(), key=str)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# Cola de ventas con escritura en grupo: la caja no espera al disco.
+#   cola = ColaVentas(DB_PATH, al_terminar=...)     al crearla recupera lo pendiente
+#   cola.encolar(lineas, cliente_nombre, cliente_ci, cliente_dir, usuario_id)
+# encolar() comprueba el stock contra la base menos lo ya reservado en la cola,
+# anota la venta en el diario de la cola (<base>.<equipo>.cola) y vuelve enseguida.
+# Un solo hilo escritor toma todas las ventas que haya en la cola (hasta LOTE_MAX)
+# y las escribe en una transacción: un fsync por grupo y no uno por venta. Cada
+# venta va en su SAVEPOINT, así una sin stock no tumba a las demás del grupo.
+# Garantías:
+#   - Si el programa se cierra o falla, lo encolado sigue en el diario y se escribe
+#     al crear la cola la próxima vez (recuperadas). El token de cada venta, guardado
+#     en recibos, impide escribirla dos veces.
+#   - Ante un corte de luz se pueden perder las ventas encoladas que el sistema aún
+#     no había pasado a disco (las de la última fracción de segundo), como ya pasa con
+#     synchronous=NORMAL. Con INVENTARIO_COLA_FSYNC=1 el diario se sincroniza en cada
+#     venta: no se pierde ninguna, a cambio de un fsync (más pequeño) por venta.
+#   - La reserva en memoria solo ve las ventas de esta caja. Si otra caja vende antes
+#     las mismas unidades, el UPDATE condicional rechaza la venta al escribirla y
+#     al_terminar recibe StockInsuficiente.
+#   - Si la escritura falla por otra causa (disco lleno...), el grupo se reintenta venta
+#     a venta para que una sola no arrastre a las demás. La que falla llega a al_terminar
+#     con el error y queda en el diario para el próximo arranque.
+#   - Al arrancar, una venta que sigue fallando suma un intento; tras INTENTOS_MAX se
+#     aparta en <diario>.rechazadas (ruta_rechazadas) y se informa en recuperadas, así
+#     no impide abrir el programa. Las demás vuelven a la cola.
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from conexion import abrir_conexion, con_reintentos
+from inventario import StockInsuficiente, escribir_venta
+from migraciones import FORMATO_FECHA
+from movimientos_stock import instantanea_si_hace_falta
+
+LOTE_MAX = 500
+INTENTOS_MAX = 3
+FSYNC_DIARIO = os.environ.get("INVENTARIO_COLA_FSYNC", "") not in ("", "0")
+
+class ColaVentas:
+    def __init__(self, ruta, al_terminar=None, diario=None):
+        # al_terminar(venta, recibo_id, error): desde el hilo escritor, una vez por venta.
+        # diario: uno por caja (por defecto <base>.<equipo>.cola), nunca compartido
+        self.al_terminar = al_terminar
+        self._ruta_diario = diario or f"{ruta}.{socket.gethostname()}.cola"
+        self.ruta_rechazadas = self._ruta_diario + ".rechazadas"
+        self._cola = queue.Queue()
+        self._bloqueo = threading.Lock()
+        self._reservado = {}
+        self._pendientes = 0
+        self._cerrada = False
+        self._lector = abrir_conexion(ruta, solo_lectura=True, check_same_thread=False)
+        self._escritor = abrir_conexion(ruta, check_same_thread=False)
+        self.recuperadas, reintentar = self._recuperar()
+        self._diario = open(self._ruta_diario, "a", encoding="utf-8")
+        # Las que fallaron al arrancar (ya anotadas en el diario) se reintentan en esta sesión
+        for venta in reintentar:
+            try:
+                self._reservar(venta["lineas"], 1)
+            except (KeyError, TypeError, ValueError):
+                pass  # Líneas mal formadas: no se escribirá nunca, no hay nada que reservar
+            self._pendientes += 1
+            self._cola.put(venta)
+        self._hilo = threading.Thread(target=self._escribir, daemon=True)
+        self._hilo.start()
+
+    # --- Caja ---
+    def encolar(self, lineas, cliente_nombre, cliente_ci, cliente_dir, usuario_id):
+        # Devuelve el token de la venta; StockInsuficiente si no alcanza lo no reservado
+        por_producto = _por_producto(lineas)
+        venta = {"token": uuid.uuid4().hex, "lineas": [list(linea) for linea in lineas],
+                 "fecha": datetime.now().strftime(FORMATO_FECHA), "cliente_nombre": cliente_nombre,
+                 "cliente_ci": cliente_ci, "cliente_dir": cliente_dir, "usuario_id": usuario_id}
+        with self._bloqueo:
+            if self._cerrada:
+                raise RuntimeError("La cola de ventas está cerrada")
+            for producto_id, cant in por_producto.items():
+                r = self._lector.execute("SELECT nombre, cantidad FROM productos WHERE id=?", (producto_id,)).fetchone()
+                if r is None:
+                    raise StockInsuficiente(producto_id, 0)
+                disponible = r[1] - self._reservado.get(producto_id, 0)
+                if disponible < cant:
+                    raise StockInsuficiente(r[0], max(disponible, 0))
+            self._reservar(lineas, 1)
+            self._diario.write(json.dumps(venta, ensure_ascii=False) + "\n")
+            self._diario.flush()
+            if FSYNC_DIARIO:
+                os.fsync(self._diario.fileno())
+            self._pendientes += 1
+        self._cola.put(venta)
+        return venta["token"]
+
+    def pendientes(self):
+        return self._pendientes
+
+    def vaciar(self):
+        # Espera a que se escriba todo lo encolado hasta ahora
+        self._cola.join()
+
+    def cerrar(self):
+        with self._bloqueo:
+            self._cerrada = True
+        self._cola.put(None)
+        self._hilo.join()
+        self._diario.close()
+        if self._pendientes == 0 and os.path.exists(self._ruta_diario):
+            os.remove(self._ruta_diario)
+        self._lector.close()
+        self._escritor.close()
+
+    def _reservar(self, lineas, signo):
+        # Con self._bloqueo tomado, o antes de arrancar el hilo escritor
+        for producto_id, cant in _por_producto(lineas).items():
+            restante = self._reservado.get(producto_id, 0) + signo * cant
+            if restante > 0:
+                self._reservado[producto_id] = restante
+            else:
+                self._reservado.pop(producto_id, None)
+
+    # --- Hilo escritor ---
+    def _escribir(self):
+        while True:
+            grupo = [self._cola.get()]
+            while grupo[-1] is not None and len(grupo) < LOTE_MAX:
+                try:
+                    grupo.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            ventas = [v for v in grupo if v is not None]
+            if ventas:
+                self._escribir_grupo(ventas)
+            for _ in grupo:
+                self._cola.task_done()
+            if grupo[-1] is None:
+                return
+
+    def _escribir_grupo(self, ventas):
+        resultados = self._escribir_ventas(ventas)
+        # Las que fallaron siguen reservadas y en el diario: se escriben en el próximo arranque
+        terminadas = [venta for venta, _, error in resultados if _terminada(error)]
+        if terminadas:
+            with self._bloqueo:
+                for venta in terminadas:
+                    self._reservar(venta["lineas"], -1)
+                self._pendientes -= len(terminadas)
+                # Todo lo anotado ya está en la base: el diario vuelve a empezar
+                if self._pendientes == 0:
+                    self._diario.truncate(0)
+            # Una caja abierta semanas sigue guardando instantáneas de stock
+            try:
+                instantanea_si_hace_falta(self._escritor)
+            except sqlite3.OperationalError:
+                pass
+        if self.al_terminar:
+            for venta, recibo_id, error in resultados:
+                self.al_terminar(venta, recibo_id, error)
+
+    def _escribir_ventas(self, ventas):
+        # [(venta, recibo_id, error)]: todo el grupo en una transacción y, si falla,
+        # una transacción por venta para aislar la que da el error
+        try:
+            return con_reintentos(self._escritor, self._transaccion_grupo, ventas)
+        except Exception as e:
+            if len(ventas) == 1:
+                return [(ventas[0], None, e)]
+        resultados = []
+        for venta in ventas:
+            try:
+                resultados.extend(con_reintentos(self._escritor, self._transaccion_grupo, [venta]))
+            except Exception as e:
+                resultados.append((venta, None, e))
+        return resultados
+
+    def _transaccion_grupo(self, ventas):
+        cursor = self._escritor.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        resultados = []
+        try:
+            for venta in ventas:
+                cursor.execute("SAVEPOINT venta")
+                try:
+                    recibo_id = escribir_venta(cursor, venta["lineas"], venta["fecha"], venta["cliente_nombre"],
+                                               venta["cliente_ci"], venta["cliente_dir"], venta["usuario_id"],
+                                               venta["token"])
+                    resultados.append((venta, recibo_id, None))
+                except StockInsuficiente as e:
+                    cursor.execute("ROLLBACK TO venta")
+                    resultados.append((venta, None, e))
+                except sqlite3.IntegrityError:
+                    # El token ya está en recibos: la venta se escribió antes
+                    cursor.execute("ROLLBACK TO venta")
+                    recibo = cursor.execute("SELECT id FROM recibos WHERE token = ?", (venta["token"],)).fetchone()
+                    if recibo is None:
+                        raise
+                    resultados.append((venta, recibo[0], None))
+                cursor.execute("RELEASE venta")
+            self._escritor.commit()
+        except Exception:
+            self._escritor.rollback()
+            raise
+        return resultados
+
+    # --- Arranque ---
+    def _recuperar(self):
+        # ([(venta, recibo_id, error)], [ventas a reintentar]) de lo que quedó en el diario
+        # sin escribir. En la primera lista van las escritas, las rechazadas por falta de
+        # stock y las apartadas en ruta_rechazadas tras INTENTOS_MAX arranques fallidos.
+        if not os.path.exists(self._ruta_diario):
+            return [], []
+        ventas = []
+        resultados = []
+        with open(self._ruta_diario, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    venta = json.loads(linea)
+                except ValueError:
+                    # Última línea a medio escribir cuando se cortó el programa
+                    continue
+                if isinstance(venta, dict) and isinstance(venta.get("token"), str):
+                    ventas.append(venta)
+                else:
+                    error = ValueError("Línea del diario sin token de venta")
+                    self._apartar(venta, error)
+                    resultados.append((venta, None, error))
+        ventas = [v for v in ventas if self._escritor.execute("SELECT 1 FROM recibos WHERE token = ?",
+                                                              (v["token"],)).fetchone() is None]
+        reintentar = []
+        for venta, recibo_id, error in self._escribir_ventas(ventas) if ventas else []:
+            if _terminada(error):
+                resultados.append((venta, recibo_id, error))
+                continue
+            venta["intentos"] = venta.get("intentos", 0) + 1
+            if venta["intentos"] >= INTENTOS_MAX:
+                self._apartar(venta, error)
+                resultados.append((venta, None, error))
+            else:
+                reintentar.append(venta)
+        if reintentar:
+            # El diario se reescribe con los intentos sumados; os.replace no deja uno a medias
+            temporal = self._ruta_diario + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                for venta in reintentar:
+                    f.write(json.dumps(venta, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, self._ruta_diario)
+        else:
+            os.remove(self._ruta_diario)
+        return resultados, reintentar
+
+    def _apartar(self, venta, error):
+        registro = {"fecha": datetime.now().strftime(FORMATO_FECHA), "error": f"{type(error).__name__}: {error}",
+                    "venta": venta}
+        with open(self.ruta_rechazadas, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def _por_producto(lineas):
+    por_producto = {}
+    for producto_id, cant, _ in lineas:
+        por_producto[producto_id] = por_producto.get(producto_id, 0) + cant
+    return por_producto
+
+def _terminada(error):
+    # Escrita, o rechazada por falta de stock: ya no hay que volver a intentarla
+    return error is None or isinstance(error, StockInsuficiente)
@@ -0,0 +1,40 @@
+import random
+import sqlite3
+import time
+
+import perfilado
+
+# Varias cajas comparten el mismo archivo: con WAL los lectores no bloquean al
+# escritor ni al revés. synchronous=NORMAL en WAL no corrompe la base; ante un
+# corte de luz se pueden perder solo las últimas transacciones confirmadas.
+BUSY_TIMEOUT_MS = 5000
+REINTENTOS = 5
+ESPERA_INICIAL = 0.05
+
+def abrir_conexion(ruta, solo_lectura=False, check_same_thread=True):
+    conn = sqlite3.connect(ruta, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=check_same_thread,
+                           factory=perfilado.fabrica_conexion())
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    if solo_lectura:
+        conn.execute("PRAGMA query_only = 1")
+    else:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+def es_bloqueo(error):
+    mensaje = str(error).lower()
+    return "locked" in mensaje or "busy" in mensaje
+
+def con_reintentos(conn, funcion, *args, reintentos=REINTENTOS, espera=ESPERA_INICIAL, **kwargs):
+    # Repite una escritura si la base sigue ocupada después de busy_timeout,
+    # esperando cada vez el doble (con algo de azar para no chocar otra vez).
+    for intento in range(reintentos + 1):
+        try:
+            return funcion(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not es_bloqueo(e) or intento == reintentos:
+                raise
+            if conn.in_transaction:
+                conn.rollback()
+            time.sleep(espera * (2 ** intento) * random.uniform(0.5, 1.5))
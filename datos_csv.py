@@ -0,0 +1,276 @@
+# Importación y exportación masiva en CSV (también .xlsx si está openpyxl).
+#   python datos_csv.py importar catalogo.csv [--stock] [--db ruta.db]
+# Al actualizar un producto que ya existe (mismo código) no se toca su stock, salvo
+# con --stock (actualizar_stock=True): entonces la cantidad del archivo lo reemplaza.
+# Rendimiento medido con 200.000 filas nuevas: unas 20.000 filas/s, cinco veces por
+# debajo del objetivo de 100.000 (las 77.000 que se midieron al principio eran sin
+# el diario de sincronización ni el libro de movimientos). Por cada 200.000 filas:
+# leer y validar ~1 s, el upsert con los índices de productos ~3 s, el libro de
+# movimientos (triggers fila a fila) ~1 s, el diario (un INSERT…SELECT por lote,
+# anotar_carga_productos) ~2,5 s y rehacer el índice de búsqueda ~1,5 s.
+#   python datos_csv.py exportar productos|ventas salida.csv [--db ruta.db]
+import csv
+import math
+import os
+import sys
+
+from conexion import abrir_conexion
+from inventario import (
+    DB_PATH, a_centavos, consulta_ventas, inicializar_base, reactivar_triggers_catalogo, suspender_triggers_catalogo,
+)
+from movimientos_stock import fijar_motivo, limpiar_motivo
+from sincronizacion import anotar_carga_productos
+
+LOTE = 10000
+ENTERO_MAXIMO = 2 ** 63 - 1  # lo que cabe en un INTEGER de SQLite
+MONEDAS = ("USD", "CUP")
+COLUMNAS_PRODUCTOS = ("codigo", "nombre", "cantidad", "precio", "moneda", "stock_minimo", "imagen")
+COLUMNAS_VENTAS = ("id", "producto", "cantidad", "total", "fecha", "cliente_nombre", "cliente_ci", "cliente_dir", "vendedor")
+
+# Cada lote se copia primero a temp.importacion_lote y entra con un solo INSERT…SELECT,
+# en el orden del archivo (un código repetido se actualiza como si viniera en otra fila)
+COLUMNAS_LOTE = "codigo, nombre, cantidad, precio_centavos, moneda, stock_minimo, imagen"
+SQL_UPSERT_PRODUCTO = f"""
+INSERT INTO productos ({COLUMNAS_LOTE})
+SELECT {COLUMNAS_LOTE} FROM temp.importacion_lote WHERE true ORDER BY rowid
+ON CONFLICT(codigo) DO UPDATE SET
+    nombre = excluded.nombre,
+    precio_centavos = excluded.precio_centavos,
+    moneda = excluded.moneda,
+    stock_minimo = excluded.stock_minimo,
+    imagen = excluded.imagen
+"""
+# Con actualizar_stock: la cantidad del archivo reemplaza el stock de los que ya existen
+SQL_UPSERT_PRODUCTO_CON_STOCK = f"""
+INSERT INTO productos ({COLUMNAS_LOTE})
+SELECT {COLUMNAS_LOTE} FROM temp.importacion_lote WHERE true ORDER BY rowid
+ON CONFLICT(codigo) DO UPDATE SET
+    nombre = excluded.nombre,
+    cantidad = excluded.cantidad,
+    precio_centavos = excluded.precio_centavos,
+    moneda = excluded.moneda,
+    stock_minimo = excluded.stock_minimo,
+    imagen = excluded.imagen
+"""
+
+def _filas_csv(archivo):
+    # utf-8-sig quita el BOM que pone Excel; el separador (, o ;) se detecta solo
+    with open(archivo, newline="", encoding="utf-8-sig") as fh:
+        muestra = fh.read(4096)
+        fh.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.reader(fh, dialecto)
+        cabecera = next(lector, None)
+        if cabecera is None:
+            return
+        yield [c.strip().lower() for c in cabecera]
+        yield from lector
+
+def _filas_xlsx(archivo):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Para importar .xlsx hace falta instalar openpyxl (o guardar el archivo como CSV)")
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        cabecera = next(filas, None)
+        if cabecera is None:
+            return
+        yield [str(c or "").strip().lower() for c in cabecera]
+        for fila in filas:
+            yield ["" if v is None else str(v) for v in fila]
+    finally:
+        libro.close()
+
+def leer_filas(archivo):
+    if os.path.splitext(archivo)[1].lower() in (".xlsx", ".xlsm"):
+        return _filas_xlsx(archivo)
+    return _filas_csv(archivo)
+
+def validar_producto(campos):
+    # Devuelve la fila para temp.importacion_lote o lanza ValueError con el motivo
+    codigo, nombre, cantidad, precio, moneda, stock_minimo, imagen = campos
+    codigo = codigo.strip()
+    nombre = nombre.strip()
+    if not codigo:
+        raise ValueError("falta el código")
+    if not nombre:
+        raise ValueError("falta el nombre")
+    try:
+        cantidad = int(cantidad)
+    except ValueError:
+        raise ValueError(f"cantidad no numérica: {cantidad!r}")
+    try:
+        precio = float(precio)
+    except ValueError:
+        try:
+            # Excel en español guarda los decimales con coma
+            precio = float(precio.replace(",", "."))
+        except ValueError:
+            raise ValueError(f"precio no numérico: {precio!r}")
+    if not math.isfinite(precio):
+        raise ValueError(f"precio no válido: {precio!r}")
+    moneda = moneda.strip().upper()
+    if moneda not in MONEDAS:
+        raise ValueError(f"moneda inválida: {moneda!r}")
+    try:
+        stock_minimo = int(stock_minimo) if stock_minimo else 5
+    except ValueError:
+        raise ValueError(f"stock mínimo no numérico: {stock_minimo!r}")
+    if cantidad < 0 or precio < 0 or stock_minimo < 0:
+        raise ValueError("cantidad, precio y stock mínimo no pueden ser negativos")
+    if max(cantidad, precio * 100, stock_minimo) > ENTERO_MAXIMO:
+        raise ValueError("cantidad, precio o stock mínimo demasiado grande")
+    return (codigo, nombre, cantidad, a_centavos(precio), moneda, stock_minimo, imagen.strip())
+
+def importar_productos(conn, archivo, progreso=None, actualizar_stock=False):
+    # Inserta o actualiza (por código) en transacciones de LOTE filas. Los productos
+    # que ya existen conservan su stock salvo con actualizar_stock.
+    # Devuelve (filas_importadas, [(línea, motivo), ...]).
+    filas = leer_filas(archivo)
+    cabecera = next(filas, None)
+    if cabecera is None:
+        return 0, []
+    faltan = [c for c in ("codigo", "nombre", "cantidad", "precio", "moneda") if c not in cabecera]
+    if faltan:
+        raise ValueError(f"Faltan columnas en el archivo: {', '.join(faltan)}")
+    posiciones = [cabecera.index(c) if c in cabecera else None for c in COLUMNAS_PRODUCTOS]
+
+    # Las columnas opcionales que no vienen en el archivo se leen de una celda vacía extra
+    vacia = len(cabecera)
+    posiciones = [vacia if i is None else i for i in posiciones]
+    relleno = [""] * (vacia + 1)
+
+    sql = SQL_UPSERT_PRODUCTO_CON_STOCK if actualizar_stock else SQL_UPSERT_PRODUCTO
+    _crear_tablas_lote(conn)
+    importadas = 0
+    rechazadas = []
+    lote = []
+    suspendido = False
+    try:
+        for linea, fila in enumerate(filas, start=2):
+            if len(fila) <= vacia:
+                if not any(fila):
+                    continue
+                fila = fila + relleno[len(fila):]
+            try:
+                lote.append(validar_producto([fila[i] for i in posiciones]))
+            except ValueError as e:
+                rechazadas.append((linea, str(e)))
+                continue
+            if len(lote) >= LOTE:
+                # Más de un lote: sale más barato rehacer el índice de búsqueda al final
+                if not suspendido:
+                    suspender_triggers_catalogo(conn)
+                    suspendido = True
+                _guardar_lote(conn, sql, lote)
+                importadas += len(lote)
+                lote = []
+                if progreso:
+                    progreso(importadas, len(rechazadas))
+        if lote:
+            _guardar_lote(conn, sql, lote)
+            importadas += len(lote)
+    finally:
+        if suspendido:
+            reactivar_triggers_catalogo(conn)
+    if progreso:
+        progreso(importadas, len(rechazadas))
+    return importadas, rechazadas
+
+def _crear_tablas_lote(conn):
+    # importacion_antes copia las columnas de productos, que cambian con las migraciones
+    conn.execute("DROP TABLE IF EXISTS temp.importacion_antes")
+    conn.execute("CREATE TEMP TABLE importacion_antes AS SELECT * FROM productos WHERE 0")
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS importacion_lote ({COLUMNAS_LOTE})")
+    conn.commit()
+
+def _guardar_lote(conn, sql, lote):
+    # Los triggers del diario de sincronización quedan callados (aplicando = 1) y
+    # anotar_carga_productos escribe sus anotaciones de todo el lote de una vez: el
+    # UPDATE de sync_estado va en la misma transacción, así ninguna otra conexión
+    # escribe sin diario. El libro de movimientos sí se anota fila a fila.
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM temp.importacion_lote")
+        cursor.executemany(f"INSERT INTO temp.importacion_lote VALUES ({', '.join('?' * 7)})", lote)
+        cursor.execute("DELETE FROM temp.importacion_antes")
+        cursor.execute("INSERT INTO temp.importacion_antes SELECT * FROM productos "
+                       "WHERE codigo IN (SELECT codigo FROM temp.importacion_lote)")
+        fijar_motivo(cursor, "importacion")
+        cursor.execute("UPDATE sync_estado SET aplicando = 1 WHERE id = 1")
+        cursor.execute(sql)
+        cursor.execute("UPDATE sync_estado SET aplicando = 0 WHERE id = 1")
+        anotar_carga_productos(cursor, "temp.importacion_lote", "temp.importacion_antes")
+        limpiar_motivo(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def guardar_rechazadas(archivo, rechazadas):
+    with open(archivo, "w", newline="", encoding="utf-8-sig") as fh:
+        escritor = csv.writer(fh)
+        escritor.writerow(("linea", "motivo"))
+        escritor.writerows(rechazadas)
+
+def _exportar(cursor, destino, cabecera):
+    with open(destino, "w", newline="", encoding="utf-8-sig") as fh:
+        escritor = csv.writer(fh)
+        escritor.writerow(cabecera)
+        total = 0
+        while True:
+            filas = cursor.fetchmany(LOTE)
+            if not filas:
+                return total
+            escritor.writerows(filas)
+            total += len(filas)
+
+def exportar_productos(conn, destino):
+    cursor = conn.cursor()
+    cursor.execute("SELECT codigo, nombre, cantidad, precio_centavos / 100.0, moneda, stock_minimo, imagen "
+                   "FROM productos ORDER BY id")
+    return _exportar(cursor, destino, COLUMNAS_PRODUCTOS)
+
+def exportar_ventas(conn, destino, producto="", desde="", hasta="", **filtros):
+    # filtros: los demás de consulta_ventas (moneda, vendedor, cliente_ci, orden...)
+    query, params = consulta_ventas(conn, producto, desde, hasta, **filtros)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    return _exportar(cursor, destino, COLUMNAS_VENTAS)
+
+if __name__ == "__main__":
+    import time
+
+    args = sys.argv[1:]
+    ruta = DB_PATH
+    if "--db" in args:
+        i = args.index("--db")
+        ruta = args[i + 1]
+        del args[i:i + 2]
+    actualizar_stock = "--stock" in args
+    if actualizar_stock:
+        args.remove("--stock")
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    inicio = time.perf_counter()
+    if len(args) == 2 and args[0] == "importar":
+        importadas, rechazadas = importar_productos(conn, args[1], actualizar_stock=actualizar_stock)
+        duracion = time.perf_counter() - inicio
+        print(f"{importadas} productos importados, {len(rechazadas)} rechazados "
+              f"({importadas / max(duracion, 1e-9):.0f} filas/s)")
+        for linea, motivo in rechazadas[:20]:
+            print(f"  línea {linea}: {motivo}")
+    elif len(args) == 3 and args[0] == "exportar" and args[1] in ("productos", "ventas"):
+        exportar = exportar_productos if args[1] == "productos" else exportar_ventas
+        total = exportar(conn, args[2])
+        duracion = time.perf_counter() - inicio
+        print(f"{total} filas exportadas ({total / max(duracion, 1e-9):.0f} filas/s)")
+    else:
+        print("Uso: python datos_csv.py importar archivo.csv|xlsx [--stock] [--db ruta.db]")
+        print("     python datos_csv.py exportar productos|ventas salida.csv [--db ruta.db]")
+        sys.exit(1)
@@ -0,0 +1,715 @@
+# Núcleo de inventario y ventas, sin dependencias de Tk.
+# programa.py (la interfaz), los scripts y las pruebas de carga usan estas funciones;
+# todas reciben la conexión con la que trabajar.
+import sqlite3
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from archivado import INDICES_VENTAS, adjuntar_para, segmentos_ventas
+from conexion import abrir_conexion, con_reintentos
+from migraciones import FORMATO_FECHA, migrar
+from movimientos_stock import crear_movimientos_stock, fijar_motivo, instantanea_si_hace_falta, limpiar_motivo
+from sincronizacion import crear_diario_cambios
+
+DB_PATH = "inventario_cuba.db"
+
+PRODUCTOS_POR_PAGINA = 100
+VENTAS_POR_PAGINA = 200
+
+# Se pone en False si esta versión de SQLite no trae FTS5 con trigramas
+FTS_DISPONIBLE = True
+
+# --- ESQUEMA ---
+def inicializar_base(conn):
+    global FTS_DISPONIBLE
+    cursor = conn.cursor()
+
+    # Tablas y columnas: migraciones numeradas (PRAGMA user_version)
+    migrar(conn)
+
+    FTS_DISPONIBLE = crear_indice_busqueda(conn)
+    crear_resumenes_ventas(conn)
+
+    crear_version_catalogo(conn)
+    crear_diario_cambios(conn)
+    crear_movimientos_stock(conn)
+
+    # El historial se recorre por (columna, id); el rowid va implícito al final de cada
+    # índice, así que ventas(fecha) ya ordena por los dos y lo mismo el resto.
+    for nombre, columnas in INDICES_VENTAS:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON ventas({columnas})")
+    # Orden por columna en la lista de productos, y el filtro por rango de cantidad
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_cantidad ON productos(cantidad)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_precio ON productos(precio_centavos)")
+
+    # Índice parcial con solo los productos en o por debajo del stock mínimo; SQLite
+    # lo mantiene al vender o editar, y la alerta del menú no recorre todo el catálogo.
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_productos_stock_bajo
+    ON productos(cantidad - stock_minimo, id) WHERE cantidad <= stock_minimo
+    """)
+
+    # Crear usuario admin por defecto si no existe
+    cursor.execute("SELECT * FROM usuarios WHERE usuario='admin'")
+    if not cursor.fetchone():
+        cursor.execute("INSERT INTO usuarios (usuario, password, rol) VALUES (?, ?, ?)", ("admin", "admin123", "admin"))
+
+    # Crear config tipo cambio si no existe
+    cursor.execute("SELECT * FROM configuracion")
+    if not cursor.fetchone():
+        cursor.execute("INSERT INTO configuracion (tipo_cambio) VALUES (?)", (24.0,))
+    cursor.execute("SELECT 1 FROM tipos_cambio LIMIT 1")
+    if not cursor.fetchone():
+        # Valor por defecto de una base nueva: fuera del diario de cambios, para que al
+        # sincronizar no pise la historia de las otras tiendas
+        cursor.execute("UPDATE sync_estado SET aplicando = 1 WHERE id = 1")
+        cursor.execute("INSERT INTO tipos_cambio (desde, tasa) SELECT '0001-01-01 00:00:00', tipo_cambio FROM configuracion LIMIT 1")
+        cursor.execute("UPDATE sync_estado SET aplicando = 0 WHERE id = 1")
+
+    conn.commit()
+    instantanea_si_hace_falta(conn)
+
+# Índice de texto completo (trigramas) sobre productos.nombre, mantenido por triggers.
+# Si la versión de SQLite no trae FTS5 con trigramas se sigue usando LIKE.
+def crear_indice_busqueda(conn, reconstruir=False):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name='productos_fts'")
+    existia = cursor.fetchone() is not None
+    # Índice sin sus triggers: una importación se cortó con ellos quitados y el
+    # índice no vio los productos que entraron desde entonces
+    if existia and _faltan_triggers(conn, TRIGGERS_BUSQUEDA):
+        reconstruir = True
+    try:
+        cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts
+        USING fts5(nombre, content='productos', content_rowid='id', tokenize='trigram')
+        """)
+    except sqlite3.OperationalError:
+        return False
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+        INSERT INTO productos_fts(rowid, nombre) VALUES (new.id, new.nombre);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+        INSERT INTO productos_fts(productos_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE OF nombre ON productos BEGIN
+        INSERT INTO productos_fts(productos_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre);
+        INSERT INTO productos_fts(rowid, nombre) VALUES (new.id, new.nombre);
+    END
+    """)
+    if reconstruir or not existia:
+        # No con 'rebuild': ese lee productos por idx_productos_nombre, en orden de
+        # nombre, y con un catálogo grande tarda el triple que cargarlo por id
+        cursor.execute("INSERT INTO productos_fts(productos_fts) VALUES ('delete-all')")
+        cursor.execute("INSERT INTO productos_fts(rowid, nombre) SELECT id, nombre FROM productos NOT INDEXED ORDER BY id")
+    return True
+
+# Contador de cambios del catálogo (nombre, precio, moneda, imagen, altas y bajas).
+# Lo leen las cachés en memoria para saber si tienen que recargarse.
+def crear_version_catalogo(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS catalogo_version (
+        id INTEGER PRIMARY KEY CHECK(id = 1),
+        version INTEGER
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO catalogo_version (id, version) VALUES (1, 0)")
+    if _faltan_triggers(conn, TRIGGERS_VERSION):
+        # Base nueva o importación cortada: las cachés tienen que recargarse
+        cursor.execute("UPDATE catalogo_version SET version = version + 1 WHERE id = 1")
+    for trigger, evento in (("productos_version_ai", "INSERT"), ("productos_version_ad", "DELETE"),
+                            ("productos_version_au", "UPDATE OF nombre, precio_centavos, moneda, imagen")):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {evento} ON productos BEGIN
+            UPDATE catalogo_version SET version = version + 1 WHERE id = 1;
+        END
+        """)
+
+# Para cargas masivas: mantener el índice y el contador fila a fila es mucho más
+# lento que rehacerlos al final, así que se quitan los triggers mientras dura la carga.
+# Si el programa se corta antes de reactivarlos, inicializar_base ve que faltan y
+# los vuelve a crear rehaciendo el índice y subiendo la versión.
+TRIGGERS_BUSQUEDA = ("productos_fts_ai", "productos_fts_ad", "productos_fts_au")
+TRIGGERS_VERSION = ("productos_version_ai", "productos_version_ad", "productos_version_au")
+TRIGGERS_CATALOGO = TRIGGERS_BUSQUEDA + TRIGGERS_VERSION
+
+def _faltan_triggers(conn, nombres):
+    marcas = ", ".join("?" * len(nombres))
+    existen = conn.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({marcas})",
+                           nombres).fetchone()[0]
+    return existen < len(nombres)
+
+def suspender_triggers_catalogo(conn):
+    for trigger in TRIGGERS_CATALOGO:
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.commit()
+
+def reactivar_triggers_catalogo(conn):
+    if FTS_DISPONIBLE:
+        crear_indice_busqueda(conn, reconstruir=True)
+    # Al volver a crear sus triggers sube la versión del catálogo
+    crear_version_catalogo(conn)
+    conn.commit()
+
+# Resúmenes de ventas por día y por mes (producto, vendedor y moneda).
+# Los mantiene un trigger sobre ventas, así se actualizan en la misma
+# transacción que la venta y los reportes no recorren toda la tabla.
+def crear_resumenes_ventas(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name='ventas_resumen_dia'")
+    existia = cursor.fetchone() is not None
+    for tabla, periodo in (("ventas_resumen_dia", "dia"), ("ventas_resumen_mes", "mes")):
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabla} (
+            {periodo} TEXT,
+            producto_id INTEGER,
+            usuario_id INTEGER,
+            moneda TEXT,
+            num_ventas INTEGER,
+            unidades INTEGER,
+            total_centavos INTEGER,
+            PRIMARY KEY ({periodo}, producto_id, usuario_id, moneda)
+        )
+        """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS ventas_resumen_ai AFTER INSERT ON ventas BEGIN
+        INSERT INTO ventas_resumen_dia (dia, producto_id, usuario_id, moneda, num_ventas, unidades, total_centavos)
+        VALUES (substr(new.fecha, 1, 10), COALESCE(new.producto_id, 0), COALESCE(new.usuario_id, 0),
+                COALESCE(new.moneda, ''), 1, new.cantidad, new.total_centavos)
+        ON CONFLICT (dia, producto_id, usuario_id, moneda) DO UPDATE SET
+            num_ventas = num_ventas + 1,
+            unidades = unidades + excluded.unidades,
+            total_centavos = total_centavos + excluded.total_centavos;
+        INSERT INTO ventas_resumen_mes (mes, producto_id, usuario_id, moneda, num_ventas, unidades, total_centavos)
+        VALUES (substr(new.fecha, 1, 7), COALESCE(new.producto_id, 0), COALESCE(new.usuario_id, 0),
+                COALESCE(new.moneda, ''), 1, new.cantidad, new.total_centavos)
+        ON CONFLICT (mes, producto_id, usuario_id, moneda) DO UPDATE SET
+            num_ventas = num_ventas + 1,
+            unidades = unidades + excluded.unidades,
+            total_centavos = total_centavos + excluded.total_centavos;
+    END
+    """)
+    if not existia:
+        reconstruir_resumenes_ventas(conn)
+
+def reconstruir_resumenes_ventas(conn):
+    # Incluye las ventas archivadas: los resúmenes cubren todo el historial
+    cursor = conn.cursor()
+    todas = " UNION ALL ".join(f"SELECT fecha, producto_id, usuario_id, moneda, cantidad, total_centavos FROM {esquema}.ventas"
+                               for esquema in segmentos_ventas(conn))
+    for tabla, periodo, largo in (("ventas_resumen_dia", "dia", 10), ("ventas_resumen_mes", "mes", 7)):
+        cursor.execute(f"DELETE FROM {tabla}")
+        cursor.execute(f"""
+        INSERT INTO {tabla} ({periodo}, producto_id, usuario_id, moneda, num_ventas, unidades, total_centavos)
+        SELECT substr(v.fecha, 1, {largo}), COALESCE(v.producto_id, 0), COALESCE(v.usuario_id, 0),
+               COALESCE(v.moneda, ''), COUNT(*), SUM(v.cantidad), SUM(v.total_centavos)
+        FROM ({todas}) v
+        GROUP BY 1, 2, 3, 4
+        """)
+
+# --- USUARIOS Y CONFIGURACIÓN ---
+def autenticar(conn, usuario, password):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, usuario, rol FROM usuarios WHERE usuario=? AND password=?", (usuario, password))
+    r = cursor.fetchone()
+    return {"id": r[0], "usuario": r[1], "rol": r[2]} if r else None
+
+def nombres_usuarios(conn):
+    return [r[0] for r in conn.execute("SELECT usuario FROM usuarios ORDER BY usuario")]
+
+# Tipo de cambio (CUP por USD). Cada tasa se guarda en tipos_cambio con la fecha
+# desde la que rige; la vigente se guarda en memoria y get_tipo_cambio solo vuelve
+# a leerla si alguien escribió en la base desde entonces: otra conexión (PRAGMA
+# data_version) o la misma (total_changes).
+_tipo_cambio = {"tasa": None, "conn": None, "marca": None}
+
+def _marca_escrituras(conn):
+    return conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes
+
+def leer_tipo_cambio(conn):
+    marca = _marca_escrituras(conn)
+    cursor = conn.cursor()
+    cursor.execute("SELECT tasa FROM tipos_cambio ORDER BY desde DESC LIMIT 1")
+    r = cursor.fetchone()
+    _tipo_cambio.update(tasa=r[0] if r else 24.0, conn=conn, marca=marca)
+    return _tipo_cambio["tasa"]
+
+def get_tipo_cambio(conn):
+    if _tipo_cambio["tasa"] is None or _tipo_cambio["conn"] is not conn or \
+            _tipo_cambio["marca"] != _marca_escrituras(conn):
+        return leer_tipo_cambio(conn)
+    return _tipo_cambio["tasa"]
+
+def set_tipo_cambio(conn, nuevo, desde=None):
+    # desde: fecha desde la que rige (ahora si no se indica); una fecha pasada corrige el historial
+    desde = desde or datetime.now().strftime(FORMATO_FECHA)
+    conn.execute("INSERT OR REPLACE INTO tipos_cambio (desde, tasa) VALUES (?, ?)", (desde, nuevo))
+    conn.execute("UPDATE configuracion SET tipo_cambio = (SELECT tasa FROM tipos_cambio ORDER BY desde DESC LIMIT 1)")
+    conn.commit()
+    _tipo_cambio["tasa"] = None
+
+def historial_tipos_cambio(conn, limite=20):
+    cursor = conn.cursor()
+    cursor.execute("SELECT desde, tasa FROM tipos_cambio ORDER BY desde DESC LIMIT ?", (limite,))
+    return cursor.fetchall()
+
+# --- PRODUCTOS ---
+# El dinero se guarda en centavos (enteros); las funciones reciben y devuelven
+# importes normales y la conversión se hace solo aquí.
+def a_centavos(importe):
+    return int((Decimal(str(importe)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def obtener_producto(conn, producto_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT nombre, cantidad, precio_centavos / 100.0, moneda, imagen, stock_minimo FROM productos WHERE id=?",
+                   (producto_id,))
+    return cursor.fetchone()
+
+def agregar_producto(conn, nombre, cantidad, precio, moneda, imagen, stock_minimo):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO productos (nombre, cantidad, precio_centavos, moneda, imagen, stock_minimo) VALUES (?, ?, ?, ?, ?, ?)",
+                   (nombre, cantidad, a_centavos(precio), moneda, imagen, stock_minimo))
+    conn.commit()
+    return cursor.lastrowid
+
+def actualizar_producto(conn, producto_id, nombre, cantidad, precio, moneda, imagen, stock_minimo):
+    conn.execute("""
+        UPDATE productos SET nombre=?, cantidad=?, precio_centavos=?, moneda=?, imagen=?, stock_minimo=? WHERE id=?
+    """, (nombre, cantidad, a_centavos(precio), moneda, imagen, stock_minimo, producto_id))
+    conn.commit()
+
+def eliminar_producto(conn, producto_id):
+    conn.execute("DELETE FROM productos WHERE id=?", (producto_id,))
+    conn.commit()
+
+def productos_para_venta(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, nombre, precio_centavos / 100.0, moneda, imagen FROM productos")
+    return cursor.fetchall()
+
+def version_catalogo(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM catalogo_version WHERE id = 1")
+    r = cursor.fetchone()
+    return r[0] if r else 0
+
+def firma_datos(conn):
+    # Marcas baratas para saber qué cambió: el contador del catálogo (altas, bajas,
+    # ediciones e importaciones), la última venta, el último movimiento de stock
+    # (ventas, reposiciones, ajustes, importaciones y sincronización) y el tipo de cambio
+    ultima_venta = conn.execute("SELECT MAX(id) FROM ventas").fetchone()[0] or 0
+    ultimo_movimiento = conn.execute("SELECT MAX(id) FROM movimientos_stock").fetchone()[0] or 0
+    return {"catalogo": version_catalogo(conn), "ventas": ultima_venta, "stock": ultimo_movimiento,
+            "tipo_cambio": get_tipo_cambio(conn)}
+
+# Columnas por las que se puede ordenar la lista de stock bajo
+ORDEN_STOCK_BAJO = {
+    "nombre": "nombre",
+    "cantidad": "cantidad",
+    "stock_minimo": "stock_minimo",
+    "faltante": "cantidad - stock_minimo",
+}
+
+# La consulta repite la condición del índice parcial idx_productos_stock_bajo y lo
+# nombra con INDEXED BY: si no, al ordenar por nombre o cantidad SQLite prefiere
+# recorrer idx_productos_nombre / idx_productos_cantidad, es decir, todo el catálogo.
+def productos_stock_bajo(conn, orden="faltante", descendente=False, limite=-1, offset=0):
+    cursor = conn.cursor()
+    columna = ORDEN_STOCK_BAJO[orden]
+    sentido = "DESC" if descendente else "ASC"
+    cursor.execute(f"""
+        SELECT id, nombre, cantidad, stock_minimo FROM productos INDEXED BY idx_productos_stock_bajo
+        WHERE cantidad <= stock_minimo
+        ORDER BY {columna} {sentido}, id
+        LIMIT ? OFFSET ?
+    """, (limite, offset))
+    return cursor.fetchall()
+
+def contar_stock_bajo(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM productos WHERE cantidad <= stock_minimo")
+    return cursor.fetchone()[0]
+
+# Columnas por las que se puede ordenar la lista de productos:
+# nombre -> (expresión SQL, posición en la fila)
+ORDEN_PRODUCTOS = {
+    "id": ("p.id", 0),
+    "nombre": ("p.nombre", 1),
+    "cantidad": ("p.cantidad", 2),
+    "precio": ("p.precio_centavos", 3),
+    "stock_minimo": ("p.stock_minimo", 5),
+}
+
+def _clave(fila, orden, columnas):
+    # Clave de paginación de una fila: (valor de la columna de orden, id)
+    expresion, posicion = columnas[orden]
+    valor = fila[posicion]
+    if expresion.endswith("_centavos") and valor is not None:
+        valor = a_centavos(valor)
+    elif expresion.startswith("COALESCE"):
+        valor = valor or ""
+    return (valor, fila[0])
+
+def _tramos_clave(expresion, id_columna, comparacion, valores):
+    # Condiciones para lo que sigue a una clave (valores: [valor, id] o [id]), en el
+    # orden en que se recorren. SQLite ordena los NULL antes que cualquier valor y
+    # (NULL, id) no se puede comparar: las filas sin valor van en su propio tramo, por id.
+    ultimo_id = valores[-1]
+    if expresion == id_columna:
+        return [(f" AND {id_columna} {comparacion} ?", [ultimo_id])]
+    valor = valores[0]
+    nulos = f" AND {expresion} IS NULL"
+    if valor is None:
+        tramos = [(f"{nulos} AND {id_columna} {comparacion} ?", [ultimo_id])]
+        return tramos + [(f" AND {expresion} IS NOT NULL", [])] if comparacion == ">" else tramos
+    tramos = [(f" AND ({expresion}, {id_columna}) {comparacion} (?, ?)", [valor, ultimo_id])]
+    return tramos + [(nulos, [])] if comparacion == "<" else tramos
+
+def _leer_tramos(conn, query, params, tramos, orden, limite):
+    # Una consulta por tramo hasta llenar la página; cada una va por el índice de la columna
+    filas = []
+    for condicion, valores in tramos:
+        filas += conn.execute(query + condicion + orden + " LIMIT ?",
+                              params + valores + [limite - len(filas)]).fetchall()
+        if 0 <= limite <= len(filas):
+            break
+    return filas
+
+def _orden_con_nulos(clave):
+    # Para ordenar claves en Python como SQLite: los NULL antes que cualquier valor
+    return (clave[0] is not None,) + tuple(clave)
+
+def clave_producto(fila, orden="id"):
+    # Con el orden por id la clave es el id solo, como antes de poder ordenar
+    return fila[0] if orden == "id" else _clave(fila, orden, ORDEN_PRODUCTOS)
+
+# Páginas por clave ((columna, id) > última / < primera): el coste de cada página
+# no depende de cuántas filas haya antes. despues_de / antes_de son claves de
+# clave_producto con el mismo orden.
+def consultar_productos_pagina(conn, filtro="", despues_de=None, antes_de=None, limite=PRODUCTOS_POR_PAGINA,
+                               orden="id", descendente=False, cantidad_min=None, cantidad_max=None, moneda=""):
+    # El tokenizador de trigramas necesita al menos 3 caracteres; con menos se usa LIKE
+    if FTS_DISPONIBLE and len(filtro) >= 3:
+        query = """
+        SELECT p.id, p.nombre, p.cantidad, p.precio_centavos / 100.0, p.moneda, p.stock_minimo, p.imagen
+        FROM productos_fts f JOIN productos p ON p.id = f.rowid
+        WHERE productos_fts MATCH ?
+        """
+        params = ['"' + filtro.replace('"', '""') + '"']
+    else:
+        query = """
+        SELECT p.id, p.nombre, p.cantidad, p.precio_centavos / 100.0, p.moneda, p.stock_minimo, p.imagen
+        FROM productos p WHERE p.nombre LIKE ?
+        """
+        params = [f"%{filtro}%"]
+    if cantidad_min is not None:
+        query += " AND p.cantidad >= ?"
+        params.append(cantidad_min)
+    if cantidad_max is not None:
+        query += " AND p.cantidad <= ?"
+        params.append(cantidad_max)
+    if moneda:
+        query += " AND p.moneda = ?"
+        params.append(moneda)
+    expresion = ORDEN_PRODUCTOS[orden][0]
+    # Hacia atrás se recorre en el sentido contrario y se da la vuelta al resultado
+    atras = antes_de is not None
+    clave = antes_de if atras else despues_de
+    tramos = [("", [])]
+    if clave is not None:
+        tramos = _tramos_clave(expresion, "p.id", "<" if descendente != atras else ">",
+                               [clave] if orden == "id" else list(clave))
+    sentido = "DESC" if descendente != atras else "ASC"
+    orden_sql = f" ORDER BY {expresion} {sentido}" + (f", p.id {sentido}" if expresion != "p.id" else "")
+    filas = _leer_tramos(conn, query, params, tramos, orden_sql, limite)
+    return filas[::-1] if atras else filas
+
+# --- VENTAS ---
+class StockInsuficiente(Exception):
+    def __init__(self, nombre, disponible):
+        super().__init__(f"No hay suficiente stock de {nombre}. Disponible: {disponible}")
+        self.nombre = nombre
+        self.disponible = disponible
+
+def registrar_venta(conn, lineas, cliente_nombre, cliente_ci, cliente_dir, usuario_id):
+    # lineas: [(producto_id, cantidad, precio), ...]. Todo el carrito va en una sola
+    # transacción: el stock se descuenta con un UPDATE condicional, así dos cajas no
+    # pueden vender la misma unidad, y si falta stock de una línea no se vende nada.
+    fecha = datetime.now().strftime(FORMATO_FECHA)
+    return con_reintentos(conn, _transaccion_venta, conn, lineas, fecha, cliente_nombre, cliente_ci, cliente_dir,
+                          usuario_id)
+
+def _transaccion_venta(conn, *venta):
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        recibo_id = escribir_venta(cursor, *venta)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return recibo_id
+
+def escribir_venta(cursor, lineas, fecha, cliente_nombre, cliente_ci, cliente_dir, usuario_id, token=None):
+    # Las sentencias de una venta, dentro de una transacción ya abierta (registrar_venta
+    # o un grupo de la cola de ventas). token: identificador de la venta en la cola.
+    por_producto = {}
+    for producto_id, cant, _ in lineas:
+        por_producto[producto_id] = por_producto.get(producto_id, 0) + cant
+    cursor.execute("""
+        INSERT INTO recibos (fecha, cliente_nombre, cliente_ci, cliente_dir, usuario_id, token)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (fecha, cliente_nombre, cliente_ci, cliente_dir, usuario_id, token))
+    recibo_id = cursor.lastrowid
+    # Los movimientos de stock de esta venta quedan anotados con su recibo
+    fijar_motivo(cursor, "venta", recibo_id, usuario_id, fecha)
+    for producto_id, cant in por_producto.items():
+        cursor.execute("UPDATE productos SET cantidad = cantidad - ? WHERE id = ? AND cantidad >= ?",
+                       (cant, producto_id, cant))
+        if cursor.rowcount != 1:
+            cursor.execute("SELECT nombre, cantidad FROM productos WHERE id=?", (producto_id,))
+            r = cursor.fetchone()
+            raise StockInsuficiente(r[0], r[1]) if r else StockInsuficiente(producto_id, 0)
+    limpiar_motivo(cursor)
+    # La moneda de la venta es la del producto en este momento
+    cursor.executemany("""
+        INSERT INTO ventas (producto_id, cantidad, total_centavos, moneda, fecha, cliente_nombre, cliente_ci, cliente_dir,
+                            usuario_id, recibo_id)
+        SELECT id, ?, ?, moneda, ?, ?, ?, ?, ?, ? FROM productos WHERE id = ?
+    """, [(cant, cant * a_centavos(precio), fecha, cliente_nombre, cliente_ci, cliente_dir, usuario_id, recibo_id, producto_id)
+          for producto_id, cant, precio in lineas])
+    return recibo_id
+
+# Columnas por las que se puede ordenar el historial: nombre -> (expresión SQL,
+# posición en la fila). Cada una tiene su índice en INDICES_VENTAS.
+ORDEN_VENTAS = {
+    "fecha": ("v.fecha", 4),
+    "id": ("v.id", 0),
+    "cantidad": ("v.cantidad", 2),
+    "total": ("v.total_centavos", 3),
+    "ci": ("COALESCE(v.cliente_ci, '')", 6),
+}
+
+def clave_venta(fila, orden="fecha"):
+    return _clave(fila, orden, ORDEN_VENTAS)
+
+def _consulta_ventas_base(producto, desde, hasta, completa=False, esquema="main", moneda="", vendedor="",
+                          cliente_ci="", orden="fecha"):
+    query = f"""
+    SELECT v.id, p.nombre, v.cantidad, v.total_centavos / 100.0, v.fecha, v.cliente_nombre, v.cliente_ci, v.cliente_dir, u.usuario
+    FROM {esquema}.ventas v
+    JOIN productos p ON v.producto_id = p.id
+    JOIN usuarios u ON v.usuario_id = u.id
+    WHERE 1=1
+    """
+    params = []
+
+    if producto and completa:
+        # Para leerlo todo (exportaciones) conviene ir por idx_ventas_producto y ordenar
+        # al final; para una página, recorrer idx_ventas_fecha y parar al llenarla.
+        query += " AND v.producto_id IN (SELECT id FROM productos WHERE nombre LIKE ?)"
+        params.append(f"%{producto}%")
+    elif producto:
+        query += " AND p.nombre LIKE ?"
+        params.append(f"%{producto}%")
+    if desde:
+        query += " AND v.fecha >= ?"
+        params.append(desde + " 00:00:00")
+    if hasta:
+        query += " AND v.fecha <= ?"
+        params.append(hasta + " 23:59:59")
+    if moneda:
+        query += " AND v.moneda = ?"
+        params.append(moneda)
+    if vendedor:
+        # Por fecha, idx_ventas_vendedor ya da las ventas del vendedor en orden. Una página
+        # por otra columna sale antes recorriendo el índice de esa columna y filtrando que
+        # ordenando todas las del vendedor: el + deja fuera idx_ventas_vendedor.
+        columna = "+v.usuario_id" if not completa and orden != "fecha" else "v.usuario_id"
+        query += f" AND {columna} = (SELECT id FROM usuarios WHERE usuario = ?)"
+        params.append(vendedor)
+    if cliente_ci:
+        query += " AND COALESCE(v.cliente_ci, '') = ?"
+        params.append(cliente_ci)
+    return query, params
+
+def consulta_ventas(conn, producto="", desde="", hasta="", moneda="", vendedor="", cliente_ci="", orden="fecha",
+                    descendente=True):
+    # Si el rango toca años archivados la consulta los nombra (archivo_<año>): quien
+    # la ejecute con otra conexión tiene que llamar antes a adjuntar_para
+    partes = [_consulta_ventas_base(producto, desde, hasta, completa=True, esquema=esquema, moneda=moneda,
+                                    vendedor=vendedor, cliente_ci=cliente_ci)
+              for esquema in segmentos_ventas(conn, desde, hasta)]
+    expresion, posicion = ORDEN_VENTAS[orden]
+    sentido = "DESC" if descendente else "ASC"
+    if len(partes) == 1:
+        query, params = partes[0]
+        return query + f" ORDER BY {expresion} {sentido}, v.id {sentido}", params
+    # Con ORDER BY sobre el UNION ALL, SQLite mezcla las partes ya ordenadas por su índice
+    query = " UNION ALL ".join(q for q, _ in partes) + f" ORDER BY {posicion + 1} {sentido}, 1 {sentido}"
+    return query, [p for _, params in partes for p in params]
+
+def listar_ventas(conn, producto="", desde="", hasta="", despues_de=None, antes_de=None, limite=VENTAS_POR_PAGINA,
+                  moneda="", vendedor="", cliente_ci="", orden="fecha", descendente=True):
+    # Una página del historial, por defecto de la venta más reciente a la más antigua.
+    # despues_de / antes_de: clave (clave_venta, con el mismo orden) de la última /
+    # primera fila ya mostrada; la página se busca por esa clave en el índice de la
+    # columna, sin OFFSET. Con años archivados se pide una página a cada parte y se
+    # queda con las `limite` primeras.
+    expresion = ORDEN_VENTAS[orden][0]
+    atras = antes_de is not None
+    clave = antes_de if atras else despues_de
+    sentido = "DESC" if descendente != atras else "ASC"
+    filas = []
+    for esquema in segmentos_ventas(conn, desde, hasta):
+        query, params = _consulta_ventas_base(producto, desde, hasta, esquema=esquema, moneda=moneda,
+                                              vendedor=vendedor, cliente_ci=cliente_ci, orden=orden)
+        tramos = [("", [])]
+        if clave is not None:
+            tramos = _tramos_clave(expresion, "v.id", "<" if descendente != atras else ">", list(clave))
+        orden_sql = f" ORDER BY {expresion} {sentido}" + (f", v.id {sentido}" if expresion != "v.id" else "")
+        filas += _leer_tramos(conn, query, params, tramos, orden_sql, limite)
+    filas.sort(key=lambda f: _orden_con_nulos(clave_venta(f, orden)), reverse=sentido == "DESC")
+    filas = filas[:limite]
+    return filas[::-1] if atras else filas
+
+# --- REPORTES ---
+def totales_por_moneda(conn, tabla, periodo, valor):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT moneda, SUM(total_centavos) / 100.0 FROM {tabla} WHERE {periodo} = ? GROUP BY moneda", (valor,))
+    return {moneda: total or 0 for moneda, total in cursor.fetchall()}
+
+def totales_dia(conn, dia):
+    return totales_por_moneda(conn, "ventas_resumen_dia", "dia", dia)
+
+def totales_mes(conn, mes):
+    return totales_por_moneda(conn, "ventas_resumen_mes", "mes", mes)
+
+# Totales convertidos a una moneda con la tasa que regía en la fecha de cada venta.
+# Los días sin cambio de tasa salen de ventas_resumen_dia (una tasa para todo el
+# día); solo los días en que cambió la tasa se leen venta por venta, y todo en una
+# sola consulta.
+MONEDAS = ("USD", "CUP")
+
+# Cada tasa rige en [desde, hasta); la primera cubre también lo anterior a ella
+_TRAMOS_TASA = """
+    tramos AS (
+        SELECT CASE WHEN desde = (SELECT MIN(desde) FROM tipos_cambio) THEN '' ELSE desde END AS desde,
+               LEAD(desde, 1, '9999-12-31 23:59:59') OVER (ORDER BY desde) AS hasta, tasa
+        FROM tipos_cambio
+    ),
+    dias_con_cambio AS (SELECT DISTINCT substr(desde, 1, 10) AS dia FROM tramos WHERE desde <> '')"""
+
+def total_en_moneda(conn, desde_dia, hasta_dia, moneda):
+    # Días 'YYYY-MM-DD', ambos incluidos. Las ventas sin moneda conocida se suman tal cual.
+    if moneda not in MONEDAS:
+        raise ValueError(f"Moneda desconocida: {moneda}")
+    por_venta = "".join(f"""
+            UNION ALL
+            SELECT v.moneda, v.total_centavos, t.tasa
+            FROM dias_con_cambio c
+            JOIN {esquema}.ventas v ON v.fecha BETWEEN c.dia || ' 00:00:00' AND c.dia || ' 23:59:59'
+            JOIN tramos t ON v.fecha >= t.desde AND v.fecha < t.hasta
+            WHERE c.dia BETWEEN :desde AND :hasta""" for esquema in segmentos_ventas(conn, desde_dia, hasta_dia))
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        WITH {_TRAMOS_TASA},
+        por_dia AS (
+            SELECT dia, moneda, SUM(total_centavos) AS centavos FROM ventas_resumen_dia
+            WHERE dia BETWEEN :desde AND :hasta AND dia NOT IN (SELECT dia FROM dias_con_cambio)
+            GROUP BY dia, moneda
+        ),
+        partes AS (
+            SELECT d.moneda, d.centavos, t.tasa
+            FROM por_dia d JOIN tramos t ON d.dia || ' 00:00:00' >= t.desde AND d.dia || ' 00:00:00' < t.hasta{por_venta}
+        )
+        SELECT round(SUM(CASE moneda WHEN :moneda THEN centavos
+                                     WHEN 'USD' THEN centavos * tasa
+                                     WHEN 'CUP' THEN centavos / tasa
+                                     ELSE centavos END)) / 100.0
+        FROM partes
+    """, {"desde": desde_dia, "hasta": hasta_dia, "moneda": moneda})
+    return cursor.fetchone()[0] or 0
+
+def total_dia_en(conn, dia, moneda):
+    return total_en_moneda(conn, dia, dia, moneda)
+
+def total_mes_en(conn, mes, moneda):
+    return total_en_moneda(conn, f"{mes}-01", f"{mes}-31", moneda)
+
+# --- EXPORTACIÓN PDF ---
+PDF_FILAS_POR_BLOQUE = 500
+PDF_COLUMNAS = ("ID Venta", "Producto", "Cantidad", "Total", "Fecha", "Cliente", "CI", "Dirección", "Vendedor")
+
+# Lee la consulta por bloques (fetchmany) con su propia conexión, para poder
+# llamarse desde un hilo. reportlab se importa aquí: solo hace falta al exportar.
+def escribir_pdf_ventas(archivo, query, params, progreso=None, cancelado=None, ruta=DB_PATH):
+    from reportlab.pdfgen import canvas as pdf_canvas
+    from reportlab.lib.pagesizes import letter
+
+    conn_pdf = abrir_conexion(ruta, solo_lectura=True)
+    try:
+        adjuntar_para(conn_pdf, query)
+        cur = conn_pdf.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM ({query})", params)
+        total_filas = cur.fetchone()[0]
+
+        c = pdf_canvas.Canvas(archivo, pagesize=letter, pageCompression=1)
+        width, height = letter
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(40, height - 40, "Reporte de Ventas")
+        c.setFont("Helvetica", 10)
+        y = height - 70
+
+        ancho_col = (width - 80) / len(PDF_COLUMNAS)
+        for idx, col in enumerate(PDF_COLUMNAS):
+            c.drawString(40 + idx * ancho_col, y, col)
+        y -= 20
+
+        hechas = 0
+        cur.execute(query, params)
+        while True:
+            filas = cur.fetchmany(PDF_FILAS_POR_BLOQUE)
+            if not filas:
+                break
+            if cancelado is not None and cancelado.is_set():
+                return False
+            for vals in filas:
+                if y < 40:
+                    c.showPage()
+                    c.setFont("Helvetica", 10)
+                    y = height - 40
+                for idx, val in enumerate(vals):
+                    txt = str(val)
+                    if len(txt) > 15:
+                        txt = txt[:12] + "..."
+                    c.drawString(40 + idx * ancho_col, y, txt)
+                y -= 15
+            hechas += len(filas)
+            if progreso:
+                progreso(hechas, total_filas)
+
+        c.save()
+        return True
+    finally:
+        conn_pdf.close()
+
+# python inventario.py --reconstruir-resumenes [ruta.db]
+if __name__ == "__main__":
+    import sys
+    if "--reconstruir-resumenes" in sys.argv:
+        args = [a for a in sys.argv[1:] if not a.startswith("--")]
+        conn = abrir_conexion(args[0] if args else DB_PATH)
+        inicializar_base(conn)
+        reconstruir_resumenes_ventas(conn)
+        conn.commit()
+        print("Resúmenes de ventas reconstruidos")
+    else:
+        print("Uso: python inventario.py --reconstruir-resumenes [ruta.db]")
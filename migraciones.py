@@ -0,0 +1,441 @@
+# Migraciones del esquema, numeradas y registradas en PRAGMA user_version.
+#   python migraciones.py [ruta.db]     muestra la versión y aplica las pendientes
+# inicializar_base las aplica al arrancar. Cada migración trabaja por lotes y se
+# puede retomar si se corta a medias: la versión solo sube cuando termina. Antes de
+# migrar una base con datos se guarda una copia (<ruta>.antes-v<versión>).
+# Los índices, triggers y resúmenes derivados no van aquí: inicializar_base los
+# vuelve a crear (IF NOT EXISTS) después de migrar.
+import sqlite3
+from datetime import datetime, timezone
+
+LOTE = 5000
+
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+# Fechas del diario de cambios: UTC con milésimas, como strftime('%Y-%m-%d %H:%M:%f', 'now')
+FORMATO_FECHA_UTC = "%Y-%m-%d %H:%M:%S.%f"
+GLOB_FECHA = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]"
+FORMATOS_FECHA_ANTIGUOS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d")
+
+def version_esquema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _columnas(conn, tabla):
+    return [c[1] for c in conn.execute(f"PRAGMA table_info({tabla})")]
+
+def _agregar_columna(conn, tabla, definicion):
+    if definicion.split()[0] not in _columnas(conn, tabla):
+        conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {definicion}")
+
+def _quitar_columna(conn, tabla, columna):
+    # DROP COLUMN llegó en SQLite 3.35; con una versión anterior la columna se queda sin usar
+    if columna in _columnas(conn, tabla):
+        try:
+            conn.execute(f"ALTER TABLE {tabla} DROP COLUMN {columna}")
+        except sqlite3.OperationalError:
+            pass
+
+def _por_lotes(conn, tabla, procesar, progreso=None):
+    # procesar(desde, hasta) actualiza las filas con id en (desde, hasta]; un commit por lote
+    maximo = conn.execute(f"SELECT MAX(id) FROM {tabla}").fetchone()[0] or 0
+    desde = 0
+    while desde < maximo:
+        procesar(desde, desde + LOTE)
+        conn.commit()
+        desde += LOTE
+        if progreso:
+            progreso(tabla, min(desde, maximo), maximo)
+
+# --- 1: esquema base ---
+# El que ya creaba inicializar_base. Una base existente recibe las columnas que le
+# falten: la primera versión de productos (inventario.db) no tenía moneda ni stock_minimo.
+def _columnas_productos(conn):
+    _agregar_columna(conn, "productos", "moneda TEXT DEFAULT 'CUP'")
+    _agregar_columna(conn, "productos", "stock_minimo INTEGER DEFAULT 0")
+
+def _esquema_base(conn, progreso):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        usuario TEXT UNIQUE,
+        password TEXT,
+        rol TEXT CHECK(rol IN ('admin','vendedor'))
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS productos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT,
+        cantidad INTEGER,
+        precio REAL,
+        moneda TEXT CHECK(moneda IN ('USD','CUP')),
+        imagen TEXT,
+        stock_minimo INTEGER DEFAULT 5
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS ventas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER,
+        cantidad INTEGER,
+        total REAL,
+        fecha TEXT,
+        cliente_nombre TEXT,
+        cliente_ci TEXT,
+        cliente_dir TEXT,
+        usuario_id INTEGER,
+        FOREIGN KEY(producto_id) REFERENCES productos(id),
+        FOREIGN KEY(usuario_id) REFERENCES usuarios(id)
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS configuracion (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo_cambio REAL
+    )
+    """)
+
+    # Cabecera de venta: un recibo agrupa todas las líneas de un mismo carrito
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS recibos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TEXT,
+        cliente_nombre TEXT,
+        cliente_ci TEXT,
+        cliente_dir TEXT,
+        usuario_id INTEGER,
+        FOREIGN KEY(usuario_id) REFERENCES usuarios(id)
+    )
+    """)
+    _agregar_columna(conn, "ventas", "recibo_id INTEGER REFERENCES recibos(id)")
+    _columnas_productos(conn)
+
+    # Código del producto (SKU del proveedor), clave para la importación masiva
+    _agregar_columna(conn, "productos", "codigo TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_codigo ON productos(codigo)")
+
+# --- 2: fechas ISO ---
+# Todas las fechas quedan como 'YYYY-MM-DD HH:MM:SS': ordenan como texto, así los
+# rangos van por idx_ventas_fecha y substr() da el día o el mes. Lo que no se
+# reconoce como fecha se deja como estaba.
+def normalizar_fecha(texto):
+    if texto is None:
+        return None
+    texto = str(texto).strip()
+    try:
+        fecha = datetime.fromisoformat(texto)
+    except ValueError:
+        fecha = None
+        for formato in FORMATOS_FECHA_ANTIGUOS:
+            try:
+                fecha = datetime.strptime(texto, formato)
+                break
+            except ValueError:
+                pass
+    if fecha is None:
+        return None
+    return fecha.strftime(FORMATO_FECHA)
+
+def _fechas_iso(conn, progreso):
+    for tabla in ("ventas", "recibos"):
+        def procesar(desde, hasta, tabla=tabla):
+            filas = conn.execute(f"SELECT id, fecha FROM {tabla} WHERE id > ? AND id <= ? AND fecha NOT GLOB ?",
+                                 (desde, hasta, GLOB_FECHA)).fetchall()
+            cambios = [(nueva, fila_id) for fila_id, fecha in filas
+                       if (nueva := normalizar_fecha(fecha)) is not None and nueva != fecha]
+            conn.executemany(f"UPDATE {tabla} SET fecha = ? WHERE id = ?", cambios)
+        _por_lotes(conn, tabla, procesar, progreso)
+    # Los resúmenes agrupan por substr(fecha): se rehacen al migrar el dinero (3)
+
+# --- 3: dinero en centavos ---
+# precio y total pasan a enteros en centavos (precio_centavos, total_centavos):
+# las sumas son exactas y no arrastran errores de coma flotante.
+def _dinero_en_centavos(conn, progreso):
+    _agregar_columna(conn, "productos", "precio_centavos INTEGER")
+    _agregar_columna(conn, "ventas", "total_centavos INTEGER")
+    conn.commit()
+    for tabla, vieja, nueva in (("productos", "precio", "precio_centavos"), ("ventas", "total", "total_centavos")):
+        if vieja not in _columnas(conn, tabla):
+            continue
+        def procesar(desde, hasta, tabla=tabla, vieja=vieja, nueva=nueva):
+            conn.execute(f"""
+                UPDATE {tabla} SET {nueva} = CAST(round({vieja} * 100) AS INTEGER)
+                WHERE id > ? AND id <= ? AND {nueva} IS NULL AND {vieja} IS NOT NULL
+            """, (desde, hasta))
+        _por_lotes(conn, tabla, procesar, progreso)
+
+    # Lo que usa las columnas viejas se borra; inicializar_base lo crea de nuevo
+    conn.execute("DROP TRIGGER IF EXISTS productos_version_au")
+    conn.execute("DROP TRIGGER IF EXISTS ventas_resumen_ai")
+    conn.execute("DROP TABLE IF EXISTS ventas_resumen_dia")
+    conn.execute("DROP TABLE IF EXISTS ventas_resumen_mes")
+    _quitar_columna(conn, "productos", "precio")
+    _quitar_columna(conn, "ventas", "total")
+
+# --- 4: moneda de cada venta e historial de tasas ---
+# La venta guarda su moneda (la del producto al venderse) y el tipo de cambio pasa
+# a una tabla con la fecha desde la que rige cada tasa (CUP por USD). La tasa que
+# había en configuracion rige desde siempre.
+def _monedas_y_tasas(conn, progreso):
+    _agregar_columna(conn, "ventas", "moneda TEXT")
+    conn.commit()
+
+    def procesar(desde, hasta):
+        conn.execute("""
+            UPDATE ventas SET moneda = (SELECT p.moneda FROM productos p WHERE p.id = ventas.producto_id)
+            WHERE id > ? AND id <= ? AND moneda IS NULL
+        """, (desde, hasta))
+    _por_lotes(conn, "ventas", procesar, progreso)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS tipos_cambio (
+        desde TEXT PRIMARY KEY,
+        tasa REAL NOT NULL CHECK(tasa > 0)
+    )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO tipos_cambio (desde, tasa)
+        SELECT '0001-01-01 00:00:00', tipo_cambio FROM configuracion WHERE tipo_cambio > 0 LIMIT 1
+    """)
+    # El trigger de resúmenes pasa a usar ventas.moneda
+    conn.execute("DROP TRIGGER IF EXISTS ventas_resumen_ai")
+
+# --- 5: registro de archivos de ventas ---
+# Años de ventas movidos a su propia base (ver archivado.py). archivo es el nombre
+# del fichero, en la misma carpeta que la base principal.
+def _registro_archivos(conn, progreso):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archivos_ventas (
+        anio INTEGER PRIMARY KEY,
+        archivo TEXT NOT NULL,
+        ventas INTEGER,
+        unidades INTEGER,
+        total_centavos INTEGER,
+        desde TEXT,
+        hasta TEXT,
+        archivado TEXT
+    )
+    """)
+
+# --- 6: diario de cambios para sincronizar tiendas ---
+# Cada tienda tiene un origen propio. Los triggers de sincronizacion.py anotan en
+# cambios lo que se hace en productos, ventas y tipos_cambio, numerado por origen
+# (origen_seq). sync_claves guarda el id local de las filas llegadas de otra tienda
+# (un producto unido a otro con el mismo código puede tener varias).
+# Lo que ya había en la base se anota aquí como altas, para que la primera
+# sincronización lo envíe.
+def _diario_cambios(conn, progreso):
+    # Bases que pasaron la 1 sin las columnas de productos: se añaden ahora y las
+    # ventas que quedaron sin moneda toman la del producto
+    if "moneda" not in _columnas(conn, "productos"):
+        _columnas_productos(conn)
+        conn.execute("""
+            UPDATE ventas SET moneda = (SELECT p.moneda FROM productos p WHERE p.id = ventas.producto_id)
+            WHERE moneda IS NULL
+        """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_estado (
+        id INTEGER PRIMARY KEY CHECK(id = 1),
+        origen TEXT NOT NULL,
+        aplicando INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cambios (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        origen TEXT NOT NULL,
+        origen_seq INTEGER NOT NULL,
+        tabla TEXT NOT NULL,
+        clave TEXT NOT NULL,
+        operacion TEXT NOT NULL CHECK(operacion IN ('I','U','S','D')),
+        datos TEXT,
+        fecha TEXT NOT NULL
+    )
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cambios_origen ON cambios(origen, origen_seq)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cambios_clave ON cambios(tabla, clave, fecha)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_claves (
+        tabla TEXT NOT NULL,
+        uid TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        PRIMARY KEY (tabla, uid)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_claves_id ON sync_claves(tabla, id)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_conflictos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TEXT,
+        tabla TEXT,
+        clave TEXT,
+        detalle TEXT
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO sync_estado (id, origen) VALUES (1, lower(hex(randomblob(8))))")
+
+    if conn.execute("SELECT 1 FROM cambios LIMIT 1").fetchone():
+        return
+    ahora = datetime.now(timezone.utc).strftime(FORMATO_FECHA_UTC)[:-3]
+    siguiente = "(SELECT COALESCE(MAX(origen_seq), 0) FROM cambios) + ROW_NUMBER() OVER (ORDER BY {})"
+    conn.execute(f"""
+        INSERT INTO cambios (origen, origen_seq, tabla, clave, operacion, datos, fecha)
+        SELECT e.origen, {siguiente.format("p.id")}, 'productos', e.origen || ':' || p.id, 'I',
+               json_object('codigo', p.codigo, 'nombre', p.nombre, 'precio_centavos', p.precio_centavos,
+                           'moneda', p.moneda, 'imagen', p.imagen, 'stock_minimo', p.stock_minimo,
+                           'cantidad', p.cantidad), ?
+        FROM productos p, sync_estado e
+    """, (ahora,))
+    conn.execute(f"""
+        INSERT INTO cambios (origen, origen_seq, tabla, clave, operacion, datos, fecha)
+        SELECT e.origen, {siguiente.format("t.desde")}, 'tipos_cambio', t.desde, 'I',
+               json_object('desde', t.desde, 'tasa', t.tasa), ?
+        FROM tipos_cambio t, sync_estado e
+    """, (ahora,))
+    conn.execute(f"""
+        INSERT INTO cambios (origen, origen_seq, tabla, clave, operacion, datos, fecha)
+        SELECT e.origen, {siguiente.format("v.id")}, 'ventas', e.origen || ':' || v.id, 'I',
+               json_object('producto', e.origen || ':' || v.producto_id, 'usuario', u.usuario,
+                           'cantidad', v.cantidad, 'total_centavos', v.total_centavos, 'moneda', v.moneda,
+                           'fecha', v.fecha, 'cliente_nombre', v.cliente_nombre, 'cliente_ci', v.cliente_ci,
+                           'cliente_dir', v.cliente_dir), ?
+        FROM ventas v CROSS JOIN sync_estado e LEFT JOIN usuarios u ON u.id = v.usuario_id
+    """, (ahora,))
+
+# --- 7: token de las ventas encoladas ---
+# Cada venta de la cola (cola_ventas.py) lleva un token; al recuperar la cola tras
+# un cierre inesperado, las que ya tienen su recibo en la base no se escriben otra vez.
+def _token_recibos(conn, progreso):
+    _agregar_columna(conn, "recibos", "token TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_recibos_token ON recibos(token) WHERE token IS NOT NULL")
+
+# --- 8: movimientos de stock ---
+# Libro de movimientos (solo se añaden filas) que llenan los triggers de
+# movimientos_stock.py, e instantáneas periódicas del stock de cada producto. La
+# primera instantánea es el stock de hoy: el historial empieza aquí.
+def _movimientos_stock(conn, progreso):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS movimientos_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        producto_id INTEGER NOT NULL,
+        fecha TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        motivo TEXT NOT NULL,
+        referencia INTEGER,
+        usuario_id INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_fecha ON movimientos_stock(fecha)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_producto ON movimientos_stock(producto_id, fecha)")
+    # Motivo de los cambios de stock de la transacción en curso (lo leen los triggers)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS stock_motivo (
+        id INTEGER PRIMARY KEY CHECK(id = 1),
+        motivo TEXT,
+        referencia INTEGER,
+        usuario_id INTEGER
+    )
+    """)
+    conn.execute("INSERT OR IGNORE INTO stock_motivo (id) VALUES (1)")
+    # movimiento_id: último movimiento incluido en la instantánea
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS stock_instantaneas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TEXT NOT NULL,
+        movimiento_id INTEGER NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_instantaneas_fecha ON stock_instantaneas(fecha)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS stock_instantaneas_productos (
+        instantanea_id INTEGER NOT NULL,
+        producto_id INTEGER NOT NULL,
+        cantidad INTEGER NOT NULL,
+        PRIMARY KEY (instantanea_id, producto_id)
+    ) WITHOUT ROWID
+    """)
+    if conn.execute("SELECT 1 FROM stock_instantaneas LIMIT 1").fetchone():
+        return
+    cursor = conn.execute("INSERT INTO stock_instantaneas (fecha, movimiento_id) VALUES (?, 0)",
+                          (datetime.now().strftime(FORMATO_FECHA),))
+    conn.execute("""
+        INSERT INTO stock_instantaneas_productos (instantanea_id, producto_id, cantidad)
+        SELECT ?, id, cantidad FROM productos WHERE COALESCE(cantidad, 0) <> 0
+    """, (cursor.lastrowid,))
+
+# --- 9: fecha de los movimientos de stock ---
+# La transacción puede fijar la fecha de sus movimientos (la de la venta, no la de
+# la escritura: la cola puede escribir al arrancar una venta de días antes). Los
+# triggers del libro se quitan para que inicializar_base los cree con la fecha.
+def _fecha_movimientos(conn, progreso):
+    _agregar_columna(conn, "stock_motivo", "fecha TEXT")
+    for trigger in ("movimientos_productos_ai", "movimientos_productos_au", "movimientos_productos_ad"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+MIGRACIONES = (
+    (1, "esquema base", _esquema_base),
+    (2, "fechas en formato ISO", _fechas_iso),
+    (3, "dinero en centavos", _dinero_en_centavos),
+    (4, "moneda por venta e historial de tasas", _monedas_y_tasas),
+    (5, "registro de archivos de ventas", _registro_archivos),
+    (6, "diario de cambios para sincronizar", _diario_cambios),
+    (7, "token de las ventas encoladas", _token_recibos),
+    (8, "movimientos de stock", _movimientos_stock),
+    (9, "fecha de los movimientos de stock", _fecha_movimientos),
+)
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+def _respaldar(conn, version):
+    ruta = conn.execute("PRAGMA database_list").fetchone()[2]
+    if not ruta:
+        return None
+    destino = f"{ruta}.antes-v{version}"
+    copia = sqlite3.connect(destino)
+    try:
+        conn.backup(copia)
+    finally:
+        copia.close()
+    return destino
+
+def migrar(conn, progreso=None):
+    # Aplica las migraciones pendientes; devuelve la lista de las aplicadas
+    version = version_esquema(conn)
+    pendientes = [m for m in MIGRACIONES if m[0] > version]
+    if not pendientes:
+        return []
+    conn.commit()
+    hay_datos = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0] > 0
+    if hay_datos:
+        _respaldar(conn, version)
+    aplicadas = []
+    for numero, descripcion, funcion in pendientes:
+        if progreso:
+            progreso(descripcion, 0, 0)
+        try:
+            funcion(conn, progreso)
+            conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append((numero, descripcion))
+    return aplicadas
+
+if __name__ == "__main__":
+    import sys
+
+    from conexion import abrir_conexion
+    from inventario import DB_PATH, inicializar_base
+
+    ruta = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    conn = abrir_conexion(ruta)
+    print(f"{ruta}: versión {version_esquema(conn)} (última {VERSION_ACTUAL})")
+
+    def mostrar(paso, hechas, total):
+        print(f"  {paso}: {hechas}/{total}" if total else f"- {paso}")
+
+    aplicadas = migrar(conn, mostrar)
+    inicializar_base(conn)
+    print(f"{len(aplicadas)} migraciones aplicadas, versión {version_esquema(conn)}")
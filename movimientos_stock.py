@@ -0,0 +1,171 @@
+# Libro de movimientos de stock e instantáneas para consultar el stock en cualquier fecha.
+#   python movimientos_stock.py --al 2026-03-01 [ruta.db]     stock y su valor ese día
+#   python movimientos_stock.py --conciliar [ruta.db]         libro contra productos.cantidad
+# Los triggers de aquí anotan en movimientos_stock cada cambio de productos.cantidad
+# (ventas, reposiciones, ajustes, altas, bajas, importaciones y sincronización), con
+# el motivo que la transacción haya puesto en stock_motivo. Sin motivo, una subida
+# cuenta como reposición y una bajada como ajuste. La fecha es la de stock_motivo si
+# la transacción la fijó (la de la venta) y si no la de la escritura.
+# Cada INSTANTANEA_CADA_DIAS días o INSTANTANEA_CADA_MOVIMIENTOS movimientos se
+# guarda una instantánea del stock. El stock en una fecha es la última instantánea
+# anterior más los movimientos desde ella: nunca se recorre el libro entero.
+import sys
+from datetime import datetime, timedelta
+
+from migraciones import FORMATO_FECHA
+
+INSTANTANEA_CADA_DIAS = 7
+INSTANTANEA_CADA_MOVIMIENTOS = 20000
+MOTIVOS = ("venta", "reposicion", "ajuste", "alta", "baja", "importacion", "sincronizacion")
+AHORA_LOCAL = "strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')"
+
+# --- TRIGGERS ---
+def _anotar(producto_id, cantidad, motivo):
+    return f"""
+    INSERT INTO movimientos_stock (producto_id, fecha, cantidad, motivo, referencia, usuario_id)
+    SELECT {producto_id}, COALESCE(m.fecha, {AHORA_LOCAL}), {cantidad}, COALESCE(m.motivo, {motivo}), m.referencia,
+           m.usuario_id
+    FROM stock_motivo m WHERE m.id = 1;"""
+
+def crear_movimientos_stock(conn):
+    delta = "(COALESCE(new.cantidad, 0) - COALESCE(old.cantidad, 0))"
+    triggers = (
+        ("movimientos_productos_ai", "AFTER INSERT ON productos WHEN COALESCE(new.cantidad, 0) <> 0",
+         _anotar("new.id", "new.cantidad", "'alta'")),
+        ("movimientos_productos_au", "AFTER UPDATE OF cantidad ON productos WHEN new.cantidad IS NOT old.cantidad",
+         _anotar("new.id", delta, f"CASE WHEN {delta} > 0 THEN 'reposicion' ELSE 'ajuste' END")),
+        ("movimientos_productos_ad", "AFTER DELETE ON productos WHEN COALESCE(old.cantidad, 0) <> 0",
+         _anotar("old.id", "-old.cantidad", "'baja'")),
+    )
+    for nombre, evento, cuerpo in triggers:
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {nombre} {evento} BEGIN {cuerpo} END")
+
+def fijar_motivo(cursor, motivo, referencia=None, usuario_id=None, fecha=None):
+    # Dentro de la transacción del cambio; limpiar_motivo antes de confirmarla.
+    # fecha (FORMATO_FECHA): la de los movimientos si no es la de ahora
+    cursor.execute("UPDATE stock_motivo SET motivo = ?, referencia = ?, usuario_id = ?, fecha = ? WHERE id = 1",
+                   (motivo, referencia, usuario_id, fecha))
+
+def limpiar_motivo(cursor):
+    cursor.execute("UPDATE stock_motivo SET motivo = NULL, referencia = NULL, usuario_id = NULL, fecha = NULL "
+                   "WHERE id = 1")
+
+# --- INSTANTÁNEAS ---
+def tomar_instantanea(conn):
+    cursor = conn.cursor()
+    conn.commit()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute(f"""
+            INSERT INTO stock_instantaneas (fecha, movimiento_id)
+            SELECT {AHORA_LOCAL}, COALESCE(MAX(id), 0) FROM movimientos_stock
+        """)
+        cursor.execute("""
+            INSERT INTO stock_instantaneas_productos (instantanea_id, producto_id, cantidad)
+            SELECT ?, id, cantidad FROM productos WHERE COALESCE(cantidad, 0) <> 0
+        """, (cursor.lastrowid,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def instantanea_si_hace_falta(conn):
+    # True si tomó una (la última es vieja o hay muchos movimientos desde ella)
+    ultima = conn.execute("SELECT fecha, movimiento_id FROM stock_instantaneas ORDER BY id DESC LIMIT 1").fetchone()
+    if ultima is not None:
+        nuevos = conn.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos_stock").fetchone()[0] - ultima[1]
+        vieja = ultima[0] < (datetime.now() - timedelta(days=INSTANTANEA_CADA_DIAS)).strftime(FORMATO_FECHA)
+        if nuevos == 0 or (nuevos < INSTANTANEA_CADA_MOVIMIENTOS and not vieja):
+            return False
+    tomar_instantanea(conn)
+    return True
+
+# --- CONSULTAS ---
+def _stock_hasta(conn, hasta, producto_id=None):
+    # {producto_id: cantidad} al final de `hasta` ('YYYY-MM-DD HH:MM:SS'); sin los que están en 0.
+    # Lo posterior a la instantánea se toma por id y no por fecha: un movimiento escrito
+    # después con la fecha de la venta (o con el reloj atrasado) no la tiene más nueva.
+    base = conn.execute("""
+        SELECT id, fecha, movimiento_id FROM stock_instantaneas WHERE fecha <= ? ORDER BY fecha DESC, id DESC LIMIT 1
+    """, (hasta,)).fetchone()
+    if base is None:
+        primera = conn.execute("SELECT MIN(fecha) FROM stock_instantaneas").fetchone()[0]
+        raise ValueError(f"No hay registro de stock antes de {primera}")
+    filtro = " AND producto_id = :producto" if producto_id is not None else ""
+    filas = conn.execute(f"""
+        SELECT producto_id, SUM(cantidad) FROM (
+            SELECT producto_id, cantidad FROM stock_instantaneas_productos
+            WHERE instantanea_id = :instantanea{filtro}
+            UNION ALL
+            SELECT producto_id, cantidad FROM movimientos_stock
+            WHERE id > :movimiento AND fecha <= :hasta{filtro}
+        )
+        GROUP BY producto_id HAVING SUM(cantidad) <> 0
+    """, {"instantanea": base[0], "hasta": hasta, "movimiento": base[2],
+          "producto": producto_id}).fetchall()
+    return dict(filas)
+
+def stock_en(conn, dia, producto_id=None):
+    # Stock al cierre del día 'YYYY-MM-DD': {producto_id: cantidad}, o la cantidad de un producto
+    stock = _stock_hasta(conn, dia + " 23:59:59", producto_id)
+    return stock.get(producto_id, 0) if producto_id is not None else stock
+
+def valor_stock_en(conn, dia):
+    # {moneda: importe} del stock de ese día, a los precios actuales (no hay historial de precios)
+    stock = stock_en(conn, dia)
+    valor = {}
+    for producto_id, precio_centavos, moneda in conn.execute("SELECT id, precio_centavos, moneda FROM productos"):
+        cantidad = stock.get(producto_id)
+        if cantidad:
+            valor[moneda] = valor.get(moneda, 0) + cantidad * (precio_centavos or 0)
+    return {moneda: centavos / 100 for moneda, centavos in valor.items()}
+
+def movimientos_producto(conn, producto_id, desde="", hasta="", limite=200):
+    # Kardex de un producto, del más reciente al más antiguo
+    return conn.execute("""
+        SELECT m.fecha, m.cantidad, m.motivo, m.referencia, u.usuario
+        FROM movimientos_stock m LEFT JOIN usuarios u ON u.id = m.usuario_id
+        WHERE m.producto_id = ? AND m.fecha >= ? AND m.fecha <= ?
+        ORDER BY m.fecha DESC, m.id DESC LIMIT ?
+    """, (producto_id, desde + " 00:00:00" if desde else "", hasta + " 23:59:59" if hasta else "9999",
+          limite)).fetchall()
+
+def conciliar(conn):
+    # Productos cuyo stock según el libro no coincide con productos.cantidad:
+    # [(id, nombre, según libro, actual)]. Vacío si todo cuadra.
+    libro = _stock_hasta(conn, "9999-12-31 23:59:59")
+    diferencias = []
+    for producto_id, nombre, cantidad in conn.execute("SELECT id, nombre, COALESCE(cantidad, 0) FROM productos"):
+        segun_libro = libro.pop(producto_id, 0)
+        if segun_libro != cantidad:
+            diferencias.append((producto_id, nombre, segun_libro, cantidad))
+    # Productos borrados que según el libro aún tienen stock
+    diferencias += [(producto_id, None, cantidad, 0) for producto_id, cantidad in libro.items()]
+    return diferencias
+
+if __name__ == "__main__":
+    from conexion import abrir_conexion
+    from inventario import DB_PATH, inicializar_base
+
+    args = sys.argv[1:]
+    dia = None
+    if "--al" in args:
+        i = args.index("--al")
+        dia = args[i + 1]
+        del args[i:i + 2]
+    revisar = "--conciliar" in args
+    args = [a for a in args if not a.startswith("--")]
+    conn = abrir_conexion(args[0] if args else DB_PATH)
+    inicializar_base(conn)
+
+    if revisar:
+        diferencias = conciliar(conn)
+        for producto_id, nombre, segun_libro, actual in diferencias:
+            print(f"  {producto_id} {nombre or '(borrado)'}: libro {segun_libro}, actual {actual}")
+        print("El libro cuadra con el stock" if not diferencias else f"{len(diferencias)} productos no cuadran")
+    else:
+        dia = dia or datetime.now().strftime("%Y-%m-%d")
+        stock = stock_en(conn, dia)
+        print(f"Stock al {dia}: {len(stock)} productos, {sum(stock.values())} unidades")
+        for moneda, importe in sorted(valor_stock_en(conn, dia).items()):
+            print(f"  {moneda}: {importe:.2f}")
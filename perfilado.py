@@ -0,0 +1,243 @@
+# Perfilado opcional de las consultas SQLite y de las pantallas.
+# Se activa con la variable de entorno INVENTARIO_PERFIL=1 (o programa.py --perfil)
+# antes de abrir las conexiones. Las sentencias que tardan más de
+# INVENTARIO_LENTO_MS (50 ms por defecto) se escriben con su EXPLAIN QUERY PLAN
+# en consultas_lentas.log, que rota solo.
+import functools
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+ACTIVO = os.environ.get("INVENTARIO_PERFIL", "") not in ("", "0")
+UMBRAL_LENTO_MS = float(os.environ.get("INVENTARIO_LENTO_MS", "50"))
+ARCHIVO_LOG = os.environ.get("INVENTARIO_LOG_LENTAS", "consultas_lentas.log")
+
+# Límites (ms) de los tramos del histograma de latencia
+TRAMOS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+_bloqueo = threading.Lock()
+estadisticas = {}
+sentencias_sqlite = {}
+# Tope de sentencias distintas contadas; lo que no cabe se suma en OTRAS_SENTENCIAS
+MAX_SENTENCIAS = 500
+OTRAS_SENTENCIAS = "(otras sentencias)"
+lentas_recientes = deque(maxlen=50)
+_log = None
+
+def activar():
+    global ACTIVO
+    ACTIVO = True
+
+def _logger():
+    global _log
+    if _log is None:
+        _log = logging.getLogger("inventario.lentas")
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+        manejador = logging.handlers.RotatingFileHandler(ARCHIVO_LOG, maxBytes=1_000_000, backupCount=3,
+                                                         encoding="utf-8")
+        manejador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _log.addHandler(manejador)
+    return _log
+
+def normalizar_sql(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+# El trace callback recibe la sentencia con los parámetros ya sustituidos:
+# se vuelven a cambiar los literales por ? para que cada consulta cuente una vez.
+_LITERALES = re.compile(r"[xX]'(?:[0-9a-fA-F]*)'|'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def plantilla_sql(sql):
+    return _LISTAS.sub("(?, ...)", _LITERALES.sub("?", normalizar_sql(sql)))
+
+def registrar(clave, ms, filas=0):
+    with _bloqueo:
+        e = estadisticas.get(clave)
+        if e is None:
+            e = estadisticas[clave] = {"veces": 0, "total_ms": 0.0, "max_ms": 0.0, "filas": 0,
+                                       "histograma": [0] * (len(TRAMOS_MS) + 1)}
+        e["veces"] += 1
+        e["total_ms"] += ms
+        e["max_ms"] = max(e["max_ms"], ms)
+        e["filas"] += filas
+        tramo = 0
+        while tramo < len(TRAMOS_MS) and ms > TRAMOS_MS[tramo]:
+            tramo += 1
+        e["histograma"][tramo] += 1
+
+def percentil(e, p):
+    # Límite superior del tramo donde cae el percentil p (aproximado)
+    objetivo = e["veces"] * p
+    acumulado = 0
+    for tramo, n in enumerate(e["histograma"]):
+        acumulado += n
+        if acumulado >= objetivo:
+            return TRAMOS_MS[tramo] if tramo < len(TRAMOS_MS) else e["max_ms"]
+    return e["max_ms"]
+
+def reiniciar():
+    with _bloqueo:
+        estadisticas.clear()
+        sentencias_sqlite.clear()
+        lentas_recientes.clear()
+
+def resumen():
+    with _bloqueo:
+        return sorted(((clave, dict(e, histograma=list(e["histograma"]))) for clave, e in estadisticas.items()),
+                      key=lambda par: par[1]["total_ms"], reverse=True)
+
+def sentencias():
+    with _bloqueo:
+        return sorted(sentencias_sqlite.items(), key=lambda par: par[1], reverse=True)
+
+def lentas():
+    with _bloqueo:
+        return list(lentas_recientes)
+
+def _anotar_lenta(conn, sql, params, ms, filas):
+    plan = ""
+    inicio_sql = sql.lstrip()[:6].upper()
+    if params is not None and (inicio_sql in ("SELECT", "INSERT", "UPDATE", "DELETE") or inicio_sql.startswith("WITH")):
+        try:
+            filas_plan = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plan = " | ".join(f[-1] for f in filas_plan)
+        except sqlite3.Error as e:
+            plan = f"(sin plan: {e})"
+    texto = normalizar_sql(sql)
+    with _bloqueo:
+        lentas_recientes.append((time.strftime("%H:%M:%S"), round(ms, 1), filas, texto, plan))
+    try:
+        _logger().info("%.1f ms, %d filas: %s | params=%r | plan: %s", ms, filas, texto, params, plan)
+    except OSError:
+        pass
+
+# --- Conexión y cursor instrumentados ---
+class CursorPerfilado(sqlite3.Cursor):
+    # Una sentencia se da por terminada cuando se leen todas sus filas o el cursor
+    # se reutiliza; su tiempo es el de execute más el de todas las lecturas.
+    _pendiente = None
+
+    def _cerrar_pendiente(self):
+        p = self._pendiente
+        if p is None:
+            return
+        self._pendiente = None
+        sql, params, ms, filas = p
+        if filas == 0 and self.rowcount > 0:
+            filas = self.rowcount
+        registrar(normalizar_sql(sql), ms, filas)
+        if ms >= UMBRAL_LENTO_MS:
+            _anotar_lenta(self.connection, sql, params, ms, filas)
+
+    def _sumar(self, ms, filas):
+        if self._pendiente is not None:
+            sql, params, total, n = self._pendiente
+            self._pendiente = (sql, params, total + ms, n + filas)
+
+    def execute(self, sql, params=()):
+        self._cerrar_pendiente()
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._pendiente = (sql, params, (time.perf_counter() - inicio) * 1000, 0)
+            if self.description is None:
+                self._cerrar_pendiente()
+
+    def executemany(self, sql, seq):
+        self._cerrar_pendiente()
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            self._pendiente = (sql, None, (time.perf_counter() - inicio) * 1000, 0)
+            self._cerrar_pendiente()
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = super().fetchone()
+        self._sumar((time.perf_counter() - inicio) * 1000, 1 if fila is not None else 0)
+        if fila is None:
+            self._cerrar_pendiente()
+        return fila
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        inicio = time.perf_counter()
+        filas = super().fetchmany(size)
+        self._sumar((time.perf_counter() - inicio) * 1000, len(filas))
+        if len(filas) < size:
+            self._cerrar_pendiente()
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = super().fetchall()
+        self._sumar((time.perf_counter() - inicio) * 1000, len(filas))
+        self._cerrar_pendiente()
+        return filas
+
+    def __next__(self):
+        inicio = time.perf_counter()
+        try:
+            fila = super().__next__()
+        except StopIteration:
+            self._cerrar_pendiente()
+            raise
+        self._sumar((time.perf_counter() - inicio) * 1000, 1)
+        return fila
+
+    def close(self):
+        self._cerrar_pendiente()
+        super().close()
+
+class ConexionPerfilada(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Cuenta también lo que SQLite ejecuta por su cuenta (BEGIN/COMMIT implícitos, triggers)
+        self.set_trace_callback(_contar_sentencia)
+
+    def cursor(self, factory=CursorPerfilado):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def commit(self):
+        inicio = time.perf_counter()
+        super().commit()
+        registrar("COMMIT", (time.perf_counter() - inicio) * 1000)
+
+def _contar_sentencia(sql):
+    clave = plantilla_sql(sql)[:200]
+    with _bloqueo:
+        if clave not in sentencias_sqlite and len(sentencias_sqlite) >= MAX_SENTENCIAS:
+            clave = OTRAS_SENTENCIAS
+        sentencias_sqlite[clave] = sentencias_sqlite.get(clave, 0) + 1
+
+def fabrica_conexion():
+    return ConexionPerfilada if ACTIVO else sqlite3.Connection
+
+# --- Pantallas ---
+def medir_pantalla(funcion):
+    # Decorador para las funciones mostrar_*: con el perfilado apagado no añade nada
+    if not ACTIVO:
+        return funcion
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            registrar(f"UI {funcion.__name__}", (time.perf_counter() - inicio) * 1000)
+    return envoltura
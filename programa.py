@@ -1,86 +1,54 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+import base64
 import sqlite3
-from datetime import datetime
-from reportlab.pdfgen import canvas as pdf_canvas
-from reportlab.lib.pagesizes import letter
+import threading
 import os
-
-# --- BASE DE DATOS ---
-conn = sqlite3.connect("inventario_cuba.db")
-cursor = conn.cursor()
-
-# Crear tablas
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS usuarios (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    usuario TEXT UNIQUE,
-    password TEXT,
-    rol TEXT CHECK(rol IN ('admin','vendedor'))
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS productos (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nombre TEXT,
-    cantidad INTEGER,
-    precio REAL,
-    moneda TEXT CHECK(moneda IN ('USD','CUP')),
-    imagen TEXT,
-    stock_minimo INTEGER DEFAULT 5
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS ventas (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    producto_id INTEGER,
-    cantidad INTEGER,
-    total REAL,
-    fecha TEXT,
-    cliente_nombre TEXT,
-    cliente_ci TEXT,
-    cliente_dir TEXT,
-    usuario_id INTEGER,
-    FOREIGN KEY(producto_id) REFERENCES productos(id),
-    FOREIGN KEY(usuario_id) REFERENCES usuarios(id)
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS configuracion (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    tipo_cambio REAL
+import traceback
+import queue
+import sys
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import analitica
+import perfilado
+import respaldo
+from conexion import abrir_conexion
+from autocompletar import IndiceProductos
+from cola_ventas import INTENTOS_MAX, ColaVentas
+from miniaturas import CacheMiniaturas, TAMANO
+from movimientos_stock import instantanea_si_hace_falta, stock_en, valor_stock_en
+from datos_csv import importar_productos, guardar_rechazadas, exportar_productos, exportar_ventas
+from inventario import (
+    DB_PATH, PRODUCTOS_POR_PAGINA, VENTAS_POR_PAGINA, StockInsuficiente, inicializar_base, reconstruir_resumenes_ventas,
+    autenticar, set_tipo_cambio, obtener_producto, agregar_producto, actualizar_producto,
+    eliminar_producto, firma_datos, productos_stock_bajo, contar_stock_bajo, consultar_productos_pagina,
+    clave_producto, clave_venta, consulta_ventas, nombres_usuarios, listar_ventas, totales_dia, totales_mes,
+    escribir_pdf_ventas,
+    MONEDAS, total_dia_en, total_mes_en, historial_tipos_cambio,
 )
-""")
 
-conn.commit()
+# python programa.py --perfil: mide consultas y pantallas (ver Configuración > Diagnóstico)
+if "--perfil" in sys.argv:
+    perfilado.activar()
 
-# Crear usuario admin por defecto si no existe
-cursor.execute("SELECT * FROM usuarios WHERE usuario='admin'")
-if not cursor.fetchone():
-    cursor.execute("INSERT INTO usuarios (usuario, password, rol) VALUES (?, ?, ?)", ("admin", "admin123", "admin"))
+# --- BASE DE DATOS ---
+# Conexión de escritura en modo WAL; las consultas de pantallas van por una
+# conexión aparte de solo lectura para no esperar detrás de las escrituras.
+conn = abrir_conexion(DB_PATH)
+inicializar_base(conn)
+
+# python programa.py --reconstruir-resumenes
+if "--reconstruir-resumenes" in sys.argv:
+    reconstruir_resumenes_ventas(conn)
     conn.commit()
+    print("Resúmenes de ventas reconstruidos")
+    sys.exit(0)
 
-# Crear config tipo cambio si no existe
-cursor.execute("SELECT * FROM configuracion")
-if not cursor.fetchone():
-    cursor.execute("INSERT INTO configuracion (tipo_cambio) VALUES (?)", (24.0,))
-    conn.commit()
+conn_lectura = abrir_conexion(DB_PATH, solo_lectura=True)
 
 # --- Variables globales ---
 usuario_actual = None
 
-def get_tipo_cambio():
-    cursor.execute("SELECT tipo_cambio FROM configuracion LIMIT 1")
-    r = cursor.fetchone()
-    return r[0] if r else 24.0
-
-def set_tipo_cambio(nuevo):
-    cursor.execute("UPDATE configuracion SET tipo_cambio = ?", (nuevo,))
-    conn.commit()
-
 # --- VENTANA PRINCIPAL ---
 app = tk.Tk()
 app.title("Sistema Completo de Inventario Cuba")
@@ -89,7 +57,7 @@ app.configure(bg="#f0f0f0")
 
 # --- FRAMES ---
 frames = {}
-for name in ["login", "menu", "productos", "agregar_producto", "editar_producto", "vender", "historial", "reportes", "config"]:
+for name in ["login", "menu", "productos", "agregar_producto", "editar_producto", "vender", "historial", "reportes", "analisis", "config", "diagnostico"]:
     f = tk.Frame(app)
     frames[name] = f
     f.place(relwidth=1, relheight=1)
@@ -98,6 +66,33 @@ def ocultar_frames():
     for f in frames.values():
         f.place_forget()
 
+def mostrar_frame(nombre):
+    ocultar_frames()
+    frames[nombre].place(relwidth=1, relheight=1)
+
+# --- Pantallas persistentes ---
+# Cada pantalla se construye una sola vez al arrancar; al volver a ella solo se
+# recargan sus datos si cambiaron desde que se pintaron. PRAGMA data_version indica
+# si alguna conexión escribió en la base y solo entonces se lee firma_datos.
+datos_pintados = {}
+_firma = {"data_version": None, "datos": None}
+
+def firma_actual():
+    data_version = conn_lectura.execute("PRAGMA data_version").fetchone()[0]
+    if data_version != _firma["data_version"]:
+        _firma["data_version"] = data_version
+        _firma["datos"] = firma_datos(conn_lectura)
+    return _firma["datos"]
+
+def datos_cambiados(pantalla, *claves, extra=None):
+    # True (y la pantalla queda marcada como al día) si sus datos cambiaron
+    firma = firma_actual()
+    actual = tuple(firma[c] for c in claves) + (extra,)
+    if datos_pintados.get(pantalla) == actual:
+        return False
+    datos_pintados[pantalla] = actual
+    return True
+
 # --- LOGIN ---
 def login():
     global usuario_actual
@@ -106,10 +101,9 @@ def login():
     if not user or not pwd:
         messagebox.showerror("Error", "Ingrese usuario y contraseña")
         return
-    cursor.execute("SELECT id, usuario, rol FROM usuarios WHERE usuario=? AND password=?", (user, pwd))
-    r = cursor.fetchone()
+    r = autenticar(conn_lectura, user, pwd)
     if r:
-        usuario_actual = {"id": r[0], "usuario": r[1], "rol": r[2]}
+        usuario_actual = r
         messagebox.showinfo("Bienvenido", f"Bienvenido {usuario_actual['usuario']} ({usuario_actual['rol']})")
         mostrar_menu()
     else:
@@ -125,9 +119,9 @@ entry_password = tk.Entry(login_frame, show="*")
 entry_password.pack(pady=5)
 tk.Button(login_frame, text="Entrar", command=login, bg="#4CAF50", fg="white").pack(pady=15)
 
+@perfilado.medir_pantalla
 def mostrar_login():
-    ocultar_frames()
-    frames["login"].place(relwidth=1, relheight=1)
+    mostrar_frame("login")
 
 # --- MENÚ PRINCIPAL ---
 menu_frame = frames["menu"]
@@ -150,24 +144,65 @@ btn_historial.pack(pady=10)
 btn_reportes.pack(pady=10)
 btn_salir.pack(pady=30)
 
-alerta_label = tk.Label(menu_frame, text="", fg="red", font=("Arial", 12, "bold"))
+# Panel de alertas de stock: página a página y ordenable por columna
+ALERTAS_POR_PAGINA = 8
+alertas_estado = {"pagina": 0, "orden": "faltante", "descendente": False}
+
+alerta_frame = tk.Frame(menu_frame)
+alerta_label = tk.Label(alerta_frame, text="", fg="red", font=("Arial", 12, "bold"))
 alerta_label.pack(pady=5)
+tree_alertas = ttk.Treeview(alerta_frame, columns=("nombre", "cantidad", "stock_minimo"), show="headings",
+                            height=ALERTAS_POR_PAGINA)
+for col, titulo, ancho in (("nombre", "Producto", 170), ("cantidad", "Stock", 60), ("stock_minimo", "Mínimo", 60)):
+    tree_alertas.heading(col, text=titulo, command=lambda c=col: ordenar_alertas(c))
+    tree_alertas.column(col, width=ancho)
+tree_alertas.pack()
+alerta_nav = tk.Frame(alerta_frame)
+alerta_nav.pack(pady=3)
+btn_alertas_ant = tk.Button(alerta_nav, text="< Anterior", command=lambda: paginar_alertas(-1))
+btn_alertas_ant.pack(side="left", padx=3)
+alerta_pagina_label = tk.Label(alerta_nav, text="")
+alerta_pagina_label.pack(side="left", padx=3)
+btn_alertas_sig = tk.Button(alerta_nav, text="Siguiente >", command=lambda: paginar_alertas(1))
+btn_alertas_sig.pack(side="left", padx=3)
 
 def mostrar_alertas_stock():
-    cursor.execute("SELECT nombre, cantidad, stock_minimo FROM productos WHERE cantidad <= stock_minimo")
-    bajos = cursor.fetchall()
-    if bajos:
-        texto = "¡Atención! Productos con stock bajo:\n"
-        texto += "\n".join([f"{p[0]} (Stock: {p[1]})" for p in bajos])
-        alerta_label.config(text=texto)
+    total = contar_stock_bajo(conn_lectura)
+    if not total:
+        alerta_frame.place_forget()
+        return
+    paginas = (total - 1) // ALERTAS_POR_PAGINA + 1
+    alertas_estado["pagina"] = min(alertas_estado["pagina"], paginas - 1)
+    bajos = productos_stock_bajo(conn_lectura, alertas_estado["orden"], alertas_estado["descendente"],
+                                 ALERTAS_POR_PAGINA, alertas_estado["pagina"] * ALERTAS_POR_PAGINA)
+    alerta_label.config(text=f"¡Atención! {total} productos con stock bajo")
+    tree_alertas.delete(*tree_alertas.get_children())
+    for p in bajos:
+        tree_alertas.insert("", "end", values=p[1:])
+    alerta_pagina_label.config(text=f"{alertas_estado['pagina'] + 1} / {paginas}")
+    btn_alertas_ant.config(state="normal" if alertas_estado["pagina"] > 0 else "disabled")
+    btn_alertas_sig.config(state="normal" if alertas_estado["pagina"] < paginas - 1 else "disabled")
+    alerta_frame.place(relx=1.0, x=-10, rely=0.2, anchor="ne")
+
+def ordenar_alertas(columna):
+    if alertas_estado["orden"] == columna:
+        alertas_estado["descendente"] = not alertas_estado["descendente"]
     else:
-        alerta_label.config(text="")
+        alertas_estado["orden"] = columna
+        alertas_estado["descendente"] = False
+    alertas_estado["pagina"] = 0
+    mostrar_alertas_stock()
 
+def paginar_alertas(paso):
+    alertas_estado["pagina"] = max(alertas_estado["pagina"] + paso, 0)
+    mostrar_alertas_stock()
+
+@perfilado.medir_pantalla
 def mostrar_menu():
-    ocultar_frames()
-    frames["menu"].place(relwidth=1, relheight=1)
+    mostrar_frame("menu")
     label_usuario.config(text=f"Usuario: {usuario_actual['usuario']} ({usuario_actual['rol']})")
-    mostrar_alertas_stock()
+    if datos_cambiados("menu", "catalogo", "stock"):
+        mostrar_alertas_stock()
     # Mostrar u ocultar botón config según rol
     if usuario_actual["rol"] == "admin":
         btn_config.pack(pady=10)
@@ -181,126 +216,446 @@ def cerrar_sesion():
 
 btn_salir.config(command=cerrar_sesion)
 
-# --- GESTIÓN DE PRODUCTOS ---
-productos_frame = frames["productos"]
-
-tree_productos = None
-
-def mostrar_productos():
-    ocultar_frames()
-    f = frames["productos"]
-    f.place(relwidth=1, relheight=1)
-    for widget in f.winfo_children():
-        widget.destroy()
-
-    tk.Label(f, text="Productos", font=("Arial", 20)).pack(pady=10)
-
-    busq_frame = tk.Frame(f)
-    busq_frame.pack()
-    tk.Label(busq_frame, text="Buscar:").pack(side="left")
-    entry_buscar = tk.Entry(busq_frame)
-    entry_buscar.pack(side="left", padx=5)
-
-    columnas = ("ID", "Nombre", "Cantidad", "Precio", "Moneda", "Stock mínimo", "Imagen")
-    global tree_productos
-    tree_productos = ttk.Treeview(f, columns=columnas, show="headings", height=15)
-    for col in columnas:
-        tree_productos.heading(col, text=col)
-        if col == "Imagen":
-            tree_productos.column(col, width=150)
+# --- MINIATURAS ---
+# Solo se piden las miniaturas de las filas visibles. Las PhotoImage creadas se
+# guardan en una LRU pequeña por ruta; las filas visibles se reasignan en cada
+# scroll, así que nunca son las que se descartan.
+miniaturas = CacheMiniaturas()
+FOTOS_MAX = 100
+fotos = OrderedDict()
+
+if miniaturas.disponible:
+    ttk.Style().configure("Miniaturas.Treeview", rowheight=TAMANO + 4)
+
+def filas_visibles(tree):
+    hijos = tree.get_children()
+    if not hijos:
+        return []
+    # Todas las filas miden lo mismo: la fracción de yview da la primera visible
+    i = max(int(tree.yview()[0] * len(hijos)) - 1, 0)
+    return [iid for iid in hijos[i:i + int(tree.cget("height")) + 2] if tree.bbox(iid)]
+
+def poner_miniaturas(tree, ruta_de):
+    if not miniaturas.disponible:
+        return
+    for iid in filas_visibles(tree):
+        ruta = ruta_de(iid)
+        if not ruta:
+            continue
+        if ruta in fotos:
+            fotos.move_to_end(ruta)
+            tree.item(iid, image=fotos[ruta])
+            continue
+        datos = miniaturas.en_memoria(ruta)
+        if datos is not None:
+            _colocar_miniatura(tree, iid, ruta, datos)
         else:
-            tree_productos.column(col, width=100)
-    tree_productos.pack(pady=10)
+            miniaturas.pedir(ruta, lambda r, d, t=tree, i=iid: app.after(0, _colocar_miniatura, t, i, r, d))
 
-    btn_frame = tk.Frame(f)
-    btn_frame.pack()
-    tk.Button(btn_frame, text="Agregar Producto", command=mostrar_agregar_producto, bg="#4CAF50", fg="white").pack(side="left", padx=5)
-    tk.Button(btn_frame, text="Editar Producto", command=editar_producto_seleccionado).pack(side="left", padx=5)
-    tk.Button(btn_frame, text="Eliminar Producto", command=eliminar_producto_seleccionado).pack(side="left", padx=5)
-    tk.Button(btn_frame, text="Volver al Menú", command=mostrar_menu).pack(side="left", padx=5)
+def _colocar_miniatura(tree, iid, ruta, datos):
+    if ruta not in fotos:
+        try:
+            fotos[ruta] = tk.PhotoImage(data=base64.b64encode(datos)) if datos else ""
+        except tk.TclError:
+            fotos[ruta] = ""
+        while len(fotos) > FOTOS_MAX:
+            fotos.popitem(last=False)
+    fotos.move_to_end(ruta)
+    if tree.exists(iid):
+        tree.item(iid, image=fotos[ruta])
 
-    def filtrar(event=None):
-        cargar_productos(entry_buscar.get())
+# --- GESTIÓN DE PRODUCTOS ---
+productos_frame = frames["productos"]
 
-    entry_buscar.bind("<KeyRelease>", filtrar)
+tk.Label(productos_frame, text="Productos", font=("Arial", 20)).pack(pady=10)
+
+busq_frame = tk.Frame(productos_frame)
+busq_frame.pack()
+tk.Label(busq_frame, text="Buscar:").pack(side="left")
+entry_buscar_producto = tk.Entry(busq_frame)
+entry_buscar_producto.pack(side="left", padx=5)
+entry_buscar_producto.bind("<KeyRelease>", lambda event: buscar_productos(entry_buscar_producto.get()))
+tk.Label(busq_frame, text="Cantidad de").pack(side="left", padx=(15, 0))
+entry_cantidad_min = tk.Entry(busq_frame, width=6)
+entry_cantidad_min.pack(side="left", padx=3)
+tk.Label(busq_frame, text="a").pack(side="left")
+entry_cantidad_max = tk.Entry(busq_frame, width=6)
+entry_cantidad_max.pack(side="left", padx=3)
+tk.Label(busq_frame, text="Moneda:").pack(side="left", padx=(15, 0))
+combo_moneda_productos = ttk.Combobox(busq_frame, values=["Todas"] + list(MONEDAS), state="readonly", width=6)
+combo_moneda_productos.set("Todas")
+combo_moneda_productos.pack(side="left", padx=3)
+for entrada in (entry_cantidad_min, entry_cantidad_max):
+    entrada.bind("<KeyRelease>", lambda event: filtrar_productos())
+combo_moneda_productos.bind("<<ComboboxSelected>>", lambda event: filtrar_productos())
+
+columnas_productos = ("ID", "Nombre", "Cantidad", "Precio", "Moneda", "Stock mínimo", "Imagen")
+tree_frame = tk.Frame(productos_frame)
+tree_frame.pack(pady=10)
+if miniaturas.disponible:
+    tree_productos = ttk.Treeview(tree_frame, columns=columnas_productos, show="tree headings", height=15,
+                                  style="Miniaturas.Treeview")
+    tree_productos.column("#0", width=TAMANO + 16, stretch=False)
+else:
+    tree_productos = ttk.Treeview(tree_frame, columns=columnas_productos, show="headings", height=15)
+# Columna de la tabla -> orden de consultar_productos_pagina; el orden y los filtros van en la consulta
+ORDEN_COLUMNAS_PRODUCTOS = {"ID": "id", "Nombre": "nombre", "Cantidad": "cantidad", "Precio": "precio",
+                            "Stock mínimo": "stock_minimo"}
+for col in columnas_productos:
+    if col in ORDEN_COLUMNAS_PRODUCTOS:
+        tree_productos.heading(col, text=col, command=lambda c=col: ordenar_productos(ORDEN_COLUMNAS_PRODUCTOS[c]))
+    else:
+        tree_productos.heading(col, text=col)
+    if col == "Imagen":
+        tree_productos.column(col, width=150)
+    else:
+        tree_productos.column(col, width=100)
+scroll_productos = ttk.Scrollbar(tree_frame, orient="vertical", command=tree_productos.yview)
+
+def on_scroll_productos(primero, ultimo):
+    scroll_productos.set(primero, ultimo)
+    if not productos_vista["pendiente"]:
+        productos_vista["pendiente"] = True
+        app.after_idle(revisar_scroll_productos)
+
+tree_productos.configure(yscrollcommand=on_scroll_productos)
+tree_productos.pack(side="left")
+scroll_productos.pack(side="right", fill="y")
+
+productos_btns = tk.Frame(productos_frame)
+productos_btns.pack()
+tk.Button(productos_btns, text="Agregar Producto", command=lambda: mostrar_agregar_producto(), bg="#4CAF50", fg="white").pack(side="left", padx=5)
+tk.Button(productos_btns, text="Editar Producto", command=lambda: editar_producto_seleccionado()).pack(side="left", padx=5)
+tk.Button(productos_btns, text="Eliminar Producto", command=lambda: eliminar_producto_seleccionado()).pack(side="left", padx=5)
+tk.Button(productos_btns, text="Importar CSV", command=lambda: importar_productos_csv()).pack(side="left", padx=5)
+tk.Button(productos_btns, text="Exportar CSV", command=lambda: exportar_productos_csv()).pack(side="left", padx=5)
+tk.Button(productos_btns, text="Volver al Menú", command=mostrar_menu).pack(side="left", padx=5)
+
+@perfilado.medir_pantalla
+def mostrar_productos():
+    mostrar_frame("productos")
+    # Se conserva el filtro escrito; la lista solo se vuelve a pedir si hubo cambios
+    if datos_cambiados("productos", "catalogo", "stock"):
+        cargar_productos(productos_vista["filtro"])
+    else:
+        app.after_idle(miniaturas_productos)
+
+# --- Vista paginada de productos ---
+# Solo se mantiene en el Treeview una ventana de filas alrededor de la zona visible;
+# las páginas se piden por clave con consultar_productos_pagina.
+PRODUCTOS_MAX_FILAS = 300
+
+# opciones: orden y filtros de las filas cargadas; pedidas: los de la última búsqueda
+productos_vista = {"filtro": "", "inicio": True, "fin": True, "cargando": False, "pendiente": False,
+                   "opciones": {"orden": "id", "descendente": False}, "pedidas": {"orden": "id", "descendente": False}}
+# Clave de paginación (clave_producto) de cada fila cargada, por iid
+productos_claves = {}
+
+def _fila_visible_productos():
+    # Fila que está arriba del todo, para no mover la vista al recortar la ventana
+    return tree_productos.identify_row(1)
+
+def _restaurar_vista_productos(item):
+    hijos = tree_productos.get_children()
+    if item and item in hijos:
+        tree_productos.yview_moveto(hijos.index(item) / len(hijos))
+
+def revisar_scroll_productos():
+    # Pedir más filas cuando la vista se acerca a un extremo de la ventana cargada
+    productos_vista["pendiente"] = False
+    primero, ultimo = tree_productos.yview()
+    if ultimo >= 0.95 and not productos_vista["fin"]:
+        cargar_productos_siguientes()
+    elif primero <= 0.05 and not productos_vista["inicio"]:
+        cargar_productos_anteriores()
+    miniaturas_productos()
+
+def miniaturas_productos():
+    poner_miniaturas(tree_productos, lambda iid: tree_productos.item(iid, "values")[-1])
+
+def _insertar_producto(posicion, fila):
+    iid = tree_productos.insert("", posicion, values=fila)
+    productos_claves[iid] = clave_producto(fila, productos_vista["opciones"]["orden"])
+
+def _quitar_productos(items):
+    tree_productos.delete(*items)
+    for iid in items:
+        productos_claves.pop(iid, None)
+
+@perfilado.medir_pantalla
+def cargar_productos(filtro="", filas=None, opciones=None):
+    productos_vista["filtro"] = filtro
+    if opciones is not None:
+        productos_vista["opciones"] = opciones
+    _quitar_productos(tree_productos.get_children())
+    if filas is None:
+        filas = consultar_productos_pagina(conn_lectura, filtro, limite=PRODUCTOS_POR_PAGINA + 1,
+                                           **productos_vista["opciones"])
+    productos_vista["inicio"] = True
+    productos_vista["fin"] = len(filas) <= PRODUCTOS_POR_PAGINA
+    for p in filas[:PRODUCTOS_POR_PAGINA]:
+        _insertar_producto("end", p)
+
+def _titulos_orden(tree, columnas, orden, descendente):
+    # Flecha en el encabezado de la columna por la que está ordenada la tabla
+    for col, clave in columnas.items():
+        flecha = (" ▼" if descendente else " ▲") if clave == orden else ""
+        tree.heading(col, text=col + flecha)
+
+def ordenar_productos(orden):
+    # Mismo encabezado: invierte el sentido; otro: ascendente. Se vuelve a pedir la
+    # primera página ya ordenada (por la búsqueda, con lo que haya escrito), sin
+    # reordenar filas en Python.
+    opciones = dict(productos_vista["pedidas"])
+    opciones["descendente"] = not opciones["descendente"] if opciones["orden"] == orden else False
+    opciones["orden"] = orden
+    productos_vista["pedidas"] = opciones
+    _titulos_orden(tree_productos, ORDEN_COLUMNAS_PRODUCTOS, orden, opciones["descendente"])
+    buscar_productos(entry_buscar_producto.get())
+
+def _entero_o_nada(entrada):
+    try:
+        return int(entrada.get().strip())
+    except ValueError:
+        return None
+
+def filtrar_productos():
+    opciones = dict(productos_vista["pedidas"])
+    opciones["cantidad_min"] = _entero_o_nada(entry_cantidad_min)
+    opciones["cantidad_max"] = _entero_o_nada(entry_cantidad_max)
+    moneda = combo_moneda_productos.get()
+    opciones["moneda"] = moneda if moneda in MONEDAS else ""
+    productos_vista["pedidas"] = opciones
+    buscar_productos(entry_buscar_producto.get())
+
+# --- Búsqueda de productos en segundo plano ---
+# Cada pulsación reinicia un temporizador (debounce); cuando vence, la búsqueda se
+# manda a un hilo con su propia conexión. Las respuestas llevan un número de
+# generación y las que ya no corresponden a lo último tecleado se descartan.
+BUSQUEDA_ESPERA_MS = 150
+
+busqueda_estado = {"generacion": 0, "after_id": None, "hilo": None, "conn": None}
+busqueda_cola = queue.Queue()
+
+def _hilo_busqueda():
+    # Un error inesperado se anota y el hilo sigue; si aun así termina, la próxima
+    # búsqueda arranca otro (hilo vuelve a None)
+    try:
+        conn_busqueda = abrir_conexion(DB_PATH, solo_lectura=True)
+        busqueda_estado["conn"] = conn_busqueda
+        while True:
+            generacion, filtro, opciones = busqueda_cola.get()
+            # Quedarse solo con la petición más reciente
+            while not busqueda_cola.empty():
+                generacion, filtro, opciones = busqueda_cola.get_nowait()
+            if generacion != busqueda_estado["generacion"]:
+                continue
+            try:
+                filas = consultar_productos_pagina(conn_busqueda, filtro, limite=PRODUCTOS_POR_PAGINA + 1, **opciones)
+                if generacion == busqueda_estado["generacion"]:
+                    app.after(0, lambda g=generacion, t=filtro, o=opciones, r=filas: _mostrar_busqueda(g, t, o, r))
+            except sqlite3.OperationalError as e:
+                # Interrumpida porque llegó otra búsqueda
+                if "interrupt" not in str(e):
+                    traceback.print_exc()
+            except Exception:
+                traceback.print_exc()
+    finally:
+        busqueda_estado["conn"] = None
+        busqueda_estado["hilo"] = None
+
+def _mostrar_busqueda(generacion, filtro, opciones, filas):
+    if generacion != busqueda_estado["generacion"]:
+        return
+    cargar_productos(filtro, filas, opciones)
+
+def buscar_productos(filtro):
+    busqueda_estado["generacion"] += 1
+    if busqueda_estado["after_id"]:
+        app.after_cancel(busqueda_estado["after_id"])
+    # Cortar la consulta en curso, ya no sirve
+    if busqueda_estado["conn"] is not None:
+        busqueda_estado["conn"].interrupt()
+    generacion = busqueda_estado["generacion"]
+    opciones = dict(productos_vista["pedidas"])
+
+    def enviar():
+        busqueda_estado["after_id"] = None
+        if busqueda_estado["hilo"] is None:
+            busqueda_estado["hilo"] = threading.Thread(target=_hilo_busqueda, daemon=True)
+            busqueda_estado["hilo"].start()
+        busqueda_cola.put((generacion, filtro, opciones))
+
+    busqueda_estado["after_id"] = app.after(BUSQUEDA_ESPERA_MS, enviar)
+
+def cargar_productos_siguientes():
+    hijos = tree_productos.get_children()
+    if productos_vista["fin"] or productos_vista["cargando"] or not hijos:
+        return
+    productos_vista["cargando"] = True
+    try:
+        visible = _fila_visible_productos()
+        filas = consultar_productos_pagina(conn_lectura, productos_vista["filtro"], despues_de=productos_claves[hijos[-1]],
+                                           limite=PRODUCTOS_POR_PAGINA + 1, **productos_vista["opciones"])
+        productos_vista["fin"] = len(filas) <= PRODUCTOS_POR_PAGINA
+        for p in filas[:PRODUCTOS_POR_PAGINA]:
+            _insertar_producto("end", p)
+        hijos = tree_productos.get_children()
+        sobrantes = len(hijos) - PRODUCTOS_MAX_FILAS
+        if sobrantes > 0:
+            _quitar_productos(hijos[:sobrantes])
+            productos_vista["inicio"] = False
+        _restaurar_vista_productos(visible)
+    finally:
+        productos_vista["cargando"] = False
+
+def cargar_productos_anteriores():
+    hijos = tree_productos.get_children()
+    if productos_vista["inicio"] or productos_vista["cargando"] or not hijos:
+        return
+    productos_vista["cargando"] = True
+    try:
+        visible = _fila_visible_productos()
+        filas = consultar_productos_pagina(conn_lectura, productos_vista["filtro"], antes_de=productos_claves[hijos[0]],
+                                           limite=PRODUCTOS_POR_PAGINA + 1, **productos_vista["opciones"])
+        productos_vista["inicio"] = len(filas) <= PRODUCTOS_POR_PAGINA
+        for p in reversed(filas[-PRODUCTOS_POR_PAGINA:]):
+            _insertar_producto(0, p)
+        hijos = tree_productos.get_children()
+        sobrantes = len(hijos) - PRODUCTOS_MAX_FILAS
+        if sobrantes > 0:
+            _quitar_productos(hijos[-sobrantes:])
+            productos_vista["fin"] = False
+        _restaurar_vista_productos(visible)
+    finally:
+        productos_vista["cargando"] = False
+
+# --- Importación / exportación CSV ---
+# Corren en un hilo con su propia conexión; el resultado vuelve por app.after
+def _en_segundo_plano(trabajo, al_terminar):
+    def ejecutar():
+        conn_hilo = abrir_conexion(DB_PATH)
+        try:
+            resultado = trabajo(conn_hilo)
+            app.after(0, al_terminar, resultado, None)
+        except Exception as e:
+            app.after(0, al_terminar, None, e)
+        finally:
+            conn_hilo.close()
+    threading.Thread(target=ejecutar, daemon=True).start()
+
+def importar_productos_csv():
+    archivo = filedialog.askopenfilename(filetypes=[("CSV / Excel", "*.csv *.xlsx"), ("Todos", "*.*")],
+                                         title="Importar catálogo de productos")
+    if not archivo:
+        return
+    # Por defecto los productos que ya existen conservan su stock
+    actualizar_stock = messagebox.askyesno("Importar", "¿Reemplazar también el stock de los productos que ya "
+                                                       "existen con la cantidad del archivo?", default="no")
 
-    cargar_productos()
+    def terminar(resultado, error):
+        if error:
+            messagebox.showerror("Error", f"No se pudo importar: {error}")
+            return
+        importadas, rechazadas = resultado
+        texto = f"{importadas} productos importados o actualizados."
+        if rechazadas:
+            archivo_rechazos = archivo.rsplit(".", 1)[0] + "_rechazados.csv"
+            guardar_rechazadas(archivo_rechazos, rechazadas)
+            texto += f"\n{len(rechazadas)} filas rechazadas, detalle en:\n{archivo_rechazos}"
+        messagebox.showinfo("Importación", texto)
+        cargar_productos(productos_vista["filtro"])
+
+    _en_segundo_plano(lambda c: importar_productos(c, archivo, actualizar_stock=actualizar_stock), terminar)
+
+def exportar_productos_csv():
+    archivo = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")],
+                                           title="Exportar productos")
+    if not archivo:
+        return
+    _en_segundo_plano(lambda c: exportar_productos(c, archivo), _aviso_exportacion)
 
-def cargar_productos(filtro=""):
-    for i in tree_productos.get_children():
-        tree_productos.delete(i)
-    filtro_like = f"%{filtro}%"
-    cursor.execute("SELECT id, nombre, cantidad, precio, moneda, stock_minimo, imagen FROM productos WHERE nombre LIKE ?", (filtro_like,))
-    productos = cursor.fetchall()
-    for p in productos:
-        tree_productos.insert("", "end", values=p)
+def exportar_ventas_csv():
+    archivo = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")],
+                                           title="Exportar ventas")
+    if not archivo:
+        return
+    filtros = dict(ventas_filtros)
+    _en_segundo_plano(lambda c: exportar_ventas(c, archivo, **filtros), _aviso_exportacion)
 
-def mostrar_agregar_producto():
-    ocultar_frames()
-    f = frames["agregar_producto"]
-    f.place(relwidth=1, relheight=1)
-    for widget in f.winfo_children():
-        widget.destroy()
+def _aviso_exportacion(total, error):
+    if error:
+        messagebox.showerror("Error", f"No se pudo exportar: {error}")
+    else:
+        messagebox.showinfo("Exportación", f"{total} filas exportadas")
 
-    tk.Label(f, text="Agregar Producto", font=("Arial", 20)).pack(pady=20)
+# --- Formulario de producto ---
+# Agregar y editar usan el mismo formulario, construido una vez en cada pantalla
+def construir_formulario_producto(f, titulo, texto_guardar, color, guardar):
+    tk.Label(f, text=titulo, font=("Arial", 20)).pack(pady=20)
     form_frame = tk.Frame(f)
     form_frame.pack()
 
-    tk.Label(form_frame, text="Nombre:").grid(row=0, column=0, sticky="e")
-    entry_nombre = tk.Entry(form_frame, width=50)
-    entry_nombre.grid(row=0, column=1, pady=5)
-
-    tk.Label(form_frame, text="Cantidad:").grid(row=1, column=0, sticky="e")
-    entry_cantidad = tk.Entry(form_frame, width=50)
-    entry_cantidad.grid(row=1, column=1, pady=5)
-
-    tk.Label(form_frame, text="Precio:").grid(row=2, column=0, sticky="e")
-    entry_precio = tk.Entry(form_frame, width=50)
-    entry_precio.grid(row=2, column=1, pady=5)
+    campos = {}
+    for fila, clave, texto in ((0, "nombre", "Nombre:"), (1, "cantidad", "Cantidad:"), (2, "precio", "Precio:"),
+                               (4, "stock_minimo", "Stock mínimo:"), (5, "imagen", "Imagen (ruta):")):
+        tk.Label(form_frame, text=texto).grid(row=fila, column=0, sticky="e")
+        campos[clave] = tk.Entry(form_frame, width=50)
+        campos[clave].grid(row=fila, column=1, pady=5)
 
     tk.Label(form_frame, text="Moneda:").grid(row=3, column=0, sticky="e")
-    combo_moneda = ttk.Combobox(form_frame, values=["USD","CUP"], state="readonly", width=47)
-    combo_moneda.current(0)
-    combo_moneda.grid(row=3, column=1, pady=5)
-
-    tk.Label(form_frame, text="Stock mínimo:").grid(row=4, column=0, sticky="e")
-    entry_stock_min = tk.Entry(form_frame, width=50)
-    entry_stock_min.insert(0, "5")
-    entry_stock_min.grid(row=4, column=1, pady=5)
-
-    tk.Label(form_frame, text="Imagen (ruta):").grid(row=5, column=0, sticky="e")
-    entry_imagen = tk.Entry(form_frame, width=50)
-    entry_imagen.grid(row=5, column=1, pady=5)
+    campos["moneda"] = ttk.Combobox(form_frame, values=["USD","CUP"], state="readonly", width=47)
+    campos["moneda"].grid(row=3, column=1, pady=5)
 
     def seleccionar_imagen():
         archivo = filedialog.askopenfilename(filetypes=[("Imagenes", "*.jpg *.jpeg *.png *.gif")])
         if archivo:
-            entry_imagen.delete(0, tk.END)
-            entry_imagen.insert(0, archivo)
+            campos["imagen"].delete(0, tk.END)
+            campos["imagen"].insert(0, archivo)
     tk.Button(form_frame, text="Seleccionar Imagen", command=seleccionar_imagen).grid(row=5, column=2, padx=5)
 
-    def guardar():
-        nombre = entry_nombre.get().strip()
-        try:
-            cantidad = int(entry_cantidad.get().strip())
-            precio = float(entry_precio.get().strip())
-            stock_min = int(entry_stock_min.get().strip())
-        except:
-            messagebox.showerror("Error", "Cantidad, Precio y Stock mínimo deben ser numéricos")
-            return
-        moneda = combo_moneda.get()
-        imagen = entry_imagen.get().strip()
-        if not nombre:
-            messagebox.showerror("Error", "El nombre es obligatorio")
-            return
-        cursor.execute("INSERT INTO productos (nombre, cantidad, precio, moneda, imagen, stock_minimo) VALUES (?, ?, ?, ?, ?, ?)",
-                       (nombre, cantidad, precio, moneda, imagen, stock_min))
-        conn.commit()
-        messagebox.showinfo("Éxito", "Producto agregado correctamente")
-        mostrar_productos()
-
-    tk.Button(f, text="Guardar", command=guardar, bg="#4CAF50", fg="white").pack(pady=15)
+    tk.Button(f, text=texto_guardar, command=lambda: guardar(campos), bg=color, fg="white").pack(pady=15)
     tk.Button(f, text="Volver", command=mostrar_productos).pack()
+    return campos
+
+def llenar_formulario_producto(campos, nombre="", cantidad="", precio="", moneda="USD", imagen="", stock_minimo=5):
+    for clave, valor in (("nombre", nombre), ("cantidad", cantidad), ("precio", precio),
+                         ("stock_minimo", stock_minimo), ("imagen", imagen)):
+        campos[clave].delete(0, tk.END)
+        campos[clave].insert(0, "" if valor is None else valor)
+    campos["moneda"].set(moneda)
+
+def leer_formulario_producto(campos):
+    # (nombre, cantidad, precio, moneda, imagen, stock_minimo) o None si hay errores
+    nombre = campos["nombre"].get().strip()
+    try:
+        cantidad = int(campos["cantidad"].get().strip())
+        precio = float(campos["precio"].get().strip())
+        stock_min = int(campos["stock_minimo"].get().strip())
+    except:
+        messagebox.showerror("Error", "Cantidad, Precio y Stock mínimo deben ser numéricos")
+        return None
+    if not nombre:
+        messagebox.showerror("Error", "El nombre es obligatorio")
+        return None
+    return nombre, cantidad, precio, campos["moneda"].get(), campos["imagen"].get().strip(), stock_min
+
+# --- Agregar producto ---
+def guardar_producto_nuevo(campos):
+    datos = leer_formulario_producto(campos)
+    if datos is None:
+        return
+    agregar_producto(conn, *datos)
+    messagebox.showinfo("Éxito", "Producto agregado correctamente")
+    mostrar_productos()
+
+campos_agregar = construir_formulario_producto(frames["agregar_producto"], "Agregar Producto", "Guardar",
+                                               "#4CAF50", guardar_producto_nuevo)
+
+@perfilado.medir_pantalla
+def mostrar_agregar_producto():
+    llenar_formulario_producto(campos_agregar)
+    mostrar_frame("agregar_producto")
 
 # --- Editar producto ---
 editar_producto_data = {}
@@ -315,85 +670,28 @@ def editar_producto_seleccionado():
     if not datos:
         return
     producto_id = datos[0]
-    cursor.execute("SELECT nombre, cantidad, precio, moneda, imagen, stock_minimo FROM productos WHERE id=?", (producto_id,))
-    p = cursor.fetchone()
+    p = obtener_producto(conn_lectura, producto_id)
     if not p:
         messagebox.showerror("Error", "Producto no encontrado")
         return
     editar_producto_data["id"] = producto_id
     mostrar_editar_producto(p)
 
-def mostrar_editar_producto(p):
-    ocultar_frames()
-    f = frames["editar_producto"]
-    f.place(relwidth=1, relheight=1)
-    for widget in f.winfo_children():
-        widget.destroy()
-
-    tk.Label(f, text="Editar Producto", font=("Arial", 20)).pack(pady=20)
-    form_frame = tk.Frame(f)
-    form_frame.pack()
-
-    tk.Label(form_frame, text="Nombre:").grid(row=0, column=0, sticky="e")
-    entry_nombre = tk.Entry(form_frame, width=50)
-    entry_nombre.insert(0, p[0])
-    entry_nombre.grid(row=0, column=1, pady=5)
-
-    tk.Label(form_frame, text="Cantidad:").grid(row=1, column=0, sticky="e")
-    entry_cantidad = tk.Entry(form_frame, width=50)
-    entry_cantidad.insert(0, p[1])
-    entry_cantidad.grid(row=1, column=1, pady=5)
-
-    tk.Label(form_frame, text="Precio:").grid(row=2, column=0, sticky="e")
-    entry_precio = tk.Entry(form_frame, width=50)
-    entry_precio.insert(0, p[2])
-    entry_precio.grid(row=2, column=1, pady=5)
-
-    tk.Label(form_frame, text="Moneda:").grid(row=3, column=0, sticky="e")
-    combo_moneda = ttk.Combobox(form_frame, values=["USD","CUP"], state="readonly", width=47)
-    combo_moneda.set(p[3])
-    combo_moneda.grid(row=3, column=1, pady=5)
-
-    tk.Label(form_frame, text="Stock mínimo:").grid(row=4, column=0, sticky="e")
-    entry_stock_min = tk.Entry(form_frame, width=50)
-    entry_stock_min.insert(0, p[5])
-    entry_stock_min.grid(row=4, column=1, pady=5)
+def guardar_producto_editado(campos):
+    datos = leer_formulario_producto(campos)
+    if datos is None:
+        return
+    actualizar_producto(conn, editar_producto_data["id"], *datos)
+    messagebox.showinfo("Éxito", "Producto actualizado correctamente")
+    mostrar_productos()
 
-    tk.Label(form_frame, text="Imagen (ruta):").grid(row=5, column=0, sticky="e")
-    entry_imagen = tk.Entry(form_frame, width=50)
-    entry_imagen.insert(0, p[4])
-    entry_imagen.grid(row=5, column=1, pady=5)
+campos_editar = construir_formulario_producto(frames["editar_producto"], "Editar Producto", "Guardar Cambios",
+                                              "#2196F3", guardar_producto_editado)
 
-    def seleccionar_imagen():
-        archivo = filedialog.askopenfilename(filetypes=[("Imagenes", "*.jpg *.jpeg *.png *.gif")])
-        if archivo:
-            entry_imagen.delete(0, tk.END)
-            entry_imagen.insert(0, archivo)
-    tk.Button(form_frame, text="Seleccionar Imagen", command=seleccionar_imagen).grid(row=5, column=2, padx=5)
-
-    def guardar():
-        nombre = entry_nombre.get().strip()
-        try:
-            cantidad = int(entry_cantidad.get().strip())
-            precio = float(entry_precio.get().strip())
-            stock_min = int(entry_stock_min.get().strip())
-        except:
-            messagebox.showerror("Error", "Cantidad, Precio y Stock mínimo deben ser numéricos")
-            return
-        moneda = combo_moneda.get()
-        imagen = entry_imagen.get().strip()
-        if not nombre:
-            messagebox.showerror("Error", "El nombre es obligatorio")
-            return
-        cursor.execute("""
-            UPDATE productos SET nombre=?, cantidad=?, precio=?, moneda=?, imagen=?, stock_minimo=? WHERE id=?
-        """, (nombre, cantidad, precio, moneda, imagen, stock_min, editar_producto_data["id"]))
-        conn.commit()
-        messagebox.showinfo("Éxito", "Producto actualizado correctamente")
-        mostrar_productos()
-
-    tk.Button(f, text="Guardar Cambios", command=guardar, bg="#2196F3", fg="white").pack(pady=15)
-    tk.Button(f, text="Volver", command=mostrar_productos).pack()
+@perfilado.medir_pantalla
+def mostrar_editar_producto(p):
+    llenar_formulario_producto(campos_editar, *p)
+    mostrar_frame("editar_producto")
 
 # --- Eliminar producto ---
 def eliminar_producto_seleccionado():
@@ -408,199 +706,385 @@ def eliminar_producto_seleccionado():
     producto_id = datos[0]
     confirmar = messagebox.askyesno("Confirmar", f"¿Seguro que desea eliminar el producto {datos[1]}?")
     if confirmar:
-        cursor.execute("DELETE FROM productos WHERE id=?", (producto_id,))
-        conn.commit()
+        eliminar_producto(conn, producto_id)
         messagebox.showinfo("Éxito", "Producto eliminado")
         mostrar_productos()
 
 # --- VENDER PRODUCTO ---
 vender_frame = frames["vender"]
 
-def mostrar_vender():
-    ocultar_frames()
-    f = frames["vender"]
-    f.place(relwidth=1, relheight=1)
-    for widget in f.winfo_children():
-        widget.destroy()
+# Índice en memoria para el selector; se recarga solo cuando cambia el catálogo
+indice_productos = IndiceProductos(conn_lectura)
+SUGERENCIAS = 8
 
-    tk.Label(f, text="Realizar Venta", font=("Arial", 24)).pack(pady=10)
+tk.Label(vender_frame, text="Realizar Venta", font=("Arial", 24)).pack(pady=10)
 
-    form_frame = tk.Frame(f)
-    form_frame.pack(pady=5)
+venta_form = tk.Frame(vender_frame)
+venta_form.pack(pady=5)
 
-    tk.Label(form_frame, text="Producto:").grid(row=0, column=0, sticky="e")
-    combo_productos = ttk.Combobox(form_frame, state="readonly", width=50)
-    combo_productos.grid(row=0, column=1, pady=5)
+tk.Label(venta_form, text="Producto:").grid(row=0, column=0, sticky="e")
+entry_venta_producto = tk.Entry(venta_form, width=53)
+entry_venta_producto.grid(row=0, column=1, pady=5)
 
-    tk.Label(form_frame, text="Cantidad:").grid(row=1, column=0, sticky="e")
-    entry_cantidad = tk.Entry(form_frame)
-    entry_cantidad.grid(row=1, column=1, pady=5)
+tree_sugerencias = ttk.Treeview(venta_form, columns=("Precio",), show="tree", height=5, selectmode="browse",
+                                style="Miniaturas.Treeview" if miniaturas.disponible else "Treeview")
+tree_sugerencias.column("#0", width=330)
+tree_sugerencias.column("Precio", width=110)
+tree_sugerencias.grid(row=1, column=1, pady=2)
 
-    tk.Label(form_frame, text="Cliente Nombre:").grid(row=2, column=0, sticky="e")
-    entry_cliente_nombre = tk.Entry(form_frame)
-    entry_cliente_nombre.grid(row=2, column=1, pady=5)
+tk.Label(venta_form, text="Cantidad:").grid(row=2, column=0, sticky="e")
+entry_venta_cantidad = tk.Entry(venta_form)
+entry_venta_cantidad.grid(row=2, column=1, pady=5)
 
-    tk.Label(form_frame, text="Cliente CI:").grid(row=3, column=0, sticky="e")
-    entry_cliente_ci = tk.Entry(form_frame)
-    entry_cliente_ci.grid(row=3, column=1, pady=5)
+tk.Label(venta_form, text="Cliente Nombre:").grid(row=3, column=0, sticky="e")
+entry_cliente_nombre = tk.Entry(venta_form)
+entry_cliente_nombre.grid(row=3, column=1, pady=5)
 
-    tk.Label(form_frame, text="Cliente Dirección:").grid(row=4, column=0, sticky="e")
-    entry_cliente_dir = tk.Entry(form_frame)
-    entry_cliente_dir.grid(row=4, column=1, pady=5)
+tk.Label(venta_form, text="Cliente CI:").grid(row=4, column=0, sticky="e")
+entry_cliente_ci = tk.Entry(venta_form)
+entry_cliente_ci.grid(row=4, column=1, pady=5)
 
-    # Mostrar total
-    label_total = tk.Label(f, text="Total: 0.00", font=("Arial", 14))
-    label_total.pack(pady=5)
+tk.Label(venta_form, text="Cliente Dirección:").grid(row=5, column=0, sticky="e")
+entry_cliente_dir = tk.Entry(venta_form)
+entry_cliente_dir.grid(row=5, column=1, pady=5)
 
-    # Cargar productos al combobox
-    cursor.execute("SELECT id, nombre, precio, moneda FROM productos")
-    lista_productos = cursor.fetchall()
-    productos_map = {f"{p[1]} (Precio: {p[2]} {p[3]})": p for p in lista_productos}
-    combo_productos["values"] = list(productos_map.keys())
+# Mostrar total
+label_total = tk.Label(vender_frame, text="Total: 0.00", font=("Arial", 14))
+label_total.pack(pady=5)
 
-    def actualizar_total(event=None):
-        sel = combo_productos.get()
-        if sel and sel in productos_map:
-            try:
-                cant = int(entry_cantidad.get())
-                if cant < 1:
-                    label_total.config(text="Cantidad debe ser >= 1")
-                    return
-            except:
-                label_total.config(text="Cantidad inválida")
-                return
-            p = productos_map[sel]
-            total = cant * p[2]
-            label_total.config(text=f"Total: {total:.2f} {p[3]}")
-        else:
-            label_total.config(text="Total: 0.00")
+# Producto elegido en el selector (id, nombre, precio, moneda, imagen)
+venta_seleccion = {"producto": None}
 
-    combo_productos.bind("<<ComboboxSelected>>", actualizar_total)
-    entry_cantidad.bind("<KeyRelease>", actualizar_total)
+# Carrito: [(producto, cantidad), ...]
+carrito = []
 
-    def realizar_venta():
-        sel = combo_productos.get()
-        if not sel or sel not in productos_map:
-            messagebox.showerror("Error", "Seleccione un producto")
-            return
+carrito_frame = tk.Frame(vender_frame)
+carrito_frame.pack(pady=5)
+tree_carrito = ttk.Treeview(carrito_frame, columns=("Producto", "Cantidad", "Subtotal"), show="headings", height=6)
+for col, ancho in (("Producto", 300), ("Cantidad", 80), ("Subtotal", 120)):
+    tree_carrito.heading(col, text=col)
+    tree_carrito.column(col, width=ancho)
+tree_carrito.pack(side="left")
+
+def sugerir(event=None):
+    if event is not None and event.keysym in ("Down", "Up", "Return", "Tab"):
+        return
+    venta_seleccion["producto"] = None
+    tree_sugerencias.delete(*tree_sugerencias.get_children())
+    for p in indice_productos.buscar(entry_venta_producto.get(), SUGERENCIAS):
+        tree_sugerencias.insert("", "end", iid=str(p[0]), text=p[1], values=(f"{p[2]} {p[3]}",))
+    app.after_idle(poner_miniaturas, tree_sugerencias, ruta_sugerencia)
+    actualizar_total()
+
+def ruta_sugerencia(iid):
+    p = indice_productos.productos.get(int(iid))
+    return p[4] if p else None
+
+def elegir_sugerencia(event=None):
+    sel = tree_sugerencias.selection()
+    if not sel:
+        return
+    p = indice_productos.productos.get(int(sel[0]))
+    if p is None:
+        return
+    venta_seleccion["producto"] = p
+    entry_venta_producto.delete(0, tk.END)
+    entry_venta_producto.insert(0, f"{p[1]} (Precio: {p[2]} {p[3]})")
+    actualizar_total()
+
+def ir_a_sugerencias(event=None):
+    hijos = tree_sugerencias.get_children()
+    if hijos:
+        tree_sugerencias.focus_set()
+        tree_sugerencias.selection_set(hijos[0])
+        tree_sugerencias.focus(hijos[0])
+
+entry_venta_producto.bind("<KeyRelease>", sugerir)
+entry_venta_producto.bind("<Down>", ir_a_sugerencias)
+entry_venta_producto.bind("<Return>", ir_a_sugerencias)
+tree_sugerencias.bind("<<TreeviewSelect>>", elegir_sugerencia)
+tree_sugerencias.bind("<Return>", lambda e: entry_venta_cantidad.focus_set())
+tree_sugerencias.bind("<Double-1>", lambda e: entry_venta_cantidad.focus_set())
+
+def totales_carrito():
+    totales = {}
+    for p, cant in carrito:
+        totales[p[3]] = totales.get(p[3], 0) + cant * p[2]
+    return "  +  ".join(f"{t:.2f} {m}" for m, t in totales.items())
+
+def refrescar_carrito():
+    tree_carrito.delete(*tree_carrito.get_children())
+    for p, cant in carrito:
+        tree_carrito.insert("", "end", values=(p[1], cant, f"{cant * p[2]:.2f} {p[3]}"))
+    actualizar_total()
+
+def leer_cantidad():
+    try:
+        cant = int(entry_venta_cantidad.get())
+        if cant < 1:
+            raise ValueError()
+    except:
+        messagebox.showerror("Error", "Cantidad inválida")
+        return None
+    return cant
+
+def agregar_al_carrito():
+    p = venta_seleccion["producto"]
+    if p is None:
+        messagebox.showerror("Error", "Seleccione un producto")
+        return
+    cant = leer_cantidad()
+    if cant is None:
+        return
+    carrito.append((p, cant))
+    venta_seleccion["producto"] = None
+    entry_venta_producto.delete(0, tk.END)
+    tree_sugerencias.delete(*tree_sugerencias.get_children())
+    entry_venta_cantidad.delete(0, tk.END)
+    refrescar_carrito()
+    entry_venta_producto.focus_set()
+
+def quitar_del_carrito():
+    sel = tree_carrito.selection()
+    if not sel:
+        return
+    del carrito[tree_carrito.index(sel[0])]
+    refrescar_carrito()
+
+carrito_btns = tk.Frame(carrito_frame)
+carrito_btns.pack(side="left", padx=5)
+tk.Button(carrito_btns, text="Agregar al carrito", command=agregar_al_carrito).pack(pady=2, fill="x")
+tk.Button(carrito_btns, text="Quitar", command=quitar_del_carrito).pack(pady=2, fill="x")
+
+def actualizar_total(event=None):
+    if carrito:
+        label_total.config(text=f"Total carrito: {totales_carrito()}")
+        return
+    p = venta_seleccion["producto"]
+    if p is not None:
         try:
-            cant = int(entry_cantidad.get())
+            cant = int(entry_venta_cantidad.get())
             if cant < 1:
-                raise ValueError()
+                label_total.config(text="Cantidad debe ser >= 1")
+                return
         except:
-            messagebox.showerror("Error", "Cantidad inválida")
-            return
-
-        p = productos_map[sel]
-        cursor.execute("SELECT cantidad FROM productos WHERE id=?", (p[0],))
-        stock_actual = cursor.fetchone()[0]
-        if cant > stock_actual:
-            messagebox.showerror("Error", f"No hay suficiente stock. Disponible: {stock_actual}")
+            label_total.config(text="Cantidad inválida")
             return
-
         total = cant * p[2]
+        label_total.config(text=f"Total: {total:.2f} {p[3]}")
+    else:
+        label_total.config(text="Total: 0.00")
+
+entry_venta_cantidad.bind("<KeyRelease>", actualizar_total)
+
+# Las ventas se encolan y un hilo las escribe en grupo (cola_ventas.py): el botón no
+# espera al disco. Si al escribirla otra caja ya vendió ese stock, se avisa aquí.
+def _venta_escrita(venta, recibo_id, error):
+    if error is not None:
+        app.after(0, messagebox.showerror, "Venta no guardada",
+                  f"La venta de las {venta['fecha'][11:]} ({venta['cliente_nombre'] or 'sin cliente'}) "
+                  f"no se pudo guardar:\n{error}")
+
+cola_ventas = ColaVentas(DB_PATH, al_terminar=_venta_escrita)
+if cola_ventas.recuperadas:
+    _sin_stock = sum(isinstance(r[2], StockInsuficiente) for r in cola_ventas.recuperadas)
+    _apartadas = sum(r[2] is not None for r in cola_ventas.recuperadas) - _sin_stock
+    app.after(0, messagebox.showinfo, "Ventas recuperadas",
+              f"Se guardaron {len(cola_ventas.recuperadas) - _sin_stock - _apartadas} ventas que quedaron pendientes "
+              f"al cerrar el programa." + (f"\n{_sin_stock} no se pudieron guardar por falta de stock."
+                                           if _sin_stock else "")
+              + (f"\n{_apartadas} fallaron {INTENTOS_MAX} veces y se apartaron en {cola_ventas.ruta_rechazadas}."
+                 if _apartadas else ""))
+
+def realizar_venta():
+    # Sin carrito se vende directamente el producto seleccionado
+    directo = not carrito
+    if directo:
+        p = venta_seleccion["producto"]
+        if p is None:
+            messagebox.showerror("Error", "Seleccione un producto")
+            return
+        cant = leer_cantidad()
+        if cant is None:
+            return
+        carrito.append((p, cant))
+
+    cliente_nombre = entry_cliente_nombre.get().strip()
+    cliente_ci = entry_cliente_ci.get().strip()
+    cliente_dir = entry_cliente_dir.get().strip()
+
+    lineas = [(p[0], cant, p[2]) for p, cant in carrito]
+    try:
+        cola_ventas.encolar(lineas, cliente_nombre, cliente_ci, cliente_dir, usuario_actual["id"])
+    except StockInsuficiente as e:
+        if directo:
+            carrito.clear()
+        messagebox.showerror("Error", str(e))
+        return
 
-        cliente_nombre = entry_cliente_nombre.get().strip()
-        cliente_ci = entry_cliente_ci.get().strip()
-        cliente_dir = entry_cliente_dir.get().strip()
-
-        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    messagebox.showinfo("Venta", f"Venta realizada con éxito.\nTotal: {totales_carrito()}")
+    mostrar_menu()
 
-        # Actualizar stock
-        nuevo_stock = stock_actual - cant
-        cursor.execute("UPDATE productos SET cantidad=? WHERE id=?", (nuevo_stock, p[0]))
-        # Guardar venta
-        cursor.execute("""
-            INSERT INTO ventas (producto_id, cantidad, total, fecha, cliente_nombre, cliente_ci, cliente_dir, usuario_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (p[0], cant, total, fecha, cliente_nombre, cliente_ci, cliente_dir, usuario_actual["id"]))
-        conn.commit()
+tk.Button(vender_frame, text="Realizar Venta", command=realizar_venta, bg="#4CAF50", fg="white").pack(pady=10)
+tk.Button(vender_frame, text="Volver al Menú", command=mostrar_menu).pack()
 
-        messagebox.showinfo("Venta", f"Venta realizada con éxito. Total: {total:.2f} {p[3]}")
-        mostrar_menu()
+def limpiar_venta():
+    # Cada visita empieza con el formulario y el carrito vacíos
+    venta_seleccion["producto"] = None
+    carrito.clear()
+    for entry in (entry_venta_producto, entry_venta_cantidad, entry_cliente_nombre, entry_cliente_ci, entry_cliente_dir):
+        entry.delete(0, tk.END)
+    tree_sugerencias.delete(*tree_sugerencias.get_children())
+    refrescar_carrito()
 
-    tk.Button(f, text="Realizar Venta", command=realizar_venta, bg="#4CAF50", fg="white").pack(pady=10)
-    tk.Button(f, text="Volver al Menú", command=mostrar_menu).pack()
+@perfilado.medir_pantalla
+def mostrar_vender():
+    limpiar_venta()
+    mostrar_frame("vender")
+    entry_venta_producto.focus_set()
 
 # --- HISTORIAL DE VENTAS ---
 historial_frame = frames["historial"]
 
-tree_ventas = None
-
-def mostrar_historial():
-    ocultar_frames()
-    f = frames["historial"]
-    f.place(relwidth=1, relheight=1)
-    for widget in f.winfo_children():
-        widget.destroy()
-
-    tk.Label(f, text="Historial de Ventas", font=("Arial", 20)).pack(pady=10)
-
-    filtro_frame = tk.Frame(f)
-    filtro_frame.pack(pady=5)
-
-    tk.Label(filtro_frame, text="Buscar producto:").pack(side="left")
-    entry_buscar = tk.Entry(filtro_frame)
-    entry_buscar.pack(side="left", padx=5)
-
-    tk.Label(filtro_frame, text="Fecha Desde (YYYY-MM-DD):").pack(side="left")
-    entry_fecha_desde = tk.Entry(filtro_frame, width=12)
-    entry_fecha_desde.pack(side="left", padx=5)
-
-    tk.Label(filtro_frame, text="Fecha Hasta (YYYY-MM-DD):").pack(side="left")
-    entry_fecha_hasta = tk.Entry(filtro_frame, width=12)
-    entry_fecha_hasta.pack(side="left", padx=5)
-
-    columnas = ("ID Venta", "Producto", "Cantidad", "Total", "Fecha", "Cliente", "CI", "Dirección", "Vendedor")
-    global tree_ventas
-    tree_ventas = ttk.Treeview(f, columns=columnas, show="headings", height=15)
-    for col in columnas:
+# Filtros aplicados en el historial; la exportación a PDF usa los mismos
+ventas_filtros = {"producto": "", "desde": "", "hasta": "", "moneda": "", "vendedor": "", "cliente_ci": "",
+                  "orden": "fecha", "descendente": True}
+
+tk.Label(historial_frame, text="Historial de Ventas", font=("Arial", 20)).pack(pady=10)
+
+filtro_frame = tk.Frame(historial_frame)
+filtro_frame.pack(pady=5)
+
+tk.Label(filtro_frame, text="Buscar producto:").pack(side="left")
+entry_buscar_venta = tk.Entry(filtro_frame)
+entry_buscar_venta.pack(side="left", padx=5)
+
+tk.Label(filtro_frame, text="Fecha Desde (YYYY-MM-DD):").pack(side="left")
+entry_fecha_desde = tk.Entry(filtro_frame, width=12)
+entry_fecha_desde.pack(side="left", padx=5)
+
+tk.Label(filtro_frame, text="Fecha Hasta (YYYY-MM-DD):").pack(side="left")
+entry_fecha_hasta = tk.Entry(filtro_frame, width=12)
+entry_fecha_hasta.pack(side="left", padx=5)
+
+filtro_frame2 = tk.Frame(historial_frame)
+filtro_frame2.pack(pady=2)
+tk.Label(filtro_frame2, text="Moneda:").pack(side="left")
+combo_moneda_ventas = ttk.Combobox(filtro_frame2, values=["Todas"] + list(MONEDAS), state="readonly", width=6)
+combo_moneda_ventas.set("Todas")
+combo_moneda_ventas.pack(side="left", padx=5)
+tk.Label(filtro_frame2, text="Vendedor:").pack(side="left")
+combo_vendedor_ventas = ttk.Combobox(filtro_frame2, values=["Todos"], state="readonly", width=12)
+combo_vendedor_ventas.set("Todos")
+combo_vendedor_ventas.pack(side="left", padx=5)
+tk.Label(filtro_frame2, text="CI cliente:").pack(side="left")
+entry_ci_venta = tk.Entry(filtro_frame2, width=14)
+entry_ci_venta.pack(side="left", padx=5)
+
+columnas_ventas = ("ID Venta", "Producto", "Cantidad", "Total", "Fecha", "Cliente", "CI", "Dirección", "Vendedor")
+# Columna de la tabla -> orden de listar_ventas; cada una con su índice en la base
+ORDEN_COLUMNAS_VENTAS = {"ID Venta": "id", "Cantidad": "cantidad", "Total": "total", "Fecha": "fecha", "CI": "ci"}
+tree_ventas = ttk.Treeview(historial_frame, columns=columnas_ventas, show="headings", height=15)
+for col in columnas_ventas:
+    if col in ORDEN_COLUMNAS_VENTAS:
+        tree_ventas.heading(col, text=col, command=lambda c=col: ordenar_ventas(ORDEN_COLUMNAS_VENTAS[c]))
+    else:
         tree_ventas.heading(col, text=col)
-        tree_ventas.column(col, width=110)
-    tree_ventas.pack(pady=10)
-
-    btn_frame = tk.Frame(f)
-    btn_frame.pack()
-
-    def cargar_ventas():
-        producto_filtro = entry_buscar.get().strip()
-        fecha_desde = entry_fecha_desde.get().strip()
-        fecha_hasta = entry_fecha_hasta.get().strip()
-
-        query = """
-        SELECT v.id, p.nombre, v.cantidad, v.total, v.fecha, v.cliente_nombre, v.cliente_ci, v.cliente_dir, u.usuario
-        FROM ventas v
-        JOIN productos p ON v.producto_id = p.id
-        JOIN usuarios u ON v.usuario_id = u.id
-        WHERE 1=1
-        """
-        params = []
-
-        if producto_filtro:
-            query += " AND p.nombre LIKE ?"
-            params.append(f"%{producto_filtro}%")
-        if fecha_desde:
-            query += " AND v.fecha >= ?"
-            params.append(fecha_desde + " 00:00:00")
-        if fecha_hasta:
-            query += " AND v.fecha <= ?"
-            params.append(fecha_hasta + " 23:59:59")
-
-        query += " ORDER BY v.fecha DESC"
-
-        for i in tree_ventas.get_children():
-            tree_ventas.delete(i)
-        cursor.execute(query, params)
-        filas = cursor.fetchall()
-        for row in filas:
-            tree_ventas.insert("", "end", values=row)
-
-    tk.Button(btn_frame, text="Buscar", command=cargar_ventas).pack(side="left", padx=5)
-    tk.Button(btn_frame, text="Exportar PDF", command=lambda: exportar_pdf_ventas()).pack(side="left", padx=5)
-    tk.Button(btn_frame, text="Volver al Menú", command=mostrar_menu).pack(side="left", padx=5)
+    tree_ventas.column(col, width=110)
+_titulos_orden(tree_ventas, ORDEN_COLUMNAS_VENTAS, "fecha", True)
+tree_ventas.pack(pady=10)
+
+# Paginación por clave (columna de orden, id): cada página se pide a partir de la primera
+# o la última fila de la que se está viendo, cueste lo mismo en la página 1 que en la 10.000
+ventas_pagina = {"numero": 1, "primera": None, "ultima": None, "hay_anterior": False, "hay_siguiente": False}
+
+ventas_nav = tk.Frame(historial_frame)
+ventas_nav.pack(pady=3)
+btn_ventas_ant = tk.Button(ventas_nav, text="< Anterior", command=lambda: paginar_ventas(-1))
+btn_ventas_ant.pack(side="left", padx=3)
+label_pagina_ventas = tk.Label(ventas_nav, text="")
+label_pagina_ventas.pack(side="left", padx=3)
+btn_ventas_sig = tk.Button(ventas_nav, text="Siguiente >", command=lambda: paginar_ventas(1))
+btn_ventas_sig.pack(side="left", padx=3)
+
+def _pintar_ventas(filas):
+    tree_ventas.delete(*tree_ventas.get_children())
+    for row in filas:
+        tree_ventas.insert("", "end", values=row)
+    ventas_pagina["primera"] = clave_venta(filas[0], ventas_filtros["orden"]) if filas else None
+    ventas_pagina["ultima"] = clave_venta(filas[-1], ventas_filtros["orden"]) if filas else None
+    label_pagina_ventas.config(text=f"Página {ventas_pagina['numero']}")
+    btn_ventas_ant.config(state="normal" if ventas_pagina["hay_anterior"] else "disabled")
+    btn_ventas_sig.config(state="normal" if ventas_pagina["hay_siguiente"] else "disabled")
+
+def cargar_ventas():
+    filas = listar_ventas(conn_lectura, limite=VENTAS_POR_PAGINA + 1, **ventas_filtros)
+    ventas_pagina["numero"] = 1
+    ventas_pagina["hay_anterior"] = False
+    ventas_pagina["hay_siguiente"] = len(filas) > VENTAS_POR_PAGINA
+    _pintar_ventas(filas[:VENTAS_POR_PAGINA])
+
+def paginar_ventas(paso):
+    if paso > 0 and ventas_pagina["hay_siguiente"]:
+        filas = listar_ventas(conn_lectura, despues_de=ventas_pagina["ultima"], limite=VENTAS_POR_PAGINA + 1,
+                              **ventas_filtros)
+        ventas_pagina["hay_siguiente"] = len(filas) > VENTAS_POR_PAGINA
+        ventas_pagina["hay_anterior"] = True
+        filas = filas[:VENTAS_POR_PAGINA]
+    elif paso < 0 and ventas_pagina["hay_anterior"]:
+        filas = listar_ventas(conn_lectura, antes_de=ventas_pagina["primera"], limite=VENTAS_POR_PAGINA + 1,
+                              **ventas_filtros)
+        ventas_pagina["hay_anterior"] = len(filas) > VENTAS_POR_PAGINA
+        ventas_pagina["hay_siguiente"] = True
+        filas = filas[-VENTAS_POR_PAGINA:]
+    else:
+        return
+    if not filas:
+        cargar_ventas()
+        return
+    ventas_pagina["numero"] = ventas_pagina["numero"] + paso if ventas_pagina["hay_anterior"] else 1
+    _pintar_ventas(filas)
+
+def buscar_ventas():
+    ventas_filtros["producto"] = entry_buscar_venta.get().strip()
+    ventas_filtros["desde"] = entry_fecha_desde.get().strip()
+    ventas_filtros["hasta"] = entry_fecha_hasta.get().strip()
+    moneda = combo_moneda_ventas.get()
+    ventas_filtros["moneda"] = moneda if moneda in MONEDAS else ""
+    vendedor = combo_vendedor_ventas.get()
+    ventas_filtros["vendedor"] = "" if vendedor == "Todos" else vendedor
+    ventas_filtros["cliente_ci"] = entry_ci_venta.get().strip()
+    cargar_ventas()
 
+def ordenar_ventas(orden):
+    # Mismo encabezado: invierte el sentido; otro: ascendente. El orden va en la consulta
+    # (con su índice) y se vuelve a la primera página.
+    if ventas_filtros["orden"] == orden:
+        ventas_filtros["descendente"] = not ventas_filtros["descendente"]
+    else:
+        ventas_filtros["orden"] = orden
+        ventas_filtros["descendente"] = False
+    _titulos_orden(tree_ventas, ORDEN_COLUMNAS_VENTAS, orden, ventas_filtros["descendente"])
     cargar_ventas()
 
+historial_btns = tk.Frame(historial_frame)
+historial_btns.pack()
+tk.Button(historial_btns, text="Buscar", command=buscar_ventas).pack(side="left", padx=5)
+tk.Button(historial_btns, text="Exportar PDF", command=lambda: exportar_pdf_ventas()).pack(side="left", padx=5)
+tk.Button(historial_btns, text="Exportar CSV", command=exportar_ventas_csv).pack(side="left", padx=5)
+tk.Button(historial_btns, text="Volver al Menú", command=mostrar_menu).pack(side="left", padx=5)
+
+@perfilado.medir_pantalla
+def mostrar_historial():
+    mostrar_frame("historial")
+    combo_vendedor_ventas.config(values=["Todos"] + nombres_usuarios(conn_lectura))
+    # Con los mismos filtros de la última búsqueda; solo se relee si hubo ventas o cambios de catálogo
+    if datos_cambiados("historial", "catalogo", "ventas"):
+        cargar_ventas()
+
+# --- Exportación PDF ---
+# El reporte se genera en un hilo aparte (escribir_pdf_ventas lee la consulta por
+# bloques), así no depende de lo cargado en tree_ventas ni congela la ventana.
 def exportar_pdf_ventas():
     if not tree_ventas.get_children():
         messagebox.showwarning("Advertencia", "No hay ventas para exportar")
@@ -611,92 +1095,381 @@ def exportar_pdf_ventas():
     if not file:
         return
 
-    c = pdf_canvas.Canvas(file, pagesize=letter)
-    width, height = letter
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(40, height - 40, "Reporte de Ventas")
-    c.setFont("Helvetica", 10)
-    y = height - 70
-
-    columnas = ("ID Venta", "Producto", "Cantidad", "Total", "Fecha", "Cliente", "CI", "Dirección", "Vendedor")
-    ancho_col = (width - 80) / len(columnas)
-    for idx, col in enumerate(columnas):
-        c.drawString(40 + idx * ancho_col, y, col)
-    y -= 20
-
-    for item in tree_ventas.get_children():
-        if y < 40:
-            c.showPage()
-            y = height - 40
-        vals = tree_ventas.item(item)["values"]
-        for idx, val in enumerate(vals):
-            txt = str(val)
-            if len(txt) > 15:
-                txt = txt[:12] + "..."
-            c.drawString(40 + idx * ancho_col, y, txt)
-        y -= 15
-
-    c.save()
-    messagebox.showinfo("Exportación", "Reporte PDF generado con éxito")
+    query, params = consulta_ventas(conn_lectura, **ventas_filtros)
+    cancelado = threading.Event()
+
+    ventana = tk.Toplevel(app)
+    ventana.title("Exportando PDF")
+    ventana.transient(app)
+    label_progreso = tk.Label(ventana, text="Preparando reporte...")
+    label_progreso.pack(padx=20, pady=10)
+    barra = ttk.Progressbar(ventana, length=300, mode="determinate")
+    barra.pack(padx=20, pady=5)
+    tk.Button(ventana, text="Cancelar", command=cancelado.set).pack(pady=10)
+    ventana.protocol("WM_DELETE_WINDOW", cancelado.set)
+
+    def actualizar(hechas, total_filas):
+        barra["maximum"] = max(total_filas, 1)
+        barra["value"] = hechas
+        label_progreso.config(text=f"{hechas} de {total_filas} ventas")
+
+    def terminar(ok, error=None):
+        ventana.destroy()
+        if error:
+            messagebox.showerror("Error", f"No se pudo generar el PDF: {error}")
+        elif ok:
+            messagebox.showinfo("Exportación", "Reporte PDF generado con éxito")
+        else:
+            messagebox.showinfo("Exportación", "Exportación cancelada")
+
+    def trabajo():
+        try:
+            ok = escribir_pdf_ventas(file, query, params,
+                                     progreso=lambda h, t: app.after(0, actualizar, h, t),
+                                     cancelado=cancelado)
+            app.after(0, terminar, ok)
+        except Exception as e:
+            app.after(0, terminar, False, e)
+
+    threading.Thread(target=trabajo, daemon=True).start()
 
 # --- REPORTES SIMPLES ---
 reportes_frame = frames["reportes"]
 
-def mostrar_reportes():
-    ocultar_frames()
-    f = frames["reportes"]
-    f.place(relwidth=1, relheight=1)
-    for widget in f.winfo_children():
-        widget.destroy()
+tk.Label(reportes_frame, text="Reportes", font=("Arial", 20)).pack(pady=20)
+# Los totales se convierten a esta moneda con la tasa del momento de cada venta
+reportes_moneda_frame = tk.Frame(reportes_frame)
+reportes_moneda_frame.pack()
+tk.Label(reportes_moneda_frame, text="Moneda:").pack(side="left")
+combo_moneda_reporte = ttk.Combobox(reportes_moneda_frame, values=list(MONEDAS), state="readonly", width=6)
+combo_moneda_reporte.set("USD")
+combo_moneda_reporte.pack(side="left", padx=5)
+combo_moneda_reporte.bind("<<ComboboxSelected>>", lambda e: mostrar_reportes())
+label_reporte_hoy = tk.Label(reportes_frame, text="")
+label_reporte_hoy.pack(pady=5)
+label_reporte_hoy_detalle = tk.Label(reportes_frame, text="")
+label_reporte_hoy_detalle.pack()
+label_reporte_mes = tk.Label(reportes_frame, text="")
+label_reporte_mes.pack(pady=5)
+label_reporte_mes_detalle = tk.Label(reportes_frame, text="")
+label_reporte_mes_detalle.pack()
+
+# Stock y su valor (a precios actuales) al cierre de un día pasado
+reportes_stock_frame = tk.Frame(reportes_frame)
+reportes_stock_frame.pack(pady=5)
+tk.Label(reportes_stock_frame, text="Valor del stock al (YYYY-MM-DD):").pack(side="left")
+entry_stock_fecha = tk.Entry(reportes_stock_frame, width=12)
+entry_stock_fecha.pack(side="left", padx=5)
+label_reporte_stock = tk.Label(reportes_frame, text="")
+label_reporte_stock.pack()
+
+def mostrar_stock_en_fecha():
+    dia = entry_stock_fecha.get().strip() or datetime.now().strftime("%Y-%m-%d")
+    try:
+        datetime.strptime(dia, "%Y-%m-%d")
+        stock = stock_en(conn_lectura, dia)
+        valor = valor_stock_en(conn_lectura, dia)
+    except ValueError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    label_reporte_stock.config(text=f"Al {dia}: {len(stock)} productos, {sum(stock.values())} unidades  |  "
+                                    + (detalle_por_moneda(valor) or "sin stock"))
+
+tk.Button(reportes_stock_frame, text="Ver", command=mostrar_stock_en_fecha).pack(side="left")
+
+def recalcular_resumenes():
+    reconstruir_resumenes_ventas(conn)
+    conn.commit()
+    messagebox.showinfo("Reportes", "Resúmenes de ventas recalculados")
+    datos_pintados.pop("reportes", None)
+    mostrar_reportes()
+
+# El botón de recalcular solo se muestra a los administradores
+reportes_admin = tk.Frame(reportes_frame)
+reportes_admin.pack()
+btn_recalcular = tk.Button(reportes_admin, text="Recalcular resúmenes", command=recalcular_resumenes)
+tk.Button(reportes_frame, text="Análisis para reabastecer", command=lambda: mostrar_analisis()).pack(pady=10)
+tk.Button(reportes_frame, text="Volver al Menú", command=mostrar_menu).pack(pady=30)
 
-    tk.Label(f, text="Reportes", font=("Arial", 20)).pack(pady=20)
+def detalle_por_moneda(totales):
+    return "  |  ".join(f"{moneda or '?'}: {total:.2f}" for moneda, total in sorted(totales.items()))
 
+def cargar_reportes(fecha_hoy, fecha_mes, moneda):
     # Total ventas hoy
-    fecha_hoy = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT SUM(total) FROM ventas WHERE fecha LIKE ?", (fecha_hoy + "%",))
-    total_hoy = cursor.fetchone()[0] or 0
+    total_hoy = total_dia_en(conn_lectura, fecha_hoy, moneda)
+    por_moneda_hoy = totales_dia(conn_lectura, fecha_hoy)
 
     # Total ventas en mes actual
-    fecha_mes = datetime.now().strftime("%Y-%m")
-    cursor.execute("SELECT SUM(total) FROM ventas WHERE fecha LIKE ?", (fecha_mes + "%",))
-    total_mes = cursor.fetchone()[0] or 0
+    total_mes = total_mes_en(conn_lectura, fecha_mes, moneda)
+    por_moneda_mes = totales_mes(conn_lectura, fecha_mes)
 
-    # Mostrar totales
-    tk.Label(f, text=f"Total ventas hoy ({fecha_hoy}): {total_hoy:.2f}").pack(pady=5)
-    tk.Label(f, text=f"Total ventas mes ({fecha_mes}): {total_mes:.2f}").pack(pady=5)
+    label_reporte_hoy.config(text=f"Total ventas hoy ({fecha_hoy}): {total_hoy:.2f} {moneda}")
+    label_reporte_hoy_detalle.config(text=detalle_por_moneda(por_moneda_hoy))
+    label_reporte_mes.config(text=f"Total ventas mes ({fecha_mes}): {total_mes:.2f} {moneda}")
+    label_reporte_mes_detalle.config(text=detalle_por_moneda(por_moneda_mes))
 
-    tk.Button(f, text="Volver al Menú", command=mostrar_menu).pack(pady=30)
+@perfilado.medir_pantalla
+def mostrar_reportes():
+    mostrar_frame("reportes")
+    if usuario_actual["rol"] == "admin":
+        btn_recalcular.pack(pady=10)
+    else:
+        btn_recalcular.pack_forget()
+    fecha_hoy = datetime.now().strftime("%Y-%m-%d")
+    moneda = combo_moneda_reporte.get()
+    if datos_cambiados("reportes", "ventas", "tipo_cambio", extra=(fecha_hoy, moneda)):
+        cargar_reportes(fecha_hoy, fecha_hoy[:7], moneda)
+
+# --- ANÁLISIS DE VENTAS ---
+# Más vendidos, ventas por vendedor, rotación del stock e ingresos por día y semana.
+# Se calcula en un hilo (la primera vez carga todas las ventas en la instantánea).
+analisis_frame = frames["analisis"]
+PERIODOS_ANALISIS = {"7 días": 7, "30 días": 30, "90 días": 90, "365 días": 365}
+
+tk.Label(analisis_frame, text="Análisis de ventas", font=("Arial", 20)).pack(pady=10)
+analisis_filtros = tk.Frame(analisis_frame)
+analisis_filtros.pack()
+tk.Label(analisis_filtros, text="Período:").pack(side="left")
+combo_periodo_analisis = ttk.Combobox(analisis_filtros, values=list(PERIODOS_ANALISIS), state="readonly", width=10)
+combo_periodo_analisis.set("30 días")
+combo_periodo_analisis.pack(side="left", padx=5)
+tk.Label(analisis_filtros, text="Moneda:").pack(side="left")
+combo_moneda_analisis = ttk.Combobox(analisis_filtros, values=list(MONEDAS), state="readonly", width=6)
+combo_moneda_analisis.set("USD")
+combo_moneda_analisis.pack(side="left", padx=5)
+for combo in (combo_periodo_analisis, combo_moneda_analisis):
+    combo.bind("<<ComboboxSelected>>", lambda e: mostrar_analisis())
+label_analisis_estado = tk.Label(analisis_frame, text="")
+label_analisis_estado.pack()
+
+pestanas_analisis = ttk.Notebook(analisis_frame)
+pestanas_analisis.pack(fill="both", expand=True, padx=10, pady=5)
+tablas_analisis = {}
+for clave, titulo, columnas in (
+    ("top", "Más vendidos", ("Producto", "Unidades", "Importe")),
+    ("reabastecer", "Reabastecer", ("Producto", "Stock", "Vendidas", "Por día", "Días de stock", "Rotación")),
+    ("vendedores", "Por vendedor", ("Vendedor", "Ventas", "Unidades", "Importe")),
+    ("dias", "Ingresos por día", ("Día", "Importe")),
+    ("semanas", "Ingresos por semana", ("Semana (lunes)", "Importe")),
+):
+    tree = ttk.Treeview(pestanas_analisis, columns=columnas, show="headings")
+    for col in columnas:
+        tree.heading(col, text=col)
+        tree.column(col, width=300 if col == "Producto" else 110)
+    pestanas_analisis.add(tree, text=titulo)
+    tablas_analisis[clave] = tree
+
+tk.Button(analisis_frame, text="Volver", command=lambda: mostrar_reportes()).pack(pady=10)
+
+def calcular_analisis(conn_hilo, dias, moneda):
+    hasta = datetime.now().date()
+    desde = (hasta - timedelta(days=dias - 1)).isoformat()
+    hasta = hasta.isoformat()
+    return {
+        "top": [(nombre, unidades, f"{importe:.2f}")
+                for _, nombre, unidades, importe in analitica.top_productos(conn_hilo, 50, desde, hasta, moneda)],
+        "reabastecer": [(nombre, stock, vendidas, por_dia, dias_stock, "-" if rotacion is None else rotacion)
+                        for _, nombre, stock, vendidas, por_dia, dias_stock, rotacion
+                        in analitica.rotacion_stock(conn_hilo, dias, limite=100)],
+        "vendedores": [(usuario, ventas, unidades, f"{importe:.2f}")
+                       for _, usuario, ventas, unidades, importe in analitica.por_vendedor(conn_hilo, desde, hasta, moneda)],
+        "dias": [(dia, f"{importe:.2f}") for dia, importe in reversed(analitica.serie_diaria(conn_hilo, desde, hasta, moneda))],
+        "semanas": [(lunes, f"{importe:.2f}")
+                    for lunes, importe in reversed(analitica.serie_semanal(conn_hilo, desde, hasta, moneda))],
+    }
+
+# Si se cambia el período mientras se calcula, solo se pinta el último pedido
+analisis_estado = {"generacion": 0}
+
+def pintar_analisis(generacion, resultado, error):
+    if generacion != analisis_estado["generacion"]:
+        return
+    if error:
+        datos_pintados.pop("analisis", None)
+        label_analisis_estado.config(text=f"No se pudo calcular el análisis: {error}")
+        return
+    for clave, filas in resultado.items():
+        tree = tablas_analisis[clave]
+        tree.delete(*tree.get_children())
+        for fila in filas:
+            tree.insert("", "end", values=fila)
+    label_analisis_estado.config(text="")
+
+@perfilado.medir_pantalla
+def mostrar_analisis():
+    mostrar_frame("analisis")
+    if not analitica.DISPONIBLE:
+        label_analisis_estado.config(text="El análisis necesita NumPy (pip install numpy)")
+        return
+    dias = PERIODOS_ANALISIS[combo_periodo_analisis.get()]
+    moneda = combo_moneda_analisis.get()
+    if datos_cambiados("analisis", "catalogo", "ventas", "tipo_cambio", extra=(dias, moneda, datetime.now().date())):
+        analisis_estado["generacion"] += 1
+        generacion = analisis_estado["generacion"]
+        label_analisis_estado.config(text="Calculando...")
+        _en_segundo_plano(lambda c: calcular_analisis(c, dias, moneda),
+                          lambda resultado, error: pintar_analisis(generacion, resultado, error))
 
 # --- CONFIGURACIÓN ---
 config_frame = frames["config"]
 
-def mostrar_config():
-    ocultar_frames()
-    f = frames["config"]
-    f.place(relwidth=1, relheight=1)
-    for widget in f.winfo_children():
-        widget.destroy()
+tk.Label(config_frame, text="Configuración", font=("Arial", 24)).pack(pady=20)
 
-    tk.Label(f, text="Configuración", font=("Arial", 24)).pack(pady=20)
+tk.Label(config_frame, text="Tipo de Cambio CUP/USD:").pack()
+entry_tipo_cambio = tk.Entry(config_frame)
+entry_tipo_cambio.pack()
 
-    tk.Label(f, text="Tipo de Cambio CUP/USD:").pack()
-    entry_tipo_cambio = tk.Entry(f)
-    entry_tipo_cambio.pack()
-    entry_tipo_cambio.insert(0, str(get_tipo_cambio()))
+def guardar_cambios():
+    try:
+        valor = float(entry_tipo_cambio.get())
+        if valor <= 0:
+            raise ValueError()
+        set_tipo_cambio(conn, valor)
+        messagebox.showinfo("Éxito", "Tipo de cambio actualizado")
+        mostrar_menu()
+    except:
+        messagebox.showerror("Error", "Ingrese un número válido y positivo")
+
+tk.Button(config_frame, text="Guardar", command=guardar_cambios, bg="#4CAF50", fg="white").pack(pady=10)
+
+# Historial: cada tasa rige desde su fecha hasta la siguiente
+tk.Label(config_frame, text="Historial de tasas").pack()
+tree_tasas = ttk.Treeview(config_frame, columns=("Desde", "Tasa"), show="headings", height=6)
+for col in ("Desde", "Tasa"):
+    tree_tasas.heading(col, text=col)
+    tree_tasas.column(col, width=150)
+tree_tasas.pack(pady=5)
+
+# Respaldo: se hace solo cada RESPALDO_CADA_MIN minutos y con el botón
+label_respaldo = tk.Label(config_frame, text="")
+label_respaldo.pack()
+tk.Button(config_frame, text="Respaldar ahora", command=lambda: iniciar_respaldo()).pack(pady=5)
+tk.Button(config_frame, text="Diagnóstico", command=lambda: mostrar_diagnostico()).pack(pady=5)
+tk.Button(config_frame, text="Volver al Menú", command=mostrar_menu).pack()
+
+@perfilado.medir_pantalla
+def mostrar_config():
+    mostrar_frame("config")
+    entry_tipo_cambio.delete(0, tk.END)
+    entry_tipo_cambio.insert(0, str(firma_actual()["tipo_cambio"]))
+    label_respaldo.config(text=respaldo_estado["texto"])
+    if datos_cambiados("config", "tipo_cambio"):
+        tree_tasas.delete(*tree_tasas.get_children())
+        for desde, tasa in historial_tipos_cambio(conn_lectura):
+            tree_tasas.insert("", "end", values=("inicial" if desde.startswith("0001") else desde, tasa))
+
+# --- RESPALDO AUTOMÁTICO ---
+# Corre en un hilo con su propia conexión (respaldo.py): las ventas no esperan.
+RESPALDO_CADA_MIN = float(os.environ.get("INVENTARIO_RESPALDO_MIN", "60"))
+respaldo_estado = {"hilo": None, "texto": "Sin respaldos en esta sesión"}
+
+def _aviso_respaldo(texto):
+    respaldo_estado["texto"] = texto
+    label_respaldo.config(text=texto)
+
+def iniciar_respaldo(manual=True):
+    if respaldo_estado["hilo"] is not None and respaldo_estado["hilo"].is_alive():
+        if manual:
+            messagebox.showinfo("Respaldo", "Ya hay un respaldo en curso")
+        return
 
-    def guardar_cambios():
+    def trabajo():
         try:
-            valor = float(entry_tipo_cambio.get())
-            if valor <= 0:
-                raise ValueError()
-            set_tipo_cambio(valor)
-            messagebox.showinfo("Éxito", "Tipo de cambio actualizado")
-            mostrar_menu()
-        except:
-            messagebox.showerror("Error", "Ingrese un número válido y positivo")
-
-    tk.Button(f, text="Guardar", command=guardar_cambios, bg="#4CAF50", fg="white").pack(pady=10)
-    tk.Button(f, text="Volver al Menú", command=mostrar_menu).pack()
+            archivo, segundos = respaldo.respaldar(
+                DB_PATH, progreso=lambda h, t: app.after(0, _aviso_respaldo, f"Respaldando... {h * 100 // max(t, 1)} %"))
+            texto = f"Último respaldo: {os.path.basename(archivo)} ({segundos:.0f} s)"
+        except Exception as e:
+            texto = f"El respaldo falló: {e}"
+        app.after(0, _aviso_respaldo, texto)
+
+    _aviso_respaldo("Respaldando...")
+    respaldo_estado["hilo"] = threading.Thread(target=trabajo, daemon=True)
+    respaldo_estado["hilo"].start()
+
+def respaldo_programado():
+    iniciar_respaldo(manual=False)
+    app.after(int(RESPALDO_CADA_MIN * 60 * 1000), respaldo_programado)
+
+if RESPALDO_CADA_MIN > 0:
+    app.after(int(RESPALDO_CADA_MIN * 60 * 1000), respaldo_programado)
+
+# --- INSTANTÁNEAS DE STOCK ---
+# Con el programa abierto semanas también se guardan (movimientos_stock.py), así
+# el stock en una fecha nunca recorre más de una semana de movimientos
+INSTANTANEA_REVISAR_MIN = 30
+
+def instantanea_programada():
+    try:
+        instantanea_si_hace_falta(conn)
+    except sqlite3.OperationalError:
+        # Base ocupada: se intenta en la próxima vuelta
+        pass
+    app.after(INSTANTANEA_REVISAR_MIN * 60 * 1000, instantanea_programada)
+
+app.after(INSTANTANEA_REVISAR_MIN * 60 * 1000, instantanea_programada)
+
+# --- DIAGNÓSTICO (solo admin) ---
+diagnostico_frame = frames["diagnostico"]
+
+tk.Label(diagnostico_frame, text="Diagnóstico", font=("Arial", 20)).pack(pady=10)
+if perfilado.ACTIVO:
+    tk.Label(diagnostico_frame, text=f"Sentencias de más de {perfilado.UMBRAL_LENTO_MS:.0f} ms se guardan en {perfilado.ARCHIVO_LOG}").pack()
+
+    columnas_stats = ("Sentencia / pantalla", "Veces", "Total ms", "Media ms", "p95 ms", "Máx ms", "Filas")
+    tree_stats = ttk.Treeview(diagnostico_frame, columns=columnas_stats, show="headings", height=12)
+    for col in columnas_stats:
+        tree_stats.heading(col, text=col)
+        tree_stats.column(col, width=420 if col == columnas_stats[0] else 75)
+    tree_stats.pack(pady=5)
+
+    tk.Label(diagnostico_frame, text="Consultas lentas recientes").pack()
+    tree_lentas = ttk.Treeview(diagnostico_frame, columns=("Hora", "ms", "Filas", "Sentencia", "Plan"), show="headings", height=6)
+    for col, ancho in (("Hora", 70), ("ms", 60), ("Filas", 60), ("Sentencia", 380), ("Plan", 320)):
+        tree_lentas.heading(col, text=col)
+        tree_lentas.column(col, width=ancho)
+    tree_lentas.pack(pady=5)
+
+    tk.Label(diagnostico_frame, text="Sentencias ejecutadas por SQLite (incluye triggers y BEGIN/COMMIT)").pack()
+    tree_sentencias = ttk.Treeview(diagnostico_frame, columns=("Sentencia", "Veces"), show="headings", height=6)
+    tree_sentencias.heading("Sentencia", text="Sentencia")
+    tree_sentencias.column("Sentencia", width=700)
+    tree_sentencias.heading("Veces", text="Veces")
+    tree_sentencias.column("Veces", width=75)
+    tree_sentencias.pack(pady=5)
+
+    diagnostico_btns = tk.Frame(diagnostico_frame)
+    diagnostico_btns.pack(pady=5)
+    tk.Button(diagnostico_btns, text="Refrescar", command=lambda: refrescar_diagnostico()).pack(side="left", padx=5)
+    tk.Button(diagnostico_btns, text="Reiniciar", command=lambda: reiniciar_diagnostico()).pack(side="left", padx=5)
+    tk.Button(diagnostico_btns, text="Volver", command=mostrar_config).pack(side="left", padx=5)
+else:
+    tk.Label(diagnostico_frame, text="El perfilado está desactivado.\n"
+                                     "Inicie el programa con --perfil o con INVENTARIO_PERFIL=1 para medir consultas y pantallas.").pack(pady=20)
+    tk.Button(diagnostico_frame, text="Volver", command=mostrar_config).pack()
+
+def refrescar_diagnostico():
+    tree_stats.delete(*tree_stats.get_children())
+    for clave, e in perfilado.resumen():
+        tree_stats.insert("", "end", values=(clave[:150], e["veces"], f"{e['total_ms']:.1f}",
+                                             f"{e['total_ms'] / e['veces']:.2f}", perfilado.percentil(e, 0.95),
+                                             f"{e['max_ms']:.1f}", e["filas"]))
+    tree_lentas.delete(*tree_lentas.get_children())
+    for fila in reversed(perfilado.lentas()):
+        tree_lentas.insert("", "end", values=fila)
+    tree_sentencias.delete(*tree_sentencias.get_children())
+    for sql, veces in perfilado.sentencias()[:100]:
+        tree_sentencias.insert("", "end", values=(sql[:150], veces))
+
+def reiniciar_diagnostico():
+    perfilado.reiniciar()
+    refrescar_diagnostico()
+
+def mostrar_diagnostico():
+    if usuario_actual["rol"] != "admin":
+        return
+    mostrar_frame("diagnostico")
+    if perfilado.ACTIVO:
+        refrescar_diagnostico()
 
 # --- Conectar botones ---
 btn_productos.config(command=mostrar_productos)
@@ -705,6 +1478,13 @@ btn_historial.config(command=mostrar_historial)
 btn_reportes.config(command=mostrar_reportes)
 btn_config.config(command=mostrar_config)
 
+# Al cerrar la ventana se terminan de escribir las ventas encoladas
+def cerrar_aplicacion():
+    cola_ventas.cerrar()
+    app.destroy()
+
+app.protocol("WM_DELETE_WINDOW", cerrar_aplicacion)
+
 # --- Iniciar con login ---
 mostrar_login()
 
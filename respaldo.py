@@ -0,0 +1,166 @@
+# Respaldo en caliente de la base con la API de backup de SQLite.
+#   python respaldo.py [--carpeta respaldos] [ruta.db]     hace un respaldo ahora
+#   python respaldo.py --restaurar respaldo.db.gz nueva.db  descomprime uno
+# Copia PAGINAS_POR_PASO páginas por paso con una pausa entre pasos, desde su propia
+# conexión de lectura: en modo WAL las ventas siguen confirmándose mientras tanto.
+# Si otra conexión escribe a mitad de la copia, SQLite la empieza de nuevo; tras
+# REINICIOS_MAX reinicios se copia lo que falta de una vez (con WAL es una lectura
+# más, no frena a las cajas). Cada generación se comprueba con integrity_check, se
+# guarda comprimida (gzip) y se conservan las GENERACIONES más recientes.
+# Los archivos de años (archivado.py) no cambian: se copian cuando son nuevos.
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+from archivado import anios_archivados, ruta_principal
+from conexion import abrir_conexion
+
+CARPETA = os.environ.get("INVENTARIO_RESPALDOS", "respaldos")
+GENERACIONES = int(os.environ.get("INVENTARIO_RESPALDOS_GUARDAR", "7"))
+PAGINAS_POR_PASO = 256
+PAUSA_ENTRE_PASOS = 0.02
+REINICIOS_MAX = 3
+
+class ErrorRespaldo(Exception):
+    pass
+
+class _Reiniciar(Exception):
+    pass
+
+def _comprimir(origen, destino):
+    temporal = destino + ".tmp"
+    with open(origen, "rb") as entrada, gzip.open(temporal, "wb", compresslevel=6) as salida:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+    # Leerlo entero comprueba el CRC de gzip antes de darlo por bueno
+    with gzip.open(temporal, "rb") as prueba:
+        while prueba.read(1024 * 1024):
+            pass
+    with open(temporal, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(temporal, destino)
+
+def _copiar(conn, destino, progreso=None, cancelado=None):
+    estado = {"restante": None, "reinicios": 0}
+
+    def paso(status, restante, total):
+        # Si quedan más páginas que en el paso anterior, la copia empezó de nuevo
+        if estado["restante"] is not None and restante > estado["restante"]:
+            estado["reinicios"] += 1
+        estado["restante"] = restante
+        if cancelado is not None and cancelado.is_set():
+            raise ErrorRespaldo("Respaldo cancelado")
+        if estado["reinicios"] >= REINICIOS_MAX:
+            raise _Reiniciar()
+        if progreso:
+            progreso(total - restante, total)
+
+    copia = sqlite3.connect(destino)
+    try:
+        try:
+            conn.backup(copia, pages=PAGINAS_POR_PASO, progress=paso, sleep=PAUSA_ENTRE_PASOS)
+        except _Reiniciar:
+            conn.backup(copia)
+        revision = copia.execute("PRAGMA integrity_check").fetchone()[0]
+        # La copia queda como una base normal (sin WAL) para poder abrirla suelta
+        copia.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        copia.close()
+    if revision != "ok":
+        raise ErrorRespaldo(f"La copia no pasó integrity_check: {revision}")
+    return estado["reinicios"]
+
+def generaciones(carpeta=CARPETA, base=None):
+    # Respaldos de la base principal, del más reciente al más antiguo
+    try:
+        nombres = os.listdir(carpeta)
+    except OSError:
+        return []
+    return sorted((n for n in nombres if n.endswith(".db.gz") and "-ventas-" not in n
+                   and (base is None or n.startswith(base + "-"))), reverse=True)
+
+def respaldar(ruta, carpeta=CARPETA, guardar=GENERACIONES, progreso=None, cancelado=None):
+    # Devuelve (archivo, segundos). progreso(hechas, total) en páginas; cancelado: threading.Event
+    inicio = time.perf_counter()
+    os.makedirs(carpeta, exist_ok=True)
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    # Con microsegundos (y un número si aun así coincide) dos respaldos seguidos no se pisan
+    nombre = f"{base}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+    destino = os.path.join(carpeta, f"{nombre}.db.gz")
+    repetido = 1
+    while os.path.exists(destino):
+        destino = os.path.join(carpeta, f"{nombre}-{repetido}.db.gz")
+        repetido += 1
+    temporal = os.path.join(carpeta, f".{os.path.basename(destino)}.tmp")
+    conn = abrir_conexion(ruta, solo_lectura=True)
+    try:
+        _copiar(conn, temporal, progreso, cancelado)
+        _comprimir(temporal, destino)
+        _respaldar_archivos(conn, carpeta)
+    finally:
+        conn.close()
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    for viejo in generaciones(carpeta, base)[guardar:]:
+        try:
+            os.remove(os.path.join(carpeta, viejo))
+        except OSError:
+            pass
+    return destino, time.perf_counter() - inicio
+
+def _respaldar_archivos(conn, carpeta):
+    carpeta_base = os.path.dirname(os.path.abspath(ruta_principal(conn)))
+    for archivo in anios_archivados(conn).values():
+        origen = os.path.join(carpeta_base, archivo)
+        destino = os.path.join(carpeta, archivo + ".gz")
+        if not os.path.exists(origen):
+            continue
+        if os.path.exists(destino) and os.path.getmtime(destino) >= os.path.getmtime(origen):
+            continue
+        temporal = destino[:-3] + ".tmp"
+        fuente = sqlite3.connect(origen)
+        try:
+            _copiar(fuente, temporal)
+            _comprimir(temporal, destino)
+        finally:
+            fuente.close()
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+def restaurar(respaldo, destino):
+    # Descomprime un respaldo en una base nueva (no sobrescribe ninguna existente)
+    if os.path.exists(destino):
+        raise ErrorRespaldo(f"{destino} ya existe; elija otro nombre")
+    temporal = destino + ".tmp"
+    with gzip.open(respaldo, "rb") as entrada, open(temporal, "wb") as salida:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+    conn = sqlite3.connect(temporal)
+    try:
+        revision = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    if revision != "ok":
+        os.remove(temporal)
+        raise ErrorRespaldo(f"El respaldo está dañado: {revision}")
+    os.replace(temporal, destino)
+
+if __name__ == "__main__":
+    import sys
+
+    from inventario import DB_PATH
+
+    args = sys.argv[1:]
+    carpeta = CARPETA
+    if "--carpeta" in args:
+        i = args.index("--carpeta")
+        carpeta = args[i + 1]
+        del args[i:i + 2]
+    if len(args) == 3 and args[0] == "--restaurar":
+        restaurar(args[1], args[2])
+        print(f"Restaurado en {args[2]}")
+    else:
+        archivo, segundos = respaldar(args[0] if args else DB_PATH, carpeta)
+        print(f"Respaldo {archivo} ({os.path.getsize(archivo) // 1024} KB, {segundos:.1f} s)")
@@ -0,0 +1,338 @@
+# Servicio HTTP/JSON local sobre el inventario, para lectores de códigos, una
+# segunda pantalla de caja u otros programas de la tienda.
+#   python servidor_api.py [--host 127.0.0.1] [--puerto 8765] [--lectores 4] [ruta.db]
+# Usa las mismas funciones que la interfaz (inventario.py). Cada petición toma una
+# conexión de un pool acotado (lectura o escritura) y la devuelve al terminar; si
+# no hay ninguna libre en ESPERA_POOL segundos responde 503. Autenticación HTTP
+# Basic con los usuarios de la aplicación.
+#   GET  /productos?q=&despues_de=&limite=      página del catálogo (id > despues_de)
+#   GET  /productos/<id>
+#   GET  /productos/stock_bajo?limite=
+#   GET  /ventas?producto=&desde=&hasta=&despues_de=<fecha>,<id>&limite=
+#   POST /ventas  {"lineas": [{"producto_id": 1, "cantidad": 2}], "cliente_nombre": ...}
+#   GET  /reportes?fecha=YYYY-MM-DD&moneda=CUP
+#   GET  /tipo_cambio
+import base64
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import inventario
+from conexion import abrir_conexion
+from inventario import (
+    MONEDAS, StockInsuficiente, autenticar, consultar_productos_pagina, firma_datos, get_tipo_cambio,
+    inicializar_base, listar_ventas, obtener_producto, productos_stock_bajo, registrar_venta, total_dia_en,
+    total_mes_en, totales_dia, totales_mes,
+)
+from movimientos_stock import instantanea_si_hace_falta
+
+LECTORES = 4
+ESCRITORES = 2
+ESPERA_POOL = 5
+LIMITE_MAXIMO = 500
+CREDENCIALES_VALIDAS_SEG = 60
+CUERPO_MAXIMO = 1_000_000
+
+class ErrorPeticion(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+# --- POOL DE CONEXIONES ---
+class PoolConexiones:
+    def __init__(self, ruta, tamano, solo_lectura=False):
+        # LIFO: se reutiliza la conexión más reciente, que tiene la caché de páginas caliente
+        self._libres = queue.LifoQueue()
+        self._todas = [abrir_conexion(ruta, solo_lectura=solo_lectura, check_same_thread=False)
+                       for _ in range(tamano)]
+        for conn in self._todas:
+            self._libres.put(conn)
+
+    @contextmanager
+    def conexion(self, espera=ESPERA_POOL):
+        try:
+            conn = self._libres.get(timeout=espera)
+        except queue.Empty:
+            raise ErrorPeticion(503, "Servidor ocupado, reintente")
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._libres.put(conn)
+
+    def cerrar(self):
+        for conn in self._todas:
+            conn.close()
+
+# --- PETICIONES ---
+def _entero(params, nombre, defecto=None, maximo=None, minimo=None):
+    valor = params.get(nombre, "")
+    if valor == "":
+        return defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorPeticion(400, f"{nombre} debe ser un número entero")
+    # Un límite negativo sería "sin límite" para SQLite
+    if minimo is not None and numero < minimo:
+        raise ErrorPeticion(400, f"{nombre} debe ser al menos {minimo}")
+    return min(numero, maximo) if maximo else numero
+
+def _fila_producto(f):
+    return {"id": f[0], "nombre": f[1], "cantidad": f[2], "precio": f[3], "moneda": f[4],
+            "stock_minimo": f[5], "imagen": f[6]}
+
+def _fila_venta(f):
+    return {"id": f[0], "producto": f[1], "cantidad": f[2], "total": f[3], "fecha": f[4],
+            "cliente_nombre": f[5], "cliente_ci": f[6], "cliente_dir": f[7], "vendedor": f[8]}
+
+def productos(conn, usuario, params, cuerpo):
+    limite = _entero(params, "limite", inventario.PRODUCTOS_POR_PAGINA, LIMITE_MAXIMO, 1)
+    filas = consultar_productos_pagina(conn, params.get("q", ""), despues_de=_entero(params, "despues_de"),
+                                       limite=limite)
+    return {"productos": [_fila_producto(f) for f in filas],
+            "siguiente": filas[-1][0] if len(filas) == limite else None}
+
+def producto(conn, usuario, params, cuerpo, producto_id):
+    f = obtener_producto(conn, int(producto_id))
+    if f is None:
+        raise ErrorPeticion(404, "Producto no encontrado")
+    return {"id": int(producto_id), "nombre": f[0], "cantidad": f[1], "precio": f[2], "moneda": f[3],
+            "imagen": f[4], "stock_minimo": f[5]}
+
+def stock_bajo(conn, usuario, params, cuerpo):
+    filas = productos_stock_bajo(conn, limite=_entero(params, "limite", 50, LIMITE_MAXIMO, 1))
+    return {"productos": [{"id": f[0], "nombre": f[1], "cantidad": f[2], "stock_minimo": f[3]} for f in filas]}
+
+def ventas(conn, usuario, params, cuerpo):
+    limite = _entero(params, "limite", inventario.VENTAS_POR_PAGINA, LIMITE_MAXIMO, 1)
+    despues_de = None
+    if params.get("despues_de"):
+        fecha, _, venta_id = params["despues_de"].rpartition(",")
+        if not venta_id.isdigit():
+            raise ErrorPeticion(400, "despues_de debe ser <fecha>,<id>")
+        despues_de = (fecha, int(venta_id))
+    filas = listar_ventas(conn, params.get("producto", ""), params.get("desde", ""), params.get("hasta", ""),
+                          despues_de=despues_de, limite=limite)
+    return {"ventas": [_fila_venta(f) for f in filas],
+            "siguiente": f"{filas[-1][4]},{filas[-1][0]}" if len(filas) == limite else None}
+
+def vender(conn, usuario, params, cuerpo):
+    # El precio sale del producto, como en la caja; el cliente solo manda ids y cantidades
+    if not isinstance(cuerpo, dict):
+        raise ErrorPeticion(400, "El cuerpo debe ser un objeto JSON")
+    if not isinstance(cuerpo.get("lineas"), list):
+        raise ErrorPeticion(400, "lineas debe ser una lista")
+    cliente = [cuerpo.get(campo) or "" for campo in ("cliente_nombre", "cliente_ci", "cliente_dir")]
+    if not all(isinstance(valor, str) for valor in cliente):
+        raise ErrorPeticion(400, "cliente_nombre, cliente_ci y cliente_dir deben ser texto")
+    lineas = []
+    for linea in cuerpo["lineas"]:
+        try:
+            producto_id, cantidad = int(linea["producto_id"]), int(linea["cantidad"])
+        except (KeyError, TypeError, ValueError):
+            raise ErrorPeticion(400, "Cada línea necesita producto_id y cantidad enteros")
+        if cantidad <= 0:
+            raise ErrorPeticion(400, "La cantidad debe ser mayor que cero")
+        f = obtener_producto(conn, producto_id)
+        if f is None:
+            raise ErrorPeticion(404, f"Producto {producto_id} no encontrado")
+        lineas.append((producto_id, cantidad, f[2]))
+    if not lineas:
+        raise ErrorPeticion(400, "La venta no tiene líneas")
+    recibo_id = registrar_venta(conn, lineas, *cliente, usuario["id"])
+    # El servicio puede estar semanas en marcha: instantánea de stock cuando toca.
+    # La venta ya está guardada; si la base está ocupada se hará en otra venta.
+    try:
+        instantanea_si_hace_falta(conn)
+    except sqlite3.OperationalError:
+        pass
+    return {"recibo_id": recibo_id}
+
+_reportes = {}
+
+def reportes(conn, usuario, params, cuerpo):
+    fecha = params.get("fecha") or datetime.now().strftime("%Y-%m-%d")
+    moneda = params.get("moneda", "CUP")
+    if moneda not in MONEDAS:
+        raise ErrorPeticion(400, f"moneda debe ser una de {', '.join(MONEDAS)}")
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", fecha):
+        raise ErrorPeticion(400, "fecha debe ser YYYY-MM-DD")
+    # Como la pantalla de reportes: solo se recalcula si hubo ventas o cambió la tasa
+    firma = firma_datos(conn)
+    firma = (firma["ventas"], firma["tipo_cambio"])
+    guardado = _reportes.get((fecha, moneda))
+    if guardado and guardado[0] == firma:
+        return guardado[1]
+    mes = fecha[:7]
+    respuesta = {"moneda": moneda,
+                 "dia": {"fecha": fecha, "total": total_dia_en(conn, fecha, moneda),
+                         "por_moneda": totales_dia(conn, fecha)},
+                 "mes": {"mes": mes, "total": total_mes_en(conn, mes, moneda), "por_moneda": totales_mes(conn, mes)}}
+    if len(_reportes) > 100:
+        _reportes.clear()
+    _reportes[(fecha, moneda)] = (firma, respuesta)
+    return respuesta
+
+def tipo_cambio(conn, usuario, params, cuerpo):
+    return {"tasa": get_tipo_cambio(conn)}
+
+# (método, ruta, función, necesita escritura)
+RUTAS = (
+    ("GET", r"/productos", productos, False),
+    ("GET", r"/productos/stock_bajo", stock_bajo, False),
+    ("GET", r"/productos/(\d+)", producto, False),
+    ("GET", r"/ventas", ventas, False),
+    ("POST", r"/ventas", vender, True),
+    ("GET", r"/reportes", reportes, False),
+    ("GET", r"/tipo_cambio", tipo_cambio, False),
+)
+
+# --- SERVIDOR ---
+class Manejador(BaseHTTPRequestHandler):
+    # HTTP/1.1: el cliente puede reutilizar la conexión entre peticiones
+    protocol_version = "HTTP/1.1"
+    server_version = "InventarioAPI/1"
+    # Cabeceras y cuerpo van en dos escrituras: con Nagle cada respuesta esperaba ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+    def log_message(self, formato, *args):
+        if self.server.registrar:
+            super().log_message(formato, *args)
+
+    def _usuario(self):
+        cabecera = self.headers.get("Authorization", "")
+        if not cabecera.startswith("Basic "):
+            raise ErrorPeticion(401, "Faltan credenciales")
+        cache = self.server.credenciales
+        guardado = cache.get(cabecera)
+        if guardado and guardado[1] > time.monotonic():
+            return guardado[0]
+        try:
+            usuario, _, password = base64.b64decode(cabecera[6:]).decode("utf-8").partition(":")
+        except ValueError:
+            raise ErrorPeticion(401, "Credenciales mal formadas")
+        with self.server.lectores.conexion() as conn:
+            datos = autenticar(conn, usuario, password)
+        if datos is None:
+            raise ErrorPeticion(401, "Usuario o contraseña incorrectos")
+        cache[cabecera] = (datos, time.monotonic() + CREDENCIALES_VALIDAS_SEG)
+        return datos
+
+    def _leer_cuerpo(self):
+        # Se lee antes de enrutar y autenticar: un cuerpo sin leer se tomaría, en una
+        # conexión keep-alive, como el comienzo de la petición siguiente. Si no se
+        # puede leer entero la conexión se cierra tras la respuesta.
+        if self.headers.get("Transfer-Encoding"):
+            self.close_connection = True
+            raise ErrorPeticion(411, "Hace falta Content-Length")
+        try:
+            largo = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            largo = -1
+        if largo < 0:
+            self.close_connection = True
+            raise ErrorPeticion(400, "Content-Length inválido")
+        if largo > CUERPO_MAXIMO:
+            self.close_connection = True
+            raise ErrorPeticion(413, "Cuerpo demasiado grande")
+        return self.rfile.read(largo) if largo else b""
+
+    def _atender(self, metodo):
+        partes = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+        try:
+            crudo = self._leer_cuerpo()
+            for ruta_metodo, patron, funcion, escritura in RUTAS:
+                encontrado = re.fullmatch(patron, partes.path.rstrip("/") or "/")
+                if encontrado and ruta_metodo == metodo:
+                    break
+            else:
+                raise ErrorPeticion(404, "Ruta desconocida")
+            usuario = self._usuario()
+            cuerpo = None
+            if crudo:
+                try:
+                    cuerpo = json.loads(crudo)
+                except ValueError:
+                    raise ErrorPeticion(400, "El cuerpo no es JSON válido")
+            pool = self.server.escritores if escritura else self.server.lectores
+            with pool.conexion() as conn:
+                respuesta = funcion(conn, usuario, params, cuerpo, *encontrado.groups())
+            self._responder(200, respuesta)
+        except ErrorPeticion as e:
+            self._responder(e.estado, {"error": str(e)})
+        except StockInsuficiente as e:
+            self._responder(409, {"error": str(e), "producto": e.nombre, "disponible": e.disponible})
+        except Exception as e:
+            self.log_error("Error en %s %s: %r", metodo, self.path, e)
+            self._responder(500, {"error": "Error interno"})
+
+    def _responder(self, estado, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        if estado == 401:
+            self.send_header("WWW-Authenticate", 'Basic realm="inventario"')
+        elif estado == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+def crear_servidor(ruta, host="127.0.0.1", puerto=8765, lectores=LECTORES, escritores=ESCRITORES, registrar=False):
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    conn.close()
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    servidor.daemon_threads = True
+    servidor.lectores = PoolConexiones(ruta, lectores, solo_lectura=True)
+    servidor.escritores = PoolConexiones(ruta, escritores)
+    servidor.credenciales = {}
+    servidor.registrar = registrar
+    return servidor
+
+def servir(servidor):
+    try:
+        servidor.serve_forever()
+    finally:
+        servidor.server_close()
+        servidor.lectores.cerrar()
+        servidor.escritores.cerrar()
+
+def iniciar_en_hilo(servidor):
+    hilo = threading.Thread(target=servir, args=(servidor,), daemon=True)
+    hilo.start()
+    return hilo
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON del inventario")
+    parser.add_argument("ruta", nargs="?", default=inventario.DB_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--lectores", type=int, default=LECTORES, help="conexiones de lectura en el pool")
+    parser.add_argument("--escritores", type=int, default=ESCRITORES, help="conexiones de escritura en el pool")
+    parser.add_argument("--registrar", action="store_true", help="mostrar cada petición")
+    args = parser.parse_args()
+    servidor = crear_servidor(args.ruta, args.host, args.puerto, args.lectores, args.escritores, args.registrar)
+    print(f"Sirviendo {args.ruta} en http://{args.host}:{args.puerto}")
+    try:
+        servir(servidor)
+    except KeyboardInterrupt:
+        pass
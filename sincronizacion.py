@@ -0,0 +1,309 @@
+# Sincronización entre tiendas a partir del diario de cambios.
+#   python sincronizacion.py otra.db [ruta.db]     intercambia los cambios en los dos sentidos
+# Los triggers de aquí anotan en cambios cada alta, edición, movimiento de stock y
+# baja de productos, cada venta y cada tipo de cambio, numerados por tienda
+# (origen, origen_seq). Para sincronizar basta comparar el último origen_seq de cada
+# origen en las dos bases y copiar solo lo que falta, así el coste depende de los
+# cambios nuevos y no del tamaño de las bases.
+# Reglas para los choques:
+#   - stock: cada tienda envía cuánto subió o bajó (no el total) y se suman todos;
+#     si el resultado queda negativo se anota en sync_conflictos.
+#   - datos del producto y tipos de cambio: gana el cambio más reciente
+#     (fecha UTC y, si empatan, el origen mayor).
+#   - una baja de producto gana a cualquier edición posterior de otra tienda.
+#   - un producto nuevo con un código que ya existe se une al producto existente.
+# Las ventas solo se anotan al crearse: archivarlas (archivado.py) no las borra
+# de las demás tiendas. La configuración viaja como tipos_cambio; la tabla
+# configuracion es solo su copia del último valor.
+import heapq
+import json
+import sqlite3
+
+from movimientos_stock import fijar_motivo, limpiar_motivo
+
+LOTE = 5000
+AHORA_UTC = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+CAMPOS_PRODUCTO = ("codigo", "nombre", "precio_centavos", "moneda", "imagen", "stock_minimo")
+CAMPOS_VENTA = ("cantidad", "total_centavos", "moneda", "fecha", "cliente_nombre", "cliente_ci", "cliente_dir")
+
+# --- TRIGGERS ---
+def _uid_producto(producto_id):
+    # Un producto unido a otro de una tienda remota tiene varios uid: se usa siempre
+    # el menor, el mismo en todas las tiendas
+    return f"""COALESCE((SELECT MIN(uid) FROM sync_claves WHERE tabla = 'productos' AND id = {producto_id}),
+                        (SELECT origen FROM sync_estado WHERE id = 1) || ':' || {producto_id})"""
+
+def _json(campos, fila, *extra):
+    return "json_object(" + ", ".join(list(extra) + [f"'{c}', {fila}.{c}" for c in campos]) + ")"
+
+def _anotar(tabla, clave, operacion, datos):
+    return f"""
+    INSERT INTO cambios (origen, origen_seq, tabla, clave, operacion, datos, fecha)
+    SELECT e.origen, (SELECT COALESCE(MAX(origen_seq), 0) + 1 FROM cambios WHERE origen = e.origen),
+           '{tabla}', {clave}, '{operacion}', {datos}, {AHORA_UTC}
+    FROM sync_estado e WHERE e.id = 1;"""
+
+def crear_diario_cambios(conn):
+    # Mientras se aplican cambios de otra tienda (aplicando = 1) los triggers no anotan nada
+    local = "(SELECT aplicando FROM sync_estado WHERE id = 1) = 0"
+    editado = " OR ".join(f"new.{c} IS NOT old.{c}" for c in CAMPOS_PRODUCTO)
+    venta = _json(CAMPOS_VENTA, "new", f"'producto', {_uid_producto('new.producto_id')}",
+                  "'usuario', (SELECT usuario FROM usuarios WHERE id = new.usuario_id)")
+    triggers = (
+        ("cambios_productos_ai", "AFTER INSERT ON productos", local,
+         _anotar("productos", _uid_producto("new.id"), "I", _json(CAMPOS_PRODUCTO + ("cantidad",), "new"))),
+        ("cambios_productos_au", f"AFTER UPDATE OF {', '.join(CAMPOS_PRODUCTO)} ON productos",
+         f"{local} AND ({editado})",
+         _anotar("productos", _uid_producto("new.id"), "U", _json(CAMPOS_PRODUCTO, "new"))),
+        ("cambios_productos_stock", "AFTER UPDATE OF cantidad ON productos",
+         f"{local} AND new.cantidad IS NOT old.cantidad",
+         _anotar("productos", _uid_producto("new.id"), "S",
+                 "json_object('delta', COALESCE(new.cantidad, 0) - COALESCE(old.cantidad, 0))")),
+        ("cambios_productos_ad", "AFTER DELETE ON productos", local,
+         _anotar("productos", _uid_producto("old.id"), "D", "NULL")),
+        ("cambios_ventas_ai", "AFTER INSERT ON ventas", local,
+         _anotar("ventas", "(SELECT origen FROM sync_estado WHERE id = 1) || ':' || new.id", "I", venta)),
+        ("cambios_tasas_ai", "AFTER INSERT ON tipos_cambio", local,
+         _anotar("tipos_cambio", "new.desde", "I", _json(("desde", "tasa"), "new"))),
+    )
+    for nombre, evento, condicion, cuerpo in triggers:
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {nombre} {evento} WHEN {condicion} BEGIN {cuerpo} END")
+
+def anotar_carga_productos(cursor, cargados, antes):
+    # Lo mismo que anotan los triggers de productos, pero con un INSERT…SELECT por
+    # operación: para cargas masivas (datos_csv.py) hechas con aplicando = 1.
+    # cargados: tabla con los códigos cargados; antes: copia de las filas de productos
+    # que ya existían, tomada antes de la carga.
+    def anotar(operacion, datos, origen_filas, condicion):
+        cursor.execute(f"""
+            INSERT INTO cambios (origen, origen_seq, tabla, clave, operacion, datos, fecha)
+            SELECT e.origen, (SELECT COALESCE(MAX(origen_seq), 0) FROM cambios WHERE origen = e.origen)
+                             + ROW_NUMBER() OVER (ORDER BY p.id),
+                   'productos', {_uid_producto("p.id")}, '{operacion}', {datos}, {AHORA_UTC}
+            FROM {origen_filas} CROSS JOIN sync_estado e
+            WHERE e.id = 1 AND {condicion}
+        """)
+
+    anotar("I", _json(CAMPOS_PRODUCTO + ("cantidad",), "p"),
+           "productos p", f"p.codigo IN (SELECT codigo FROM {cargados}) AND p.id NOT IN (SELECT id FROM {antes})")
+    editado = " OR ".join(f"p.{c} IS NOT a.{c}" for c in CAMPOS_PRODUCTO)
+    anotar("U", _json(CAMPOS_PRODUCTO, "p"), f"{antes} a JOIN productos p ON p.id = a.id", f"({editado})")
+    anotar("S", "json_object('delta', COALESCE(p.cantidad, 0) - COALESCE(a.cantidad, 0))",
+           f"{antes} a JOIN productos p ON p.id = a.id", "p.cantidad IS NOT a.cantidad")
+
+def origen_local(conn):
+    return conn.execute("SELECT origen FROM sync_estado WHERE id = 1").fetchone()[0]
+
+# --- VECTOR DE VERSIONES ---
+def vector_versiones(conn):
+    # {origen: último origen_seq conocido}. Salta de un origen al siguiente por
+    # idx_cambios_origen en vez de agrupar todo el diario.
+    vector = {}
+    origen = ""
+    while True:
+        origen = conn.execute("SELECT MIN(origen) FROM cambios WHERE origen > ?", (origen,)).fetchone()[0]
+        if origen is None:
+            return vector
+        vector[origen] = conn.execute("SELECT MAX(origen_seq) FROM cambios WHERE origen = ?", (origen,)).fetchone()[0]
+
+def cambios_pendientes(conn, vector_destino):
+    # Los cambios que el destino no tiene, en el orden en que los vio esta base
+    # (así un producto llega antes que sus ventas y sus movimientos de stock)
+    por_origen = []
+    for origen, ultimo in vector_versiones(conn).items():
+        desde = vector_destino.get(origen, 0)
+        if ultimo > desde:
+            por_origen.append(conn.execute("""
+                SELECT seq, origen, origen_seq, tabla, clave, operacion, datos, fecha
+                FROM cambios WHERE origen = ? AND origen_seq > ? ORDER BY origen_seq
+            """, (origen, desde)))
+    return heapq.merge(*por_origen)
+
+# --- APLICAR ---
+def _id_local(conn, tabla, uid, local):
+    fila = conn.execute("SELECT id FROM sync_claves WHERE tabla = ? AND uid = ?", (tabla, uid)).fetchone()
+    if fila:
+        return fila[0]
+    origen, _, numero = uid.partition(":")
+    if origen == local and numero.isdigit():
+        return int(numero)
+    return None
+
+def _claves_producto(conn, producto_id, local):
+    claves = [c[0] for c in conn.execute("SELECT uid FROM sync_claves WHERE tabla = 'productos' AND id = ?",
+                                         (producto_id,))]
+    return claves or [f"{local}:{producto_id}"]
+
+def _hay_posterior(conn, tabla, claves, fecha, origen, seq):
+    # ¿Hay ya un cambio más reciente (fecha, origen) de la misma fila?
+    marcas = ", ".join("?" * len(claves))
+    return conn.execute(f"""
+        SELECT 1 FROM cambios WHERE tabla = ? AND clave IN ({marcas}) AND operacion IN ('I', 'U')
+        AND seq <> ? AND (fecha, origen) > (?, ?) LIMIT 1
+    """, (tabla, *claves, seq, fecha, origen)).fetchone() is not None
+
+def _conflicto(conn, tabla, clave, detalle):
+    conn.execute(f"INSERT INTO sync_conflictos (fecha, tabla, clave, detalle) VALUES ({AHORA_UTC}, ?, ?, ?)",
+                 (tabla, clave, detalle))
+
+def _aplicar_producto(conn, operacion, clave, datos, fecha, origen, seq, local):
+    producto_id = _id_local(conn, "productos", clave, local)
+    existe = producto_id is not None and conn.execute(
+        "SELECT 1 FROM productos WHERE id = ?", (producto_id,)).fetchone() is not None
+
+    if operacion == "I":
+        if producto_id is not None:
+            return False
+        fila = None
+        if datos.get("codigo"):
+            fila = conn.execute("SELECT id FROM productos WHERE codigo = ?", (datos["codigo"],)).fetchone()
+        if fila:
+            # Mismo código creado en dos tiendas: un solo producto con las dos claves,
+            # la suma de las existencias de cada una y los datos del alta más reciente
+            claves = _claves_producto(conn, fila[0], local) + [clave]
+            for uid in claves:
+                conn.execute("INSERT OR IGNORE INTO sync_claves (tabla, uid, id) VALUES ('productos', ?, ?)",
+                             (uid, fila[0]))
+            conn.execute("UPDATE productos SET cantidad = COALESCE(cantidad, 0) + ? WHERE id = ?",
+                         (datos.get("cantidad") or 0, fila[0]))
+            if not _hay_posterior(conn, "productos", claves, fecha, origen, seq):
+                conn.execute(f"UPDATE productos SET {', '.join(c + ' = ?' for c in CAMPOS_PRODUCTO)} WHERE id = ?",
+                             [datos.get(c) for c in CAMPOS_PRODUCTO] + [fila[0]])
+            return True
+        columnas = CAMPOS_PRODUCTO + ("cantidad",)
+        cursor = conn.execute(f"INSERT INTO productos ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+                              [datos.get(c) for c in columnas])
+        conn.execute("INSERT INTO sync_claves (tabla, uid, id) VALUES ('productos', ?, ?)", (clave, cursor.lastrowid))
+        return True
+
+    if not existe:
+        # Baja ya aplicada (o el alta nunca llegó): la baja gana
+        return False
+    if operacion == "D":
+        conn.execute("DELETE FROM productos WHERE id = ?", (producto_id,))
+        return True
+    if operacion == "S":
+        conn.execute("UPDATE productos SET cantidad = COALESCE(cantidad, 0) + ? WHERE id = ?",
+                     (datos["delta"], producto_id))
+        cantidad = conn.execute("SELECT cantidad FROM productos WHERE id = ?", (producto_id,)).fetchone()[0]
+        if cantidad < 0:
+            _conflicto(conn, "productos", clave, f"Stock negativo ({cantidad}) al sumar {datos['delta']} de {origen}")
+        return True
+    # operacion == "U"
+    if _hay_posterior(conn, "productos", _claves_producto(conn, producto_id, local), fecha, origen, seq):
+        return False
+    try:
+        conn.execute(f"UPDATE productos SET {', '.join(c + ' = ?' for c in CAMPOS_PRODUCTO)} WHERE id = ?",
+                     [datos.get(c) for c in CAMPOS_PRODUCTO] + [producto_id])
+    except sqlite3.IntegrityError:
+        _conflicto(conn, "productos", clave, f"El código {datos.get('codigo')} ya es de otro producto")
+        return False
+    return True
+
+def _aplicar_venta(conn, clave, datos, local):
+    producto_id = _id_local(conn, "productos", datos["producto"], local) if datos.get("producto") else None
+    if producto_id is None:
+        _conflicto(conn, "ventas", clave, f"Producto desconocido {datos.get('producto')}")
+    usuario = conn.execute("SELECT id FROM usuarios WHERE usuario = ?", (datos.get("usuario"),)).fetchone()
+    conn.execute(f"""
+        INSERT INTO ventas (producto_id, usuario_id, {', '.join(CAMPOS_VENTA)})
+        VALUES (?, ?, {', '.join('?' * len(CAMPOS_VENTA))})
+    """, [producto_id, usuario[0] if usuario else None] + [datos.get(c) for c in CAMPOS_VENTA])
+    return True
+
+def _aplicar_tasa(conn, clave, datos, fecha, origen, seq):
+    if _hay_posterior(conn, "tipos_cambio", [clave], fecha, origen, seq):
+        return False
+    conn.execute("INSERT OR REPLACE INTO tipos_cambio (desde, tasa) VALUES (?, ?)", (datos["desde"], datos["tasa"]))
+    conn.execute("UPDATE configuracion SET tipo_cambio = (SELECT tasa FROM tipos_cambio ORDER BY desde DESC LIMIT 1)")
+    return True
+
+def aplicar_cambios(conn, cambios, progreso=None):
+    # Devuelve (aplicados, descartados). Cada cambio se copia también al diario de
+    # esta base, así se reenvía a una tercera tienda y repetir la sincronización no
+    # aplica nada dos veces.
+    local = origen_local(conn)
+    aplicados = descartados = 0
+    pendientes = 0
+
+    def empezar():
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE sync_estado SET aplicando = 1 WHERE id = 1")
+        fijar_motivo(conn, "sincronizacion")
+
+    def confirmar():
+        conn.execute("UPDATE sync_estado SET aplicando = 0 WHERE id = 1")
+        limpiar_motivo(conn)
+        conn.commit()
+
+    conn.commit()
+    empezar()
+    try:
+        for _seq, origen, origen_seq, tabla, clave, operacion, datos, fecha in cambios:
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO cambios (origen, origen_seq, tabla, clave, operacion, datos, fecha)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (origen, origen_seq, tabla, clave, operacion, datos, fecha))
+            if cursor.rowcount == 0:
+                continue
+            contenido = json.loads(datos) if datos else {}
+            if tabla == "productos":
+                hecho = _aplicar_producto(conn, operacion, clave, contenido, fecha, origen, cursor.lastrowid, local)
+            elif tabla == "ventas":
+                hecho = _aplicar_venta(conn, clave, contenido, local)
+            elif tabla == "tipos_cambio":
+                hecho = _aplicar_tasa(conn, clave, contenido, fecha, origen, cursor.lastrowid)
+            else:
+                hecho = False
+            if hecho:
+                aplicados += 1
+            else:
+                descartados += 1
+            pendientes += 1
+            if pendientes >= LOTE:
+                confirmar()
+                if progreso:
+                    progreso(aplicados, descartados)
+                pendientes = 0
+                empezar()
+        confirmar()
+    except Exception:
+        conn.rollback()
+        raise
+    return aplicados, descartados
+
+def sincronizar(conn_a, conn_b, progreso=None):
+    # Intercambia en los dos sentidos; devuelve ((aplicados, descartados) en b, ídem en a)
+    hacia_b = aplicar_cambios(conn_b, cambios_pendientes(conn_a, vector_versiones(conn_b)), progreso)
+    hacia_a = aplicar_cambios(conn_a, cambios_pendientes(conn_b, vector_versiones(conn_a)), progreso)
+    return hacia_b, hacia_a
+
+def conflictos(conn, despues_de=0):
+    return conn.execute("SELECT id, fecha, tabla, clave, detalle FROM sync_conflictos WHERE id > ? ORDER BY id",
+                        (despues_de,)).fetchall()
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from conexion import abrir_conexion
+    from inventario import DB_PATH, inicializar_base
+
+    if not 2 <= len(sys.argv) <= 3:
+        print("Uso: python sincronizacion.py otra.db [ruta.db]")
+        sys.exit(1)
+    conn_a = abrir_conexion(sys.argv[2] if len(sys.argv) > 2 else DB_PATH)
+    conn_b = abrir_conexion(sys.argv[1])
+    inicializar_base(conn_a)
+    inicializar_base(conn_b)
+    antes = [conn.execute("SELECT COALESCE(MAX(id), 0) FROM sync_conflictos").fetchone()[0] for conn in (conn_a, conn_b)]
+    inicio = time.perf_counter()
+    (b_aplicados, b_descartados), (a_aplicados, a_descartados) = sincronizar(
+        conn_a, conn_b, lambda hechos, descartados: print(f"  {hechos} aplicados, {descartados} descartados"))
+    print(f"{sys.argv[1]}: {b_aplicados} cambios aplicados, {b_descartados} descartados")
+    print(f"{sys.argv[2] if len(sys.argv) > 2 else DB_PATH}: {a_aplicados} cambios aplicados, "
+          f"{a_descartados} descartados ({time.perf_counter() - inicio:.1f} s)")
+    for conn, ultimo in zip((conn_a, conn_b), antes):
+        for _id, _fecha, tabla, clave, detalle in conflictos(conn, ultimo):
+            print(f"  conflicto {tabla} {clave}: {detalle}")
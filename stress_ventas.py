@@ -0,0 +1,105 @@
+# Simula varias cajas vendiendo a la vez contra la misma base de datos.
+#   python stress_ventas.py --vendedores 8 --ventas 500
+#   python stress_ventas.py --cola     cada caja vende por la cola de ventas (cola_ventas.py)
+# Termina con código 1 si hubo errores de bloqueo o si el stock no cuadra.
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from cola_ventas import ColaVentas
+from conexion import abrir_conexion
+from inventario import StockInsuficiente, inicializar_base, registrar_venta
+
+def preparar_base(ruta, productos, stock):
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    conn.executemany("INSERT INTO productos (nombre, cantidad, precio_centavos, moneda) VALUES (?, ?, ?, 'USD')",
+                     [(f"Producto {i}", stock, 150) for i in range(productos)])
+    conn.commit()
+    conn.close()
+
+def vendedor(ruta, usuario_id, ventas, productos, resultados, con_cola=False):
+    conn = abrir_conexion(ruta)
+    lector = abrir_conexion(ruta, solo_lectura=True)
+    hechas = sin_stock = errores = 0
+    espera_max = 0.0
+    # Con la cola, las ventas rechazadas al escribirlas (otra caja vendió antes) llegan aquí
+    rechazadas = []
+
+    def escrita(venta, recibo_id, error):
+        if error is not None:
+            rechazadas.append(error)
+    cola = ColaVentas(ruta, escrita, diario=f"{ruta}.caja{usuario_id}.cola") if con_cola else None
+    for _ in range(ventas):
+        lineas = [(random.randint(1, productos), random.randint(1, 3), 1.5)]
+        inicio = time.perf_counter()
+        try:
+            if cola:
+                cola.encolar(lineas, "", "", "", usuario_id)
+            else:
+                registrar_venta(conn, lineas, "", "", "", usuario_id)
+            hechas += 1
+        except StockInsuficiente:
+            sin_stock += 1
+        except sqlite3.OperationalError:
+            errores += 1
+        espera_max = max(espera_max, time.perf_counter() - inicio)
+        # Una caja también consulta mientras otras escriben
+        lector.execute("SELECT COUNT(*), SUM(total_centavos) FROM ventas").fetchone()
+    if cola:
+        cola.cerrar()
+        hechas -= sum(isinstance(e, StockInsuficiente) for e in rechazadas)
+        sin_stock += sum(isinstance(e, StockInsuficiente) for e in rechazadas)
+        errores += sum(not isinstance(e, StockInsuficiente) for e in rechazadas)
+    resultados.put((hechas, sin_stock, errores, espera_max))
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con varias cajas simultáneas")
+    parser.add_argument("--vendedores", type=int, default=8)
+    parser.add_argument("--ventas", type=int, default=500, help="ventas por vendedor")
+    parser.add_argument("--productos", type=int, default=20)
+    parser.add_argument("--stock", type=int, default=300)
+    parser.add_argument("--cola", action="store_true", help="vender por la cola con escritura en grupo")
+    args = parser.parse_args()
+
+    carpeta = tempfile.mkdtemp()
+    ruta = os.path.join(carpeta, "stress.db")
+    preparar_base(ruta, args.productos, args.stock)
+
+    resultados = multiprocessing.Queue()
+    procesos = [multiprocessing.Process(target=vendedor,
+                                        args=(ruta, i + 1, args.ventas, args.productos, resultados, args.cola))
+                for i in range(args.vendedores)]
+    inicio = time.perf_counter()
+    for p in procesos:
+        p.start()
+    totales = [resultados.get() for _ in procesos]
+    for p in procesos:
+        p.join()
+    duracion = time.perf_counter() - inicio
+
+    hechas = sum(t[0] for t in totales)
+    sin_stock = sum(t[1] for t in totales)
+    errores = sum(t[2] for t in totales)
+
+    conn = sqlite3.connect(ruta)
+    vendidas = conn.execute("SELECT COALESCE(SUM(cantidad), 0) FROM ventas").fetchone()[0]
+    restante = conn.execute("SELECT SUM(cantidad) FROM productos").fetchone()[0]
+    negativos = conn.execute("SELECT COUNT(*) FROM productos WHERE cantidad < 0").fetchone()[0]
+    num_ventas = conn.execute("SELECT COUNT(*) FROM ventas").fetchone()[0]
+    conn.close()
+
+    cuadra = vendidas + restante == args.productos * args.stock and negativos == 0 and num_ventas == hechas
+    print(f"{args.vendedores} vendedores, {hechas} ventas, {sin_stock} sin stock, {errores} errores de bloqueo")
+    print(f"{hechas / duracion:.0f} ventas/s en {duracion:.2f}s; "
+          f"espera máxima de una caja {max(t[3] for t in totales) * 1000:.1f} ms")
+    print(f"Stock: inicial {args.productos * args.stock}, vendido {vendidas}, restante {restante}, negativos {negativos}")
+    print("OK" if cuadra and not errores else "FALLO")
+    return 0 if cuadra and not errores else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
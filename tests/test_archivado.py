@@ -0,0 +1,85 @@
+# Archivar años de ventas no cambia lo que ven el historial ni los reportes, y
+# deshacerlo deja la base como estaba.
+import pytest
+
+from archivado import anios_archivados, archivar, desarchivar_anio
+from conexion import abrir_conexion
+from inventario import (
+    ORDEN_VENTAS, agregar_producto, clave_venta, consulta_ventas, escribir_venta, inicializar_base, listar_ventas,
+    reconstruir_resumenes_ventas, set_tipo_cambio, total_en_moneda,
+)
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = abrir_conexion(str(tmp_path / "tienda.db"))
+    inicializar_base(conn)
+    agregar_producto(conn, "Arroz", 10000, 1.25, "USD", "", 5)
+    agregar_producto(conn, "Frijol", 10000, 30, "CUP", "", 5)
+    set_tipo_cambio(conn, 120, "2023-06-15 12:00:00")
+    set_tipo_cambio(conn, 300, "2024-03-01 00:00:00")
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    for i in range(60):
+        anio = (2023, 2024, 2025)[i % 3]
+        fecha = f"{anio}-{i % 12 + 1:02d}-{i % 5 * 7 + 1:02d} {i % 24:02d}:00:00"
+        # Cantidades y CI repetidos: claves con valores iguales entre años
+        escribir_venta(cursor, [(1 + i % 2, 1 + i % 4, 1.25 if i % 2 == 0 else 30)], fecha, "Ana",
+                       None if i % 7 == 0 else str(i % 3), "", 1)
+    # Ventas del día en que cambió la tasa: se suman venta a venta
+    for hora in ("09:00:00", "15:00:00"):
+        escribir_venta(cursor, [(1, 2, 1.25)], f"2023-06-15 {hora}", "Luis", "9", "", 1)
+    conn.commit()
+    return conn
+
+def _paginas(conn, orden, descendente, limite=7, **filtros):
+    hacia_adelante = []
+    pagina = listar_ventas(conn, orden=orden, descendente=descendente, limite=limite, **filtros)
+    while pagina:
+        hacia_adelante += pagina
+        pagina = listar_ventas(conn, orden=orden, descendente=descendente, limite=limite,
+                               despues_de=clave_venta(pagina[-1], orden), **filtros)
+    hacia_atras = []
+    pagina = hacia_adelante[-1:]
+    while pagina:
+        hacia_atras = pagina + hacia_atras
+        pagina = listar_ventas(conn, orden=orden, descendente=descendente, limite=limite,
+                               antes_de=clave_venta(pagina[0], orden), **filtros)
+    assert hacia_atras == hacia_adelante
+    return hacia_adelante
+
+def _vista(conn):
+    vista = {}
+    for orden in ORDEN_VENTAS:
+        for descendente in (True, False):
+            vista["paginas", orden, descendente] = _paginas(conn, orden, descendente)
+            query, params = consulta_ventas(conn, orden=orden, descendente=descendente)
+            vista["consulta", orden, descendente] = conn.execute(query, params).fetchall()
+    vista["paginas 2024"] = _paginas(conn, "fecha", True, desde="2024-01-01", hasta="2024-12-31")
+    query, params = consulta_ventas(conn, "Arroz", "2023-03-01", "2025-02-01", moneda="USD")
+    vista["consulta filtrada"] = conn.execute(query, params).fetchall()
+    for moneda in ("USD", "CUP"):
+        vista["total", moneda] = total_en_moneda(conn, "2023-01-01", "2025-12-31", moneda)
+        vista["total 2023-06", moneda] = total_en_moneda(conn, "2023-06-01", "2023-06-30", moneda)
+    for tabla in ("ventas_resumen_dia", "ventas_resumen_mes"):
+        vista[tabla] = conn.execute(f"SELECT * FROM {tabla} ORDER BY 1, 2, 3, 4").fetchall()
+    reconstruir_resumenes_ventas(conn)
+    conn.commit()
+    for tabla in ("ventas_resumen_dia", "ventas_resumen_mes"):
+        assert conn.execute(f"SELECT * FROM {tabla} ORDER BY 1, 2, 3, 4").fetchall() == vista[tabla]
+    return vista
+
+def test_archivar_y_deshacer_no_cambian_las_consultas(conn):
+    antes = _vista(conn)
+    assert len(antes["paginas", "fecha", True]) == 62
+    assert antes["consulta", "id", False] == antes["paginas", "id", False]
+
+    assert [anio for anio, _ in archivar(conn, hasta_anio=2024)] == [2023, 2024]
+    assert sorted(anios_archivados(conn)) == [2023, 2024]
+    assert conn.execute("SELECT COUNT(*) FROM main.ventas WHERE fecha < '2025'").fetchone()[0] == 0
+    assert _vista(conn) == antes
+
+    for anio in (2024, 2023):
+        desarchivar_anio(conn, anio)
+    assert anios_archivados(conn) == {}
+    assert conn.execute("SELECT COUNT(*) FROM main.ventas").fetchone()[0] == 62
+    assert _vista(conn) == antes
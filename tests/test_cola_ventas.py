@@ -0,0 +1,103 @@
+# Cola de ventas: lo que queda en el diario se escribe al arrancar, una vez, y una
+# venta que sigue fallando se aparta sin impedir el arranque ni tumbar a su grupo.
+import json
+import os
+
+import pytest
+
+import cola_ventas
+from cola_ventas import ColaVentas
+from conexion import abrir_conexion
+from inventario import StockInsuficiente, agregar_producto, inicializar_base
+
+@pytest.fixture
+def ruta(tmp_path):
+    ruta = str(tmp_path / "cola.db")
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    for i in range(3):
+        agregar_producto(conn, f"Producto {i}", 10, 1.0, "USD", "", 2)
+    conn.close()
+    return ruta
+
+def _venta(token, lineas):
+    return {"token": token, "lineas": lineas, "fecha": "2026-01-02 10:00:00", "cliente_nombre": "Ana",
+            "cliente_ci": "", "cliente_dir": "", "usuario_id": 1}
+
+def _escribir_diario(diario, ventas, cola_rota=False):
+    with open(diario, "w", encoding="utf-8") as f:
+        for venta in ventas:
+            f.write(json.dumps(venta) + "\n")
+        if cola_rota:
+            f.write('{"token": "a medio')
+
+def _recibos(ruta):
+    conn = abrir_conexion(ruta, solo_lectura=True)
+    try:
+        return conn.execute("SELECT token FROM recibos ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+def _cantidades(ruta):
+    conn = abrir_conexion(ruta, solo_lectura=True)
+    try:
+        return [r[0] for r in conn.execute("SELECT cantidad FROM productos ORDER BY id")]
+    finally:
+        conn.close()
+
+def test_recupera_el_diario_una_sola_vez(ruta, tmp_path):
+    diario = str(tmp_path / "caja.cola")
+    _escribir_diario(diario, [_venta("t1", [[1, 2, 1.0]]), _venta("t2", [[2, 20, 1.0]]),
+                              _venta("t3", [[3, 1, 1.0]])], cola_rota=True)
+    cola = ColaVentas(ruta, diario=diario)
+    cola.cerrar()
+    errores = {venta["token"]: error for venta, _, error in cola.recuperadas}
+    assert errores["t1"] is None and errores["t3"] is None
+    assert isinstance(errores["t2"], StockInsuficiente)
+    assert not os.path.exists(diario)
+    # El mismo diario otra vez (p. ej. se cortó antes de borrarlo): el token evita duplicar
+    _escribir_diario(diario, [_venta("t1", [[1, 2, 1.0]])])
+    cola = ColaVentas(ruta, diario=diario)
+    cola.cerrar()
+    assert cola.recuperadas == []
+    assert _recibos(ruta) == [("t1",), ("t3",)]
+    assert _cantidades(ruta) == [8, 10, 9]
+
+def test_venta_que_sigue_fallando_se_aparta(ruta, tmp_path):
+    diario = str(tmp_path / "caja.cola")
+    _escribir_diario(diario, [_venta("buena", [[1, 1, 1.0]]), _venta("mala", [["sin precio"]])])
+    for arranque in range(1, cola_ventas.INTENTOS_MAX + 1):
+        errores = []
+        cola = ColaVentas(ruta, diario=diario, al_terminar=lambda v, r, e: errores.append((v["token"], e)))
+        cola.vaciar()
+        cola.cerrar()
+        if arranque < cola_ventas.INTENTOS_MAX:
+            # Sigue en el diario con el intento anotado y se reintentó en la sesión
+            with open(diario, encoding="utf-8") as f:
+                pendientes = [json.loads(linea) for linea in f]
+            assert [(v["token"], v["intentos"]) for v in pendientes] == [("mala", arranque)]
+            assert [token for token, e in errores if e is not None] == ["mala"]
+        if arranque == 1:
+            assert [(v["token"], e) for v, _, e in cola.recuperadas] == [("buena", None)]
+    assert [(v["token"], type(e)) for v, _, e in cola.recuperadas] == [("mala", ValueError)]
+    assert not os.path.exists(diario)
+    with open(cola.ruta_rechazadas, encoding="utf-8") as f:
+        apartadas = [json.loads(linea) for linea in f]
+    assert [a["venta"]["token"] for a in apartadas] == ["mala"]
+    assert apartadas[0]["error"].startswith("ValueError")
+    assert _recibos(ruta) == [("buena",)]
+
+def test_una_venta_mala_no_tumba_al_grupo(ruta, tmp_path):
+    diario = str(tmp_path / "caja.cola")
+    resultados = []
+    cola = ColaVentas(ruta, diario=diario, al_terminar=lambda v, r, e: resultados.append((v["token"], r, e)))
+    # Las tres en un mismo grupo, como las tomaría el hilo escritor (que está esperando)
+    cola._pendientes = 3
+    cola._escribir_grupo([_venta("a", [[1, 1, 1.0]]), _venta("b", [[2, 1, "no es un precio"]]),
+                          _venta("c", [[3, 1, 1.0]])])
+    errores = {token: e for token, _, e in resultados}
+    assert errores["a"] is None and errores["c"] is None and errores["b"] is not None
+    assert cola.pendientes() == 1
+    cola.cerrar()
+    assert _recibos(ruta) == [("a",), ("c",)]
+    assert _cantidades(ruta) == [9, 10, 9]
@@ -0,0 +1,123 @@
+# Importación de catálogos: validación de precios, stock de los productos que ya existen
+# el índice de búsqueda tras una importación cortada y lo que se anota en el diario
+# de sincronización y en el libro de movimientos.
+import shutil
+
+import pytest
+
+import datos_csv
+from conexion import abrir_conexion
+from datos_csv import importar_productos, validar_producto
+from inventario import consultar_productos_pagina, inicializar_base, version_catalogo
+from movimientos_stock import fijar_motivo, limpiar_motivo
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = abrir_conexion(str(tmp_path / "csv.db"))
+    inicializar_base(conn)
+    return conn
+
+def _csv(tmp_path, filas):
+    archivo = tmp_path / "catalogo.csv"
+    archivo.write_text("codigo,nombre,cantidad,precio,moneda\n" + "".join(f"{','.join(f)}\n" for f in filas),
+                       encoding="utf-8")
+    return str(archivo)
+
+@pytest.mark.parametrize("precio", ["nan", "NaN", "inf", "-inf", "Infinity", "1e400", "1e300"])
+def test_rechaza_precios_no_finitos(precio):
+    with pytest.raises(ValueError):
+        validar_producto(["A1", "Arroz", "5", precio, "CUP", "", ""])
+
+def test_filas_con_nan_se_rechazan_y_el_resto_se_importa(conn, tmp_path):
+    importadas, rechazadas = importar_productos(conn, _csv(tmp_path, [("A1", "Arroz", "5", "nan", "CUP"),
+                                                                      ("A2", "Frijol", "5", "2.50", "CUP")]))
+    assert importadas == 1
+    assert [linea for linea, _ in rechazadas] == [2]
+    assert conn.execute("SELECT codigo, precio_centavos FROM productos WHERE codigo LIKE 'A%'").fetchall() == [("A2", 250)]
+
+def test_actualizar_conserva_el_stock_salvo_que_se_pida(conn, tmp_path):
+    importar_productos(conn, _csv(tmp_path, [("A1", "Arroz", "10", "1", "CUP")]))
+    conn.execute("UPDATE productos SET cantidad = 3 WHERE codigo = 'A1'")  # se vendieron 7
+    conn.commit()
+    archivo = _csv(tmp_path, [("A1", "Arroz blanco", "10", "1.25", "CUP"), ("A2", "Frijol", "4", "2", "CUP")])
+    importar_productos(conn, archivo)
+    assert conn.execute("SELECT nombre, cantidad, precio_centavos FROM productos WHERE codigo = 'A1'").fetchone() == \
+        ("Arroz blanco", 3, 125)
+    assert conn.execute("SELECT cantidad FROM productos WHERE codigo = 'A2'").fetchone() == (4,)
+    importar_productos(conn, archivo, actualizar_stock=True)
+    assert conn.execute("SELECT cantidad FROM productos WHERE codigo = 'A1'").fetchone() == (10,)
+
+def test_importacion_cortada_se_repara_al_arrancar(conn, tmp_path, monkeypatch):
+    # Varios lotes: se quitan los triggers del catálogo y el programa se corta a mitad
+    monkeypatch.setattr(datos_csv, "LOTE", 2)
+    guardar = datos_csv._guardar_lote
+    lotes = []
+
+    def cortar(conn, sql, lote):
+        if lotes:
+            raise KeyboardInterrupt
+        lotes.append(lote)
+        guardar(conn, sql, lote)
+    monkeypatch.setattr(datos_csv, "_guardar_lote", cortar)
+    monkeypatch.setattr(datos_csv, "reactivar_triggers_catalogo", lambda conn: None)
+    version = version_catalogo(conn)
+    archivo = _csv(tmp_path, [("A1", "Azúcar morena", "1", "1", "CUP"), ("A2", "Azúcar blanca", "1", "1", "CUP"),
+                              ("A3", "Sal", "1", "1", "CUP")])
+    with pytest.raises(KeyboardInterrupt):
+        importar_productos(conn, archivo)
+    ruta = conn.execute("PRAGMA database_list").fetchone()[2]
+    conn.close()
+
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    assert [p[1] for p in consultar_productos_pagina(conn, "Azúcar")] == ["Azúcar morena", "Azúcar blanca"]
+    assert version_catalogo(conn) > version
+    # Con los triggers de vuelta, lo que se edite después también llega al índice
+    conn.execute("UPDATE productos SET nombre = 'Azúcar parda' WHERE codigo = 'A1'")
+    assert [p[1] for p in consultar_productos_pagina(conn, "parda")] == ["Azúcar parda"]
+
+def _fila_a_fila(conn, archivo, actualizar_stock):
+    # La misma importación con los triggers anotando cada fila, como antes de
+    # anotar_carga_productos
+    sql = datos_csv.SQL_UPSERT_PRODUCTO_CON_STOCK if actualizar_stock else datos_csv.SQL_UPSERT_PRODUCTO
+    sql = sql.replace(f"SELECT {datos_csv.COLUMNAS_LOTE} FROM temp.importacion_lote WHERE true ORDER BY rowid",
+                      "VALUES (?, ?, ?, ?, ?, ?, ?)")
+    filas = datos_csv.leer_filas(archivo)
+    next(filas)
+    fijar_motivo(conn, "importacion")
+    for fila in filas:
+        conn.execute(sql, datos_csv.validar_producto(fila + ["", ""]))
+    limpiar_motivo(conn)
+    conn.commit()
+
+def _anotado(conn):
+    cambios = conn.execute("SELECT origen, origen_seq, tabla, clave, operacion, datos FROM cambios "
+                           "ORDER BY origen, origen_seq").fetchall()
+    movimientos = conn.execute("SELECT producto_id, cantidad, motivo FROM movimientos_stock ORDER BY id").fetchall()
+    return sorted(c[:1] + c[2:] for c in cambios), [c[1] for c in cambios], movimientos
+
+@pytest.mark.parametrize("actualizar_stock", [False, True])
+def test_diario_y_libro_como_fila_a_fila(conn, tmp_path, monkeypatch, actualizar_stock):
+    # Altas, ediciones, cambios de stock, filas sin cambios y un código repetido
+    monkeypatch.setattr(datos_csv, "LOTE", 3)
+    importar_productos(conn, _csv(tmp_path, [("A1", "Arroz", "10", "1", "CUP"), ("A2", "Frijol", "0", "2", "CUP"),
+                                             ("A3", "Sal", "4", "1", "USD")]))
+    ruta = conn.execute("PRAGMA database_list").fetchone()[2]
+    conn.close()
+    shutil.copy(ruta, tmp_path / "fila_a_fila.db")
+    # Dentro de un lote un código repetido se anota una vez, con el resultado final:
+    # aquí las dos filas de A4 caen en lotes distintos
+    archivo = _csv(tmp_path, [("A1", "Arroz", "7", "1", "CUP"), ("A2", "Frijol negro", "0", "2", "CUP"),
+                              ("A4", "Aceite", "6", "3", "USD"), ("A4", "Aceite de soya", "9", "3", "USD"),
+                              ("A3", "Sal", "4", "1", "USD"), ("A5", "Café", "0", "5", "USD")])
+
+    conn = abrir_conexion(ruta)
+    importar_productos(conn, archivo, actualizar_stock=actualizar_stock)
+    referencia = abrir_conexion(str(tmp_path / "fila_a_fila.db"))
+    _fila_a_fila(referencia, archivo, actualizar_stock)
+
+    cambios, numeros, movimientos = _anotado(conn)
+    assert (cambios, movimientos) == _anotado(referencia)[::2]
+    assert numeros == list(range(1, len(numeros) + 1))
+    assert conn.execute("SELECT * FROM productos ORDER BY id").fetchall() == \
+        referencia.execute("SELECT * FROM productos ORDER BY id").fetchall()
@@ -0,0 +1,135 @@
+# Subida del esquema de la versión 0 a la última, también desde la inventario.db antigua.
+import os
+import re
+import shutil
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import migraciones
+from conexion import abrir_conexion
+from inventario import inicializar_base, registrar_venta
+from movimientos_stock import conciliar
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Esquema de la primera versión del programa (el de inventario.db)
+ESQUEMA_ANTIGUO = """
+CREATE TABLE productos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    cantidad INTEGER,
+    precio REAL,
+    imagen TEXT
+);
+"""
+
+def _columnas(conn, tabla):
+    return {c[1] for c in conn.execute(f"PRAGMA table_info({tabla})")}
+
+def test_base_nueva_queda_en_la_ultima_version(tmp_path):
+    conn = abrir_conexion(str(tmp_path / "nueva.db"))
+    inicializar_base(conn)
+    assert migraciones.version_esquema(conn) == migraciones.VERSION_ACTUAL
+    assert {"moneda", "stock_minimo", "precio_centavos", "codigo"} <= _columnas(conn, "productos")
+    assert "precio" not in _columnas(conn, "productos")
+    # Volver a inicializar no aplica nada
+    assert migraciones.migrar(conn) == []
+
+def test_inventario_db_del_repositorio(tmp_path):
+    ruta = str(tmp_path / "inventario.db")
+    shutil.copy(os.path.join(RAIZ, "inventario.db"), ruta)
+    conn = abrir_conexion(ruta)
+    antes = conn.execute("SELECT id, nombre, cantidad, precio FROM productos ORDER BY id").fetchall()
+    inicializar_base(conn)
+    assert migraciones.version_esquema(conn) == migraciones.VERSION_ACTUAL
+    despues = conn.execute("SELECT id, nombre, cantidad, precio_centavos, moneda FROM productos ORDER BY id").fetchall()
+    assert [(i, n, c, round(p * 100), "CUP") for i, n, c, p in antes] == despues
+    assert os.path.exists(ruta + ".antes-v0")
+
+def test_base_antigua_con_ventas(tmp_path):
+    conn = abrir_conexion(str(tmp_path / "antigua.db"))
+    conn.executescript(ESQUEMA_ANTIGUO)
+    conn.execute("INSERT INTO productos (nombre, cantidad, precio) VALUES ('Arroz', 10, 1.5)")
+    conn.commit()
+    inicializar_base(conn)
+    assert conn.execute("SELECT moneda, stock_minimo, precio_centavos FROM productos").fetchone() == ("CUP", 0, 150)
+    registrar_venta(conn, [(1, 3, 1.5)], "Ana", "1", "", 1)
+    assert conn.execute("SELECT cantidad, total_centavos, moneda FROM ventas").fetchone() == (3, 450, "CUP")
+    assert conn.execute("SELECT cantidad FROM productos").fetchone()[0] == 7
+    assert conciliar(conn) == []
+
+def test_base_que_paso_la_1_sin_moneda(tmp_path):
+    # Bases migradas a la 5 antes de que la 1 añadiera las columnas que faltaban
+    conn = abrir_conexion(str(tmp_path / "a_medias.db"))
+    conn.executescript(ESQUEMA_ANTIGUO)
+    conn.execute("INSERT INTO productos (nombre, cantidad, precio) VALUES ('Arroz', 10, 1.5)")
+    migraciones._esquema_base(conn, None)
+    for columna in ("moneda", "stock_minimo"):
+        conn.execute(f"ALTER TABLE productos DROP COLUMN {columna}")
+    conn.execute("INSERT INTO ventas (producto_id, cantidad, total, fecha, usuario_id) "
+                 "VALUES (1, 2, 3.0, '01/02/2024 10:00', 1)")
+    conn.execute("INSERT INTO configuracion (tipo_cambio) VALUES (24.0)")
+    migraciones._fechas_iso(conn, None)
+    migraciones._dinero_en_centavos(conn, None)
+    # Lo que dejaba la 4 sin productos.moneda: la columna de ventas sin rellenar
+    conn.execute("ALTER TABLE ventas ADD COLUMN moneda TEXT")
+    conn.execute("CREATE TABLE tipos_cambio (desde TEXT PRIMARY KEY, tasa REAL NOT NULL CHECK(tasa > 0))")
+    conn.execute("INSERT INTO tipos_cambio VALUES ('0001-01-01 00:00:00', 24.0)")
+    migraciones._registro_archivos(conn, None)
+    conn.execute("PRAGMA user_version = 5")
+    conn.commit()
+    assert migraciones.version_esquema(conn) == 5
+
+    inicializar_base(conn)
+    assert migraciones.version_esquema(conn) == migraciones.VERSION_ACTUAL
+    assert conn.execute("SELECT moneda, fecha, total_centavos FROM ventas").fetchone() == \
+        ("CUP", "2024-02-01 10:00:00", 300)
+
+def test_migracion_que_falla_no_sube_la_version(tmp_path, monkeypatch):
+    conn = abrir_conexion(str(tmp_path / "falla.db"))
+    conn.executescript(ESQUEMA_ANTIGUO)
+
+    def rota(conn, progreso):
+        raise sqlite3.OperationalError("rota")
+    monkeypatch.setattr(migraciones, "MIGRACIONES", migraciones.MIGRACIONES[:2] + ((3, "rota", rota),))
+    try:
+        migraciones.migrar(conn)
+    except sqlite3.OperationalError:
+        pass
+    assert migraciones.version_esquema(conn) == 2
+
+def test_libro_de_una_base_v8_toma_la_fecha_de_la_venta(tmp_path):
+    # Una base en la versión 8 tiene los triggers del libro sin fecha: la migración 9
+    # los quita y inicializar_base los vuelve a crear con ella
+    conn = abrir_conexion(str(tmp_path / "v8.db"))
+    inicializar_base(conn)
+    conn.execute("DROP TRIGGER movimientos_productos_au")
+    conn.execute("""CREATE TRIGGER movimientos_productos_au AFTER UPDATE OF cantidad ON productos BEGIN
+        INSERT INTO movimientos_stock (producto_id, fecha, cantidad, motivo) VALUES (new.id, 'ahora', 0, 'ajuste');
+    END""")
+    conn.execute("PRAGMA user_version = 8")
+    conn.commit()
+    inicializar_base(conn)
+    assert migraciones.version_esquema(conn) == migraciones.VERSION_ACTUAL
+    conn.execute("INSERT INTO productos (nombre, cantidad, precio_centavos, moneda) VALUES ('Arroz', 10, 150, 'CUP')")
+    conn.commit()
+    registrar_venta(conn, [(1, 2, 1.5)], "Ana", "", "", 1)
+    fecha_venta = conn.execute("SELECT fecha FROM ventas").fetchone()[0]
+    assert conn.execute("SELECT fecha, cantidad FROM movimientos_stock WHERE motivo = 'venta'").fetchall() == \
+        [(fecha_venta, -2)]
+
+def test_diario_inicial_con_fechas_como_las_de_los_triggers(tmp_path):
+    # Gana el cambio más reciente comparando fechas como texto: todas con milésimas en UTC
+    conn = abrir_conexion(str(tmp_path / "antigua.db"))
+    conn.executescript(ESQUEMA_ANTIGUO)
+    conn.execute("INSERT INTO productos (nombre, cantidad, precio) VALUES ('Arroz', 10, 1.5)")
+    conn.commit()
+    inicializar_base(conn)
+    conn.execute("UPDATE productos SET nombre = 'Arroz blanco' WHERE id = 1")
+    conn.commit()
+    fechas = [f for f, in conn.execute("SELECT fecha FROM cambios WHERE tabla = 'productos' ORDER BY seq")]
+    assert len(fechas) == 2
+    assert all(re.fullmatch(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{3}", f) for f in fechas)
+    assert fechas[0] <= fechas[1]
+    ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+    assert abs(datetime.strptime(fechas[0], "%Y-%m-%d %H:%M:%S.%f") - ahora) < timedelta(minutes=1)
@@ -0,0 +1,86 @@
+# Libro de movimientos e instantáneas: stock en una fecha y instantáneas sin reiniciar.
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import movimientos_stock
+from cola_ventas import ColaVentas
+from conexion import abrir_conexion
+from inventario import agregar_producto, inicializar_base, registrar_venta
+from movimientos_stock import conciliar, instantanea_si_hace_falta, stock_en, tomar_instantanea
+
+@pytest.fixture
+def ruta(tmp_path):
+    ruta = str(tmp_path / "stock.db")
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    for i in range(3):
+        agregar_producto(conn, f"Producto {i}", 100, 1.0, "USD", "", 5)
+    conn.close()
+    return ruta
+
+def _instantaneas(conn):
+    return conn.execute("SELECT COUNT(*) FROM stock_instantaneas").fetchone()[0]
+
+def test_motivos_y_stock_en_fecha(ruta):
+    conn = abrir_conexion(ruta)
+    registrar_venta(conn, [(1, 4, 1.0), (2, 1, 1.0)], "Ana", "1", "", 1)
+    conn.execute("UPDATE productos SET cantidad = cantidad + 10 WHERE id = 3")
+    conn.commit()
+    movimientos = conn.execute("SELECT producto_id, cantidad, motivo FROM movimientos_stock ORDER BY id").fetchall()
+    assert movimientos[-3:] == [(1, -4, "venta"), (2, -1, "venta"), (3, 10, "reposicion")]
+    # Con la instantánea inicial el día anterior a los movimientos, cada fecha ve lo suyo
+    conn.execute("UPDATE movimientos_stock SET fecha = '2000-01-01 00:00:00'")
+    conn.execute("UPDATE stock_instantaneas SET fecha = '1999-12-31 00:00:00'")
+    conn.commit()
+    assert stock_en(conn, "1999-12-31") == {}
+    assert stock_en(conn, "2000-01-01") == {1: 96, 2: 99, 3: 110}
+    assert conciliar(conn) == []
+
+def test_instantanea_cuando_el_programa_sigue_abierto(ruta, monkeypatch):
+    # La caja no se reinicia: la cola guarda la instantánea al llegar al límite de movimientos
+    monkeypatch.setattr(movimientos_stock, "INSTANTANEA_CADA_MOVIMIENTOS", 20)
+    conn = abrir_conexion(ruta)
+    antes = _instantaneas(conn)
+    cola = ColaVentas(ruta, diario=ruta + ".cola")
+    for _ in range(30):
+        cola.encolar([(1, 1, 1.0)], "Ana", "1", "", 1)
+        cola.vaciar()
+    cola.cerrar()
+    assert _instantaneas(conn) > antes
+    assert conciliar(conn) == []
+    assert stock_en(conn, "9999-12-31", 1) == 70
+
+def test_instantanea_vieja_se_renueva(ruta):
+    conn = abrir_conexion(ruta)
+    tomar_instantanea(conn)
+    conn.execute("UPDATE stock_instantaneas SET fecha = '2000-01-01 00:00:00'")
+    conn.commit()
+    # Sin movimientos nuevos no hace falta otra
+    assert instantanea_si_hace_falta(conn) is False
+    registrar_venta(conn, [(1, 1, 1.0)], "Ana", "1", "", 1)
+    assert instantanea_si_hace_falta(conn) is True
+    assert instantanea_si_hace_falta(conn) is False
+
+def test_venta_recuperada_de_la_cola_va_en_su_dia(ruta):
+    # Una venta de hace tres días que la cola escribe al arrancar hoy
+    conn = abrir_conexion(ruta)
+    conn.execute("UPDATE movimientos_stock SET fecha = '2000-01-01 00:00:00'")  # las altas
+    conn.execute("UPDATE stock_instantaneas SET fecha = '1999-12-31 00:00:00'")
+    conn.commit()
+    tomar_instantanea(conn)  # la de hoy no incluye la venta
+    hace_tres = datetime.now() - timedelta(days=3)
+    venta = {"token": "t1", "lineas": [[1, 4, 1.0]], "fecha": hace_tres.strftime("%Y-%m-%d %H:%M:%S"),
+             "cliente_nombre": "Ana", "cliente_ci": "", "cliente_dir": "", "usuario_id": 1}
+    with open(ruta + ".cola", "w", encoding="utf-8") as f:
+        f.write(json.dumps(venta) + "\n")
+    ColaVentas(ruta, diario=ruta + ".cola").cerrar()
+    assert conn.execute("SELECT fecha, cantidad FROM movimientos_stock WHERE motivo = 'venta'").fetchall() == \
+        [(venta["fecha"], -4)]
+    dia = (lambda d: d.strftime("%Y-%m-%d"))
+    assert stock_en(conn, dia(hace_tres - timedelta(days=1)), 1) == 100
+    assert stock_en(conn, dia(hace_tres), 1) == 96
+    # Hoy la base es la instantánea de hoy, anterior a la venta por id aunque no por fecha
+    assert stock_en(conn, dia(datetime.now()), 1) == 96
+    assert conciliar(conn) == []
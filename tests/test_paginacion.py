@@ -0,0 +1,101 @@
+# Paginación por clave: recorrer las páginas hacia adelante y hacia atrás da las
+# mismas filas, en el mismo orden, que la consulta entera con ORDER BY, sin huecos
+# ni repetidas aunque muchas filas tengan el mismo valor en la columna de orden o
+# no tengan valor (NULL, que SQLite ordena antes que todo lo demás).
+import pytest
+
+from conexion import abrir_conexion
+from inventario import (
+    ORDEN_PRODUCTOS, ORDEN_VENTAS, agregar_producto, clave_producto, clave_venta, consultar_productos_pagina,
+    escribir_venta, inicializar_base, listar_ventas,
+)
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = abrir_conexion(str(tmp_path / "paginas.db"))
+    inicializar_base(conn)
+    agregar_producto(conn, "Arroz", 100000, 1.25, "USD", "", 5)
+    agregar_producto(conn, "Frijol", 100000, 30, "CUP", "", 5)
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    for i in range(90):
+        # Pocas fechas distintas: las páginas cortan en medio de grupos de fechas iguales
+        fecha = f"2024-0{1 + i % 3}-0{1 + i % 2} 10:00:00"
+        escribir_venta(cursor, [(1 + i % 2, 1 + i % 4, 1.25 if i % 2 == 0 else 30)], fecha, "Ana",
+                       None if i % 5 == 0 else str(i % 3), "", 1)
+    # Ventas sin cantidad ni total (llegadas así de otra tienda)
+    cursor.executemany("INSERT INTO ventas (producto_id, usuario_id, moneda, fecha) VALUES (1, 1, 'USD', ?)",
+                       [("2024-02-01 10:00:00",)] * 4)
+    # Productos con nombres, cantidades, precios y mínimos repetidos, y algunos sin cantidad
+    for i in range(60):
+        cursor.execute("""
+            INSERT INTO productos (nombre, cantidad, precio_centavos, moneda, stock_minimo, imagen)
+            VALUES (?, ?, ?, ?, ?, '')
+        """, (f"Jabón {i % 4}", None if i % 6 == 0 else i % 5, None if i % 11 == 0 else 100 * (i % 3),
+              ("USD", "CUP")[i % 2], None if i % 13 == 0 else i % 2))
+    conn.commit()
+    return conn
+
+def _recorrer(pagina, clave, limite):
+    # Páginas hacia adelante hasta el final y luego, desde la última fila, hacia atrás
+    paginas = [pagina(limite)]
+    while paginas[-1]:
+        paginas.append(pagina(limite, despues_de=clave(paginas[-1][-1])))
+    paginas.pop()
+    for anterior, siguiente in zip(paginas, paginas[1:]):
+        assert pagina(limite, antes_de=clave(siguiente[0])) == anterior
+    assert pagina(limite, antes_de=clave(paginas[0][0])) == []
+    assert all(len(p) == limite for p in paginas[:-1])
+    return [fila for p in paginas for fila in p]
+
+def _ids_ordenados(conn, tabla, expresion, descendente):
+    sentido = "DESC" if descendente else "ASC"
+    alias = tabla[0]
+    return [r[0] for r in conn.execute(
+        f"SELECT {alias}.id FROM {tabla} {alias} ORDER BY {expresion} {sentido}, {alias}.id {sentido}")]
+
+def _paginas_ventas(conn, orden, descendente, limite):
+    return _recorrer(lambda limite, **clave: listar_ventas(conn, orden=orden, descendente=descendente,
+                                                           limite=limite, **clave),
+                     lambda fila: clave_venta(fila, orden), limite)
+
+@pytest.mark.parametrize("limite", [1, 7, 30, 89, 90, 200])
+@pytest.mark.parametrize("descendente", [True, False])
+def test_historial_por_fecha(conn, descendente, limite):
+    filas = _paginas_ventas(conn, "fecha", descendente, limite)
+    assert [f[0] for f in filas] == _ids_ordenados(conn, "ventas", ORDEN_VENTAS["fecha"][0], descendente)
+
+def test_historial_por_fecha_con_filtro(conn):
+    filas = _recorrer(lambda limite, **clave: listar_ventas(conn, desde="2024-02-01", hasta="2024-02-29",
+                                                            limite=limite, **clave),
+                      clave_venta, 4)
+    assert [f[0] for f in filas] == [r[0] for r in conn.execute(
+        "SELECT id FROM ventas WHERE fecha LIKE '2024-02-%' ORDER BY fecha DESC, id DESC")]
+
+@pytest.mark.parametrize("limite", [1, 7, 25])
+@pytest.mark.parametrize("descendente", [True, False])
+@pytest.mark.parametrize("orden", list(ORDEN_VENTAS))
+def test_historial_por_cada_columna(conn, orden, descendente, limite):
+    filas = _paginas_ventas(conn, orden, descendente, limite)
+    assert [f[0] for f in filas] == _ids_ordenados(conn, "ventas", ORDEN_VENTAS[orden][0], descendente)
+
+@pytest.mark.parametrize("limite", [1, 7, 25])
+@pytest.mark.parametrize("descendente", [True, False])
+@pytest.mark.parametrize("orden", list(ORDEN_PRODUCTOS))
+def test_productos_por_cada_columna(conn, orden, descendente, limite):
+    filas = _recorrer(lambda limite, **clave: consultar_productos_pagina(conn, orden=orden, descendente=descendente,
+                                                                         limite=limite, **clave),
+                      lambda fila: clave_producto(fila, orden), limite)
+    assert [f[0] for f in filas] == _ids_ordenados(conn, "productos", ORDEN_PRODUCTOS[orden][0], descendente)
+
+@pytest.mark.parametrize("descendente", [True, False])
+def test_productos_filtrados_por_cantidad(conn, descendente):
+    filas = _recorrer(lambda limite, **clave: consultar_productos_pagina(conn, "Jab", orden="cantidad",
+                                                                         descendente=descendente, cantidad_max=2,
+                                                                         moneda="USD", limite=limite, **clave),
+                      lambda fila: clave_producto(fila, "cantidad"), 4)
+    sentido = "DESC" if descendente else "ASC"
+    assert [f[0] for f in filas] == [r[0] for r in conn.execute(f"""
+        SELECT id FROM productos WHERE nombre LIKE 'Jab%' AND cantidad <= 2 AND moneda = 'USD'
+        ORDER BY cantidad {sentido}, id {sentido}
+    """)]
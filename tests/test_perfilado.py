@@ -0,0 +1,31 @@
+# El contador de sentencias agrupa por plantilla y no crece sin límite.
+import sqlite3
+
+import pytest
+
+import perfilado
+
+@pytest.fixture
+def conn():
+    perfilado.reiniciar()
+    conn = sqlite3.connect(":memory:", factory=perfilado.ConexionPerfilada)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, nombre TEXT)")
+    yield conn
+    conn.close()
+    perfilado.reiniciar()
+
+def test_misma_consulta_con_otros_parametros_cuenta_una_vez(conn):
+    for i in range(300):
+        conn.execute("INSERT INTO t (id, nombre) VALUES (?, ?)", (i, f"n'{i}"))
+        conn.execute("SELECT nombre FROM t WHERE id IN (?, ?, ?)", (i, i + 1, i + 2)).fetchall()
+    cuentas = dict(perfilado.sentencias())
+    assert cuentas["INSERT INTO t (id, nombre) VALUES (?, ...)"] == 300
+    assert cuentas["SELECT nombre FROM t WHERE id IN (?, ...)"] == 300
+
+def test_tope_de_sentencias_distintas(conn, monkeypatch):
+    monkeypatch.setattr(perfilado, "MAX_SENTENCIAS", 10)
+    for i in range(50):
+        conn.execute(f"SELECT id AS c{i} FROM t").fetchall()
+    cuentas = dict(perfilado.sentencias())
+    assert len(cuentas) <= 11
+    assert cuentas[perfilado.OTRAS_SENTENCIAS] > 0
@@ -0,0 +1,63 @@
+# Respaldo en caliente mientras otra conexión vende, y vuelta a una base que se puede usar.
+import threading
+
+import pytest
+
+import respaldo
+from conexion import abrir_conexion
+from inventario import agregar_producto, inicializar_base, registrar_venta
+from movimientos_stock import conciliar
+
+@pytest.fixture
+def ruta(tmp_path):
+    ruta = str(tmp_path / "tienda.db")
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    for i in range(200):
+        agregar_producto(conn, f"Producto {i} " + "x" * 200, 1000, 1.5, "USD", "", 5)
+    conn.close()
+    return ruta
+
+def test_respaldo_mientras_se_vende_y_restaurar(ruta, tmp_path, monkeypatch):
+    # Pasos pequeños para que las ventas caigan a mitad de la copia
+    monkeypatch.setattr(respaldo, "PAGINAS_POR_PASO", 4)
+    carpeta = str(tmp_path / "respaldos")
+    parar = threading.Event()
+
+    def vender():
+        conn = abrir_conexion(ruta)
+        while not parar.is_set():
+            registrar_venta(conn, [(1, 1, 1.5)], "Ana", "1", "", 1)
+        conn.close()
+    hilo = threading.Thread(target=vender)
+    hilo.start()
+    try:
+        archivo, _ = respaldo.respaldar(ruta, carpeta)
+    finally:
+        parar.set()
+        hilo.join()
+
+    restaurada = str(tmp_path / "restaurada.db")
+    respaldo.restaurar(archivo, restaurada)
+    with pytest.raises(respaldo.ErrorRespaldo):
+        respaldo.restaurar(archivo, restaurada)
+    conn = abrir_conexion(restaurada)
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0] == 200
+    # Una instantánea coherente: cada venta copiada con su stock, sin huecos
+    ventas = [v for v, in conn.execute("SELECT id FROM ventas ORDER BY id")]
+    assert ventas == list(range(1, len(ventas) + 1))
+    assert conn.execute("SELECT cantidad FROM productos WHERE id = 1").fetchone()[0] == 1000 - len(ventas)
+    assert conciliar(conn) == []
+    # La base restaurada se abre y se usa como cualquier otra
+    inicializar_base(conn)
+    registrar_venta(conn, [(2, 3, 1.5)], "Luis", "2", "", 1)
+    assert conn.execute("SELECT cantidad FROM productos WHERE id = 2").fetchone()[0] == 997
+
+def test_respaldos_en_el_mismo_segundo_no_se_pisan(ruta, tmp_path):
+    carpeta = str(tmp_path / "respaldos")
+    archivos = {respaldo.respaldar(ruta, carpeta)[0] for _ in range(3)}
+    assert len(archivos) == 3
+    assert len(respaldo.generaciones(carpeta, "tienda")) == 3
+    respaldo.respaldar(ruta, carpeta, guardar=2)
+    assert len(respaldo.generaciones(carpeta, "tienda")) == 2
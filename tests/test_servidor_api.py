@@ -0,0 +1,87 @@
+# Validación de parámetros y cuerpos del servicio HTTP/JSON.
+import base64
+import http.client
+import json
+import socket
+
+import pytest
+
+from conexion import abrir_conexion
+from inventario import agregar_producto, inicializar_base
+from servidor_api import LIMITE_MAXIMO, crear_servidor, iniciar_en_hilo
+
+AUTORIZACION = "Basic " + base64.b64encode(b"admin:admin123").decode()
+
+@pytest.fixture
+def servidor(tmp_path):
+    ruta = str(tmp_path / "api.db")
+    conn = abrir_conexion(ruta)
+    inicializar_base(conn)
+    for i in range(LIMITE_MAXIMO + 10):
+        agregar_producto(conn, f"Producto {i}", 10, 1.5, "USD", "", 5 + i % 20)
+    conn.close()
+    srv = crear_servidor(ruta, puerto=0)
+    hilo = iniciar_en_hilo(srv)
+    yield srv.server_address[1]
+    srv.shutdown()
+    hilo.join()
+
+def _pedir(puerto, metodo, ruta, cuerpo=None):
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=10)
+    conexion.request(metodo, ruta, body=cuerpo, headers={"Authorization": AUTORIZACION,
+                                                        "Content-Type": "application/json"})
+    respuesta = conexion.getresponse()
+    datos = json.loads(respuesta.read() or b"null")
+    conexion.close()
+    return respuesta.status, datos
+
+@pytest.mark.parametrize("ruta", ["/productos", "/ventas", "/productos/stock_bajo"])
+@pytest.mark.parametrize("limite", ["-1", "0"])
+def test_limite_menor_que_uno(servidor, ruta, limite):
+    assert _pedir(servidor, "GET", f"{ruta}?limite={limite}")[0] == 400
+
+def test_limite_se_recorta_al_maximo(servidor):
+    estado, datos = _pedir(servidor, "GET", f"/productos?limite={LIMITE_MAXIMO * 10}")
+    assert estado == 200 and len(datos["productos"]) == LIMITE_MAXIMO
+
+@pytest.mark.parametrize("cuerpo", ["[1, 2]", "3", '"texto"', '{"lineas": 5}', '{"lineas": [7]}',
+                                    '{"lineas": [{"producto_id": 1, "cantidad": 1}], "cliente_ci": {"a": 1}}'])
+def test_cuerpo_de_venta_invalido(servidor, cuerpo):
+    assert _pedir(servidor, "POST", "/ventas", cuerpo)[0] == 400
+
+def test_venta_valida(servidor):
+    cuerpo = json.dumps({"lineas": [{"producto_id": 1, "cantidad": 2}], "cliente_nombre": "Ana"})
+    estado, datos = _pedir(servidor, "POST", "/ventas", cuerpo)
+    assert estado == 200 and datos["recibo_id"] >= 1
+    assert _pedir(servidor, "GET", "/productos/1")[1]["cantidad"] == 8
+
+@pytest.mark.parametrize("metodo, ruta, autorizacion", [("POST", "/ventas", False), ("POST", "/no_existe", True),
+                                                         ("GET", "/productos", False)])
+def test_error_con_cuerpo_no_rompe_la_conexion(servidor, metodo, ruta, autorizacion):
+    # El cuerpo de una petición rechazada no puede quedar en la conexión keep-alive
+    conexion = http.client.HTTPConnection("127.0.0.1", servidor, timeout=10)
+    cabeceras = {"Content-Type": "application/json"}
+    if autorizacion:
+        cabeceras["Authorization"] = AUTORIZACION
+    conexion.request(metodo, ruta, body='{"lineas": []}', headers=cabeceras)
+    respuesta = conexion.getresponse()
+    respuesta.read()
+    assert respuesta.status in (401, 404)
+    conexion.request("GET", "/tipo_cambio", headers={"Authorization": AUTORIZACION})
+    respuesta = conexion.getresponse()
+    assert respuesta.status == 200 and "tasa" in json.loads(respuesta.read())
+    conexion.close()
+
+@pytest.mark.parametrize("largo", ["abc", "-5"])
+def test_content_length_invalido(servidor, largo):
+    with socket.create_connection(("127.0.0.1", servidor), timeout=10) as s:
+        s.sendall(f"POST /ventas HTTP/1.1\r\nHost: x\r\nAuthorization: {AUTORIZACION}\r\n"
+                  f"Content-Length: {largo}\r\n\r\n{{}}".encode())
+        respuesta = b""
+        while True:
+            trozo = s.recv(4096)
+            if not trozo:
+                break
+            respuesta += trozo
+    # Responde 400 y cierra la conexión: no se sabe dónde termina el cuerpo
+    assert respuesta.startswith(b"HTTP/1.1 400")
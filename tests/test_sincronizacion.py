@@ -0,0 +1,101 @@
+# Dos tiendas que venden y editan por su cuenta quedan iguales tras sincronizar.
+import os
+import shutil
+
+from conexion import abrir_conexion
+from inventario import (
+    actualizar_producto, agregar_producto, firma_datos, inicializar_base, registrar_venta, set_tipo_cambio,
+)
+from movimientos_stock import conciliar
+from sincronizacion import conflictos, sincronizar
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _tienda(ruta):
+    conn = abrir_conexion(str(ruta))
+    inicializar_base(conn)
+    return conn
+
+def _catalogo(conn):
+    return sorted(conn.execute("SELECT codigo, nombre, cantidad, precio_centavos, moneda, stock_minimo FROM productos"))
+
+def _ventas(conn):
+    return sorted(conn.execute("""
+        SELECT p.codigo, v.cantidad, v.total_centavos, v.moneda, v.fecha, v.cliente_ci
+        FROM ventas v JOIN productos p ON p.id = v.producto_id
+    """))
+
+def _id(conn, codigo):
+    return conn.execute("SELECT id FROM productos WHERE codigo = ?", (codigo,)).fetchone()[0]
+
+def _sembrar(conn, prefijo, productos=5):
+    for i in range(productos):
+        agregar_producto(conn, f"{prefijo} {i}", 50, 2.5 + i, "USD", "", 5)
+        conn.execute("UPDATE productos SET codigo = ? WHERE id = (SELECT MAX(id) FROM productos)", (f"{prefijo}{i}",))
+    conn.commit()
+
+def test_dos_tiendas_convergen(tmp_path):
+    a, b = _tienda(tmp_path / "a.db"), _tienda(tmp_path / "b.db")
+    _sembrar(a, "A")
+    _sembrar(b, "B")
+    sincronizar(a, b)
+    assert _catalogo(a) == _catalogo(b) and len(_catalogo(a)) == 10
+
+    # Cada tienda vende de los dos catálogos, repone y edita; la tasa cambia en una
+    for conn, cliente in ((a, "1"), (b, "2")):
+        for codigo in ("A0", "A1", "B0", "B3"):
+            registrar_venta(conn, [(_id(conn, codigo), 4, 2.5)], "Cliente", cliente, "", 1)
+    a.execute("UPDATE productos SET cantidad = cantidad + 20 WHERE codigo = 'B1'")
+    a.commit()
+    p = a.execute("SELECT id, nombre FROM productos WHERE codigo = 'A2'").fetchone()
+    actualizar_producto(a, p[0], "Nombre nuevo", 50, 9.99, "CUP", "", 3)
+    set_tipo_cambio(b, 410.0)
+
+    sincronizar(a, b)
+    assert _catalogo(a) == _catalogo(b)
+    assert _ventas(a) == _ventas(b) and len(_ventas(a)) == 8
+    assert list(a.execute("SELECT * FROM tipos_cambio ORDER BY desde")) == \
+        list(b.execute("SELECT * FROM tipos_cambio ORDER BY desde"))
+    cantidades = dict((codigo, cantidad) for codigo, _, cantidad, *_ in _catalogo(a))
+    assert cantidades["A0"] == 50 - 8 and cantidades["B1"] == 70
+    assert ("A2", "Nombre nuevo") in [(c, n) for c, n, *_ in _catalogo(b)]
+
+    # Ya están al día: no se aplica nada y los libros de stock cuadran
+    assert sincronizar(a, b) == ((0, 0), (0, 0))
+    assert conciliar(a) == [] and conciliar(b) == []
+
+def test_stock_negativo_queda_como_conflicto(tmp_path):
+    a, b = _tienda(tmp_path / "a.db"), _tienda(tmp_path / "b.db")
+    _sembrar(a, "A", productos=1)
+    sincronizar(a, b)
+    # Las dos venden casi todo el stock sin verse
+    registrar_venta(a, [(_id(a, "A0"), 40, 2.5)], "x", "1", "", 1)
+    registrar_venta(b, [(_id(b, "A0"), 30, 2.5)], "y", "2", "", 1)
+    sincronizar(a, b)
+    assert _catalogo(a) == _catalogo(b)
+    assert _catalogo(a)[0][2] == 50 - 70
+    assert conflictos(a) or conflictos(b)
+
+def test_bases_del_repositorio(tmp_path):
+    # inventario.db (esquema antiguo) con inventario_cuba.db
+    rutas = []
+    for nombre in ("inventario.db", "inventario_cuba.db"):
+        shutil.copy(os.path.join(RAIZ, nombre), tmp_path / nombre)
+        rutas.append(tmp_path / nombre)
+    a, b = _tienda(rutas[0]), _tienda(rutas[1])
+    sincronizar(a, b)
+    assert _catalogo(a) == _catalogo(b)
+    assert sincronizar(a, b) == ((0, 0), (0, 0))
+
+def test_la_firma_ve_los_cambios_solo_de_stock(tmp_path):
+    # La lista de productos y el panel de stock bajo se recargan por firma_datos
+    a, b = _tienda(tmp_path / "a.db"), _tienda(tmp_path / "b.db")
+    _sembrar(a, "A", productos=1)
+    sincronizar(a, b)
+    firma = firma_datos(b)
+    a.execute("UPDATE productos SET cantidad = cantidad + 7 WHERE codigo = 'A0'")  # reposición
+    a.commit()
+    sincronizar(a, b)  # llega a b como movimiento de stock (S), sin venta ni cambio de catálogo
+    nueva = firma_datos(b)
+    assert (nueva["catalogo"], nueva["ventas"]) == (firma["catalogo"], firma["ventas"])
+    assert nueva["stock"] != firma["stock"]
@@ -0,0 +1,30 @@
+# La lista de stock bajo se lee por el índice parcial, ordene por la columna que ordene.
+import pytest
+
+from conexion import abrir_conexion
+from inventario import ORDEN_STOCK_BAJO, inicializar_base, productos_stock_bajo
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = abrir_conexion(str(tmp_path / "stock.db"))
+    inicializar_base(conn)
+    conn.executemany("INSERT INTO productos (nombre, cantidad, precio_centavos, moneda, stock_minimo) "
+                     "VALUES (?, ?, 100, 'USD', 5)", [(f"P{i:04d}", i % 50) for i in range(2000)])
+    conn.commit()
+    conn.execute("ANALYZE")
+    return conn
+
+@pytest.mark.parametrize("orden", list(ORDEN_STOCK_BAJO))
+def test_usa_el_indice_parcial(conn, orden):
+    consultas = []
+    conn.set_trace_callback(consultas.append)
+    productos_stock_bajo(conn, orden, limite=8)
+    conn.set_trace_callback(None)
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + consultas[-1]))
+    assert "idx_productos_stock_bajo" in plan
+
+@pytest.mark.parametrize("orden", list(ORDEN_STOCK_BAJO))
+def test_solo_los_que_estan_bajo_el_minimo(conn, orden):
+    filas = productos_stock_bajo(conn, orden, descendente=True)
+    assert len(filas) == 2000 // 50 * 6
+    assert all(cantidad <= minimo for _, _, cantidad, minimo in filas)
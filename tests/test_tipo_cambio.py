@@ -0,0 +1,76 @@
+# Tipo de cambio: los totales convertidos siguen el historial de tasas (días enteros
+# desde el resumen, días con cambio venta a venta) y la tasa en memoria solo se
+# vuelve a leer cuando alguien escribió en la base.
+import pytest
+
+import inventario
+from conexion import abrir_conexion
+from inventario import (
+    agregar_producto, escribir_venta, firma_datos, get_tipo_cambio, inicializar_base, set_tipo_cambio,
+    total_en_moneda,
+)
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = abrir_conexion(str(tmp_path / "tasas.db"))
+    inicializar_base(conn)
+    agregar_producto(conn, "Arroz", 1000, 1.25, "USD", "", 5)
+    agregar_producto(conn, "Frijol", 1000, 30, "CUP", "", 5)
+    set_tipo_cambio(conn, 100, "2024-01-01 00:00:00")
+    set_tipo_cambio(conn, 200, "2024-01-20 12:00:00")
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    for dia in ("2024-01-10", "2024-01-20", "2024-01-25"):
+        for hora in ("09:00:00", "15:00:00"):
+            escribir_venta(cursor, [(1, 2, 1.25), (2, 1, 30)], f"{dia} {hora}", "Ana", "", "", 1)
+    conn.commit()
+    return conn
+
+def _total_venta_a_venta(conn, desde_dia, hasta_dia, moneda):
+    tasas = conn.execute("SELECT desde, tasa FROM tipos_cambio ORDER BY desde").fetchall()
+    total = 0
+    for fecha, moneda_venta, centavos in conn.execute("""
+            SELECT fecha, moneda, total_centavos FROM ventas WHERE fecha BETWEEN ? AND ?
+            """, (desde_dia + " 00:00:00", hasta_dia + " 23:59:59")):
+        tasa = [t for desde, t in tasas if desde <= fecha][-1:] or [tasas[0][1]]
+        if moneda_venta != moneda:
+            centavos = centavos * tasa[0] if moneda_venta == "USD" else centavos / tasa[0]
+        total += centavos
+    return round(total) / 100
+
+def _comprobar_totales(conn):
+    for desde, hasta in (("2024-01-01", "2024-01-31"), ("2024-01-10", "2024-01-10"), ("2024-01-20", "2024-01-20"),
+                         ("2024-01-11", "2024-01-25"), ("2023-12-01", "2024-01-09")):
+        for moneda in ("USD", "CUP"):
+            assert total_en_moneda(conn, desde, hasta, moneda) == \
+                pytest.approx(_total_venta_a_venta(conn, desde, hasta, moneda)), (desde, hasta, moneda)
+
+def test_total_en_moneda_sigue_el_historial(conn):
+    # 2024-01-20 (cambio a las 12:00) se suma venta a venta; los otros días, del resumen
+    assert total_en_moneda(conn, "2024-01-20", "2024-01-20", "CUP") == 2 * 30 + 2.5 * 100 + 2.5 * 200
+    _comprobar_totales(conn)
+    # Corregir el historial con una tasa nueva en un día que ya tenía ventas: ese día
+    # pasa a sumarse venta a venta, y una tasa anterior a todas cambia los días previos
+    set_tipo_cambio(conn, 150, "2024-01-10 12:00:00")
+    assert total_en_moneda(conn, "2024-01-10", "2024-01-10", "CUP") == 2 * 30 + 2.5 * 100 + 2.5 * 150
+    _comprobar_totales(conn)
+    set_tipo_cambio(conn, 50, "2023-12-15 00:00:00")
+    _comprobar_totales(conn)
+
+def test_la_tasa_solo_se_relee_si_alguien_escribio(conn, tmp_path, monkeypatch):
+    lecturas = []
+    leer = inventario.leer_tipo_cambio
+    monkeypatch.setattr(inventario, "leer_tipo_cambio", lambda c: lecturas.append(1) or leer(c))
+    assert firma_datos(conn)["tipo_cambio"] == 200
+    for _ in range(5):
+        assert firma_datos(conn)["tipo_cambio"] == get_tipo_cambio(conn) == 200
+    assert len(lecturas) == 1
+
+    otra = abrir_conexion(str(tmp_path / "tasas.db"))
+    set_tipo_cambio(otra, 250)
+    assert firma_datos(conn)["tipo_cambio"] == 250
+    # Una escritura de esta misma conexión no cambia data_version, pero también cuenta
+    conn.execute("INSERT INTO tipos_cambio (desde, tasa) VALUES ('2099-01-01 00:00:00', 300)")
+    conn.commit()
+    assert get_tipo_cambio(conn) == 300
+    assert len(lecturas) == 3